@@ -1,10 +1,14 @@
 from telegram import Update
 from telegram.ext import ContextTypes
+import functools
 import logging
-from app.shared import bot_state_manager, get_user_context
+from app.shared import user_context_cache
 from app.trading_logic import start_trading
+from app.supervisor import session_supervisor, SessionAlreadyRunning, STOPPING
+from app.single_flight import single_flight_metrics
+from app.metrics import metrics_summary
+from config.config import ADMIN_ID, DEFAULT_SYMBOL, DEFAULT_QUOTE, MAX_SYMBOLS_PER_USER
 from config.logging_config import logger
-import asyncio
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -13,33 +17,111 @@ logging.basicConfig(
 
 
 
+# Команды администратора: остальным пользователям отвечаем отказом
+def admin_only(handler):
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if update.effective_user.id != ADMIN_ID:
+            await update.message.reply_text('Команда доступна только администратору.')
+            return
+        await handler(update, context)
+
+    return wrapper
+
+# Торговая пара из аргумента команды: KAS/USDT, kas/usdt, KASUSDT или KAS
+def parse_symbol(arg: str) -> str:
+    symbol = arg.upper().replace('-', '/').replace('_', '/')
+    if '/' in symbol:
+        return symbol
+    if symbol.endswith(DEFAULT_QUOTE) and len(symbol) > len(DEFAULT_QUOTE):
+        return f"{symbol[:-len(DEFAULT_QUOTE)]}/{DEFAULT_QUOTE}"
+    return f"{symbol}/{DEFAULT_QUOTE}"
+
 # Команда /autobuy
 async def autobuy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     logger.info(f"Команда /autobuy вызвана пользователем {user_id}")
     
-    # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    symbol = parse_symbol(context.args[0]) if context.args else DEFAULT_SYMBOL
+    session = session_supervisor.get(user_id, symbol)
+    if session is not None and session.state == STOPPING:
+        # Предыдущая сессия останавливается: дожидаемся ее завершения, чтобы не было двух циклов
+        await session_supervisor.wait_stopped([session], timeout=10)
     
-    if bot_state_manager.is_trading_active(user_id):
-        await update.message.reply_text('Автоматическая торговля уже запущена. Чтобы остановить, используйте команду /stop.')
+    active_symbols = [active.symbol for active in session_supervisor.user_sessions(user_id) if active.symbol != symbol]
+    if len(active_symbols) >= MAX_SYMBOLS_PER_USER:
+        await update.message.reply_text(
+            f'Достигнут лимит одновременных пар: {MAX_SYMBOLS_PER_USER}.\n'
+            f'Активные пары: {", ".join(sorted(active_symbols))}'
+        )
         return
     
-    symbol = "KAS/USDT"
-    bot_state_manager.start(user_id)  # Отмечаем, что торговля запущена для пользователя
+    # Запускаем сессию под управлением супервизора: не больше одной сессии на пару
+    try:
+        session_supervisor.start(user_id, symbol, lambda session: start_trading(symbol, update, session))
+    except SessionAlreadyRunning:
+        await update.message.reply_text(f'Автоматическая торговля {symbol} уже запущена. Чтобы остановить, используйте команду /stop {symbol}.')
+        return
+    except RuntimeError as e:
+        await update.message.reply_text(str(e))
+        return
     
-    # Запускаем асинхронную торговлю с передачей update
-    asyncio.create_task(start_trading(symbol, update))
-    await update.message.reply_text(f'Автоматическая торговля запущена для {symbol}. Чтобы остановить, используйте команду /stop.')
+    await update.message.reply_text(f'Автоматическая торговля запущена для {symbol}. Чтобы остановить, используйте команду /stop {symbol}.')
 
 # Команда /stop
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     logger.info(f"Команда /stop вызвана пользователем {user_id}")
     
-    if not bot_state_manager.is_trading_active(user_id):
-        await update.message.reply_text('Автоматическая торговля не запущена.')
+    # Без аргумента останавливаются все пары пользователя
+    symbol = parse_symbol(context.args[0]) if context.args else None
+    
+    # Сессия получает сигнал остановки сразу, а не при следующей проверке флага
+    stopped = [session for session in session_supervisor.stop(user_id, symbol) if session.state == STOPPING]
+    if not stopped:
+        await update.message.reply_text(f'Автоматическая торговля {symbol} не запущена.' if symbol else 'Автоматическая торговля не запущена.')
         return
     
-    bot_state_manager.stop(user_id)
-    await update.message.reply_text('Автоматическая торговля остановлена.')
+    await update.message.reply_text(f'Автоматическая торговля остановлена: {", ".join(sorted(session.symbol for session in stopped))}.')
+
+# Команда /sessions (только для администратора)
+@admin_only
+async def sessions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    logger.info(f"Команда /sessions вызвана пользователем {update.effective_user.id}")
+    
+    described = session_supervisor.describe()
+    lines = [f'Сессий: {len(described)}']
+    for info in sorted(described, key=lambda item: item['uptime'], reverse=True)[:50]:
+        latency = f"{info['last_tick_latency'] * 1000:.0f} мс" if info['last_tick_latency'] is not None else '—'
+        lines.append(
+            f"{info['user_id']} {info['symbol']}: {info['state']}, "
+            f"работает {int(info['uptime'] // 60)} мин, задержка котировки {latency}"
+        )
+    
+    # Эффективность объединения чтений: сколько обращений обошлось без запроса к бирже
+    metrics = single_flight_metrics()
+    if metrics:
+        lines.append('\nЧтения с биржи (обращений / запросов, из кэша, общих):')
+        for method, stats in sorted(metrics.items()):
+            lines.append(f"{method}: {stats['requests']} / {stats['calls']}, {stats['hits']}, {stats['shared']}")
+    await update.message.reply_text('\n'.join(lines))
+
+# Команда /metrics (только для администратора)
+@admin_only
+async def metrics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    logger.info(f"Команда /metrics вызвана пользователем {update.effective_user.id}")
+    
+    cache_stats = user_context_cache.stats()
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    reads = single_flight_metrics()
+    requests = sum(stats['requests'] for stats in reads.values())
+    saved = sum(stats['hits'] + stats['shared'] for stats in reads.values())
+    lines = [
+        f"Сессий: {len(session_supervisor)}",
+        f"Кэш контекстов: {cache_stats['size']}, попаданий {cache_stats['hits'] / lookups * 100 if lookups else 0:.1f}%",
+        f"Чтения с биржи без запроса: {saved / requests * 100 if requests else 0:.1f}% из {requests}",
+        '',
+        metrics_summary(),
+    ]
+    # Ограничение Telegram на длину сообщения
+    await update.message.reply_text('\n'.join(lines)[:4000])
@@ -0,0 +1,246 @@
+# app/backtesting.py
+
+import csv
+import time
+import numpy as np
+from app.grid_engine import GridEngine
+
+# Столбцы OHLCV в формате ccxt: время (мс), open, high, low, close, volume
+OHLCV_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+
+class Candles:
+    """Свечи OHLCV в виде отдельных массивов NumPy."""
+
+    def __init__(self, timestamp, open, high, low, close, volume=None):
+        self.timestamp = np.asarray(timestamp, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.zeros(len(self.timestamp)) if volume is None else np.asarray(volume, dtype=np.float64)
+
+    @classmethod
+    def from_ohlcv(cls, rows) -> 'Candles':
+        """Создает свечи из списка строк ccxt fetch_ohlcv или массива формы (n, 6)."""
+        data = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+        return cls(data[:, 0], data[:, 1], data[:, 2], data[:, 3], data[:, 4], data[:, 5])
+
+    def __len__(self):
+        return len(self.timestamp)
+
+
+def load_ohlcv_csv(path: str) -> Candles:
+    """Читает CSV со столбцами timestamp,open,high,low,close,volume (заголовок необязателен)."""
+    with open(path, newline='') as f:
+        first = f.readline()
+    skip_header = 1 if first and not first.split(',')[0].strip().lstrip('-').isdigit() else 0
+    data = np.loadtxt(path, delimiter=',', skiprows=skip_header, usecols=range(6), ndmin=2)
+    candles = Candles.from_ohlcv(data)
+    order = np.argsort(candles.timestamp, kind='stable')
+    if np.any(order != np.arange(len(order))):
+        candles = Candles(candles.timestamp[order], candles.open[order], candles.high[order], candles.low[order],
+                          candles.close[order], candles.volume[order])
+    return candles
+
+
+def save_ohlcv_csv(path: str, rows):
+    """Сохраняет строки ccxt fetch_ohlcv в CSV."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(OHLCV_COLUMNS)
+        writer.writerows(rows)
+
+
+class BacktestParams:
+    def __init__(self, profit_percentage=0.3, fall_percentage=1.0, delay_seconds=30, order_size=40,
+                 capital=1000.0, continuous_mode=False, fee_rate=0.0):
+        self.profit_percentage = profit_percentage
+        self.fall_percentage = fall_percentage
+        self.delay_seconds = delay_seconds
+        self.order_size = order_size
+        self.capital = capital                # Начальный баланс USDT
+        self.continuous_mode = continuous_mode
+        self.fee_rate = fee_rate              # Комиссия биржи с оборота (0.001 = 0.1%)
+
+
+class BacktestResult:
+    def __init__(self, params: BacktestParams):
+        self.params = params
+        self.bars = 0
+        self.buys = 0
+        self.sells = 0
+        self.cycles = 0
+        self.realized_profit = 0.0
+        self.fees = 0.0
+        self.open_levels = 0
+        self.final_equity = params.capital
+        self.max_drawdown = 0.0          # Максимальная просадка капитала в USDT
+        self.max_drawdown_percent = 0.0
+        self.max_capital_used = 0.0      # Максимальная сумма, вложенная в открытые уровни
+        self.elapsed = 0.0
+
+    @property
+    def total_profit(self) -> float:
+        """Изменение капитала с учетом нереализованного результата открытых уровней."""
+        return self.final_equity - self.params.capital
+
+    def summary(self) -> str:
+        p = self.params
+        return (
+            f"Параметры: прибыль {p.profit_percentage}%, падение {p.fall_percentage}%, "
+            f"задержка {p.delay_seconds} с, ордер {p.order_size} USDT, капитал {p.capital} USDT\n"
+            f"Свечей: {self.bars}, время расчета: {self.elapsed:.2f} с\n"
+            f"Покупок: {self.buys}, продаж: {self.sells}, завершенных циклов: {self.cycles}\n"
+            f"Реализованная прибыль: {self.realized_profit:.4f} USDT (комиссии {self.fees:.4f})\n"
+            f"Открытых уровней в конце: {self.open_levels}, итоговый капитал: {self.final_equity:.4f} USDT "
+            f"({self.total_profit:+.4f})\n"
+            f"Максимальная просадка: {self.max_drawdown:.4f} USDT ({self.max_drawdown_percent:.2f}%)\n"
+            f"Максимум вложенного капитала: {self.max_capital_used:.4f} USDT"
+        )
+
+
+def _first_event(candles: Candles, start: int, sell_price, buy_price, buy_from: int) -> int:
+    """
+    Индекс первой свечи не раньше start, на которой исполняется take-profit
+    (high >= sell_price) или срабатывает покупка (low <= buy_price, не раньше buy_from).
+    Поиск идет векторно окнами растущего размера; -1, если события нет.
+    """
+    n = len(candles)
+    window = 256
+    position = start
+    while position < n:
+        end = min(n, position + window)
+        mask = np.zeros(end - position, dtype=bool)
+        if sell_price is not None:
+            mask |= candles.high[position:end] >= sell_price
+        if buy_price is not None and buy_from < end:
+            offset = max(buy_from - position, 0)
+            mask[offset:] |= candles.low[position + offset:end] <= buy_price
+        hits = np.flatnonzero(mask)
+        if hits.size:
+            return position + int(hits[0])
+        position = end
+        window = min(window * 2, 1 << 16)
+    return -1
+
+
+def run_backtest(candles: Candles, params: BacktestParams) -> BacktestResult:
+    """
+    Прогоняет стратегию автоторговли по свечам теми же решениями GridEngine,
+    что и start_trading: покупка первого уровня сразу, take-profit каждого уровня
+    на profit_percentage выше покупки, докупка при падении на fall_percentage ниже
+    самого низкого уровня не чаще чем раз в delay_seconds.
+
+    Между событиями свечи не перебираются: следующая свеча с исполнением или
+    покупкой находится векторным поиском NumPy. Внутри свечи сначала исполняются
+    take-profit (по цене ордера), затем покупка - по цене срабатывания или по open,
+    если цена открылась ниже. Уровень, купленный на свече, может закрыться только
+    на следующих свечах.
+    """
+    started = time.perf_counter()
+    result = BacktestResult(params)
+    n = len(candles)
+    result.bars = n
+    if n == 0:
+        return result
+
+    times = candles.timestamp / 1000.0
+    engine = GridEngine(params.profit_percentage, params.fall_percentage, params.delay_seconds)
+    cash = params.capital
+    coins = 0.0
+    invested = 0.0
+    # Изменения денег и монет по индексам свечей для построения кривой капитала
+    event_index = []
+    event_cash = []
+    event_coins = []
+
+    def buy(index: int, price: float) -> bool:
+        nonlocal cash, coins, invested
+        cost = params.order_size
+        fee = cost * params.fee_rate
+        if cash < cost + fee:
+            engine.defer(times[index])
+            return False
+        amount = cost / price
+        engine.open_level(price, amount, times[index])
+        cash -= cost + fee
+        coins += amount
+        invested += cost
+        result.buys += 1
+        result.fees += fee
+        result.max_capital_used = max(result.max_capital_used, invested)
+        return True
+
+    buy(0, candles.open[0])
+    event_index.append(0)
+    event_cash.append(cash)
+    event_coins.append(coins)
+
+    i = 0
+    cycle_completed = False
+    while i < n:
+        sell_price = engine.lowest_sell_price
+        buy_price = None
+        buy_from = n
+        if not cycle_completed and cash >= params.order_size * (1 + params.fee_rate):
+            trigger = engine.next_buy_price()
+            if trigger is None:
+                buy_price = np.inf  # Новый цикл: покупка по первой же свече
+                buy_from = i
+            else:
+                buy_price = trigger
+                ready_at = 0.0 if engine.last_buy_time is None else engine.last_buy_time + engine.delay_seconds
+                buy_from = max(i, int(np.searchsorted(times, ready_at, side='left')))
+        if sell_price is None and buy_price is None:
+            break
+
+        j = _first_event(candles, i, sell_price, buy_price, buy_from)
+        if j < 0:
+            break
+
+        # Исполнение take-profit по цене ордера
+        for level in list(engine.levels_to_take_profit(candles.high[j])):
+            proceeds = level.sell_price * level.amount
+            fee = proceeds * params.fee_rate
+            engine.close_level(level)
+            cash += proceeds - fee
+            coins -= level.amount
+            invested -= level.cost
+            result.sells += 1
+            result.fees += fee
+            result.realized_profit += level.profit() - fee - level.cost * params.fee_rate
+
+        sold_out = sell_price is not None and not len(engine)
+        if sold_out:
+            result.cycles += 1
+            if not params.continuous_mode:
+                cycle_completed = True
+
+        # Покупка: новый цикл - по open следующей свечи, иначе при падении до цены срабатывания
+        if not cycle_completed and not sold_out and j >= buy_from:
+            trigger = engine.next_buy_price()
+            if trigger is None:
+                buy(j, candles.open[j])
+            elif candles.low[j] <= trigger and engine.should_buy(candles.low[j], times[j]):
+                buy(j, min(candles.open[j], trigger))
+
+        event_index.append(j)
+        event_cash.append(cash)
+        event_coins.append(coins)
+        i = j + 1
+
+    result.open_levels = len(engine)
+
+    # Кривая капитала: деньги и монеты между событиями постоянны
+    index = np.asarray(event_index)
+    positions = np.searchsorted(index, np.arange(n), side='right') - 1
+    equity = np.asarray(event_cash)[positions] + np.asarray(event_coins)[positions] * candles.close
+    peaks = np.maximum.accumulate(equity)
+    drawdowns = peaks - equity
+    worst = int(np.argmax(drawdowns))
+    result.max_drawdown = float(drawdowns[worst])
+    result.max_drawdown_percent = float(drawdowns[worst] / peaks[worst] * 100) if peaks[worst] else 0.0
+    result.final_equity = float(equity[-1])
+    result.elapsed = time.perf_counter() - started
+    return result
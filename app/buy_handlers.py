@@ -19,14 +19,14 @@ async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"Команда /balance вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     try:
         # Получаем экземпляр MEXC для пользователя
         mexc_instance = user_context.get_mexc_instance()
         
         # Получаем баланс
-        balances = mexc_instance.fetch_balance()
+        balances = await mexc_instance.fetch_balance()
         logger.info(f"Полный ответ fetch_balance() для пользователя {user_id}: {balances}")
         
         reply = "Ваш баланс:\n"
@@ -55,7 +55,7 @@ async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"Команда /buy вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     if len(context.args) != 2:
         await update.message.reply_text('Использование: /buy <symbol> <cost>')
@@ -69,7 +69,7 @@ async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         mexc_instance = user_context.get_mexc_instance()
         
         # Выполняем покупку, используя cost (сумму в долларах)
-        order = mexc_instance.create_market_buy_order(symbol, cost)
+        order = await mexc_instance.create_market_buy_order(symbol, cost)
         
         logger.info(f"Выполнена покупка для пользователя {user_id}: {order}")
         await update.message.reply_text(
@@ -0,0 +1,125 @@
+# app/client_pool.py
+
+import hashlib
+import threading
+import time
+import ccxt
+from requests import Session
+from requests.adapters import HTTPAdapter
+from app.exchange import ExchangeAdapter
+from app.market_cache import market_cache
+from app.rate_budget import RateBudget
+from config.config import EXCHANGE_MAX_WORKERS, EXCHANGE_CLIENT_IDLE_TTL
+from config.logging_config import logger
+
+
+def credential_hash(api_key: str, api_secret: str) -> str:
+    """Возвращает отпечаток пары ключей, не храня сами ключи в ключе пула."""
+    return hashlib.sha256(f"{api_key}:{api_secret}".encode()).hexdigest()
+
+
+class PooledClient:
+    def __init__(self, adapter: ExchangeAdapter, credential_hash: str):
+        self.adapter = adapter
+        self.credential_hash = credential_hash
+
+
+class ExchangeClientPool:
+    """
+    Пул долгоживущих клиентов биржи, по одному на пользователя.
+
+    Клиент переиспользуется, пока не изменятся API-ключи пользователя, и
+    сохраняет между командами загруженные рынки и состояние ограничителя запросов.
+    Все клиенты делят одну HTTP-сессию с keep-alive соединениями.
+    Клиенты, не использовавшиеся дольше idle_ttl секунд, удаляются из пула.
+    """
+
+    def __init__(self, idle_ttl: float = EXCHANGE_CLIENT_IDLE_TTL, client_factory=None):
+        self.idle_ttl = idle_ttl
+        self.client_factory = client_factory or self._create_mexc_client
+        self._clients = {}  # user_id -> PooledClient
+        self._public = None  # Клиент без ключей для публичных данных
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.session = Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=EXCHANGE_MAX_WORKERS))
+
+    def _create_mexc_client(self, api_key: str = None, api_secret: str = None):
+        return ccxt.mexc({
+            'apiKey': api_key or '',
+            'secret': api_secret or '',
+            # Лимиты соблюдает общий планировщик (rate_budget ключа и ip_rate_budget):
+            # встроенный ограничитель ccxt не знает о других клиентах и только добавляет задержки
+            'enableRateLimit': False,
+            'session': self.session,  # Общая HTTP-сессия пула
+            'options': {
+                'createMarketBuyOrderRequiresPrice': False  # Разрешаем использование cost вместо amount
+            }
+        })
+
+    def get(self, user_id: int, api_key: str, api_secret: str) -> ExchangeAdapter:
+        """Возвращает клиента пользователя, создавая его при первом обращении или смене ключей."""
+        key_hash = credential_hash(api_key, api_secret)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep >= self.idle_ttl:
+                self._evict_idle(now)
+
+            pooled = self._clients.get(user_id)
+            if pooled and pooled.credential_hash == key_hash:
+                pooled.adapter.last_used = now
+                market_cache.apply_to(pooled.adapter.client)
+                return pooled.adapter
+
+            if pooled:
+                logger.info(f"API-ключи пользователя {user_id} изменились, пересоздаем клиента биржи.")
+                self._release(pooled)
+
+            # Один бюджет запросов на API-ключ: все сессии пользователя делят его
+            adapter = ExchangeAdapter(self.client_factory(api_key, api_secret), rate_budget=RateBudget())
+            market_cache.apply_to(adapter.client)
+            self._clients[user_id] = PooledClient(adapter, key_hash)
+            logger.info(f"Создан клиент биржи для пользователя {user_id}. Клиентов в пуле: {len(self._clients)}")
+            return adapter
+
+    def public(self) -> ExchangeAdapter:
+        """Возвращает общий клиент без ключей для рынков и котировок."""
+        with self._lock:
+            if self._public is None:
+                self._public = ExchangeAdapter(self.client_factory(None, None))
+            return self._public
+
+    def invalidate(self, user_id: int):
+        """Удаляет клиента пользователя из пула (например, после /set_api_keys)."""
+        with self._lock:
+            pooled = self._clients.pop(user_id, None)
+            if pooled:
+                self._release(pooled)
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def _evict_idle(self, now: float) -> int:
+        expired = [user_id for user_id, pooled in self._clients.items() if now - pooled.adapter.last_used >= self.idle_ttl]
+        for user_id in expired:
+            self._release(self._clients.pop(user_id))
+        self._last_sweep = now
+        if expired:
+            logger.info(f"Из пула удалено неактивных клиентов биржи: {len(expired)}")
+        return len(expired)
+
+    def _release(self, pooled: PooledClient):
+        # ccxt закрывает свою сессию в __del__, а сессия у клиентов общая.
+        # Отдаем вытесненному клиенту собственную сессию: если на него еще
+        # ссылается работающая корутина, он продолжит работать.
+        client = pooled.adapter.client
+        if getattr(client, 'session', None) is self.session:
+            client.session = Session()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+# Глобальный пул клиентов биржи
+exchange_client_pool = ExchangeClientPool()
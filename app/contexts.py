@@ -1,18 +1,35 @@
 # contexts.py
 
-import ccxt
-from datetime import datetime, timedelta
-from app.database import User, TradeHistory, db_session, encryption_manager  # Импортируем необходимые компоненты из database.py
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, func, case
+from app.database import User, DailyPnl, db_session, encryption_manager  # Импортируем необходимые компоненты из database.py
+from app.exchange import ExchangeAdapter  # Асинхронная обертка над ccxt
+from app.client_pool import exchange_client_pool  # Пул клиентов биржи
+from app.trade_journal import trade_journal  # Фоновая запись сделок
+from app.user_state import user_state_writer  # Отложенная запись параметров
 from config.logging_config import logger  # Добавляем импорт logger
 
 
 class BotParams:
-    def __init__(self, profit_percentage=0.3, fall_percentage=1.0, delay_seconds=30, order_size=40):
+    # Поля, которые сохраняются в таблицу users; их изменения отслеживаются
+    PERSISTED_FIELDS = ('profit_percentage', 'fall_percentage', 'delay_seconds', 'order_size', 'continuous_mode', 'buy_price')
+
+    def __init__(self, profit_percentage=0.3, fall_percentage=1.0, delay_seconds=30, order_size=40, continuous_mode=False, buy_price=None):
+        object.__setattr__(self, 'dirty', set())
         self.profit_percentage = profit_percentage
         self.fall_percentage = fall_percentage
         self.delay_seconds = delay_seconds
         self.order_size = order_size
-        self.buy_price = None
+        self.continuous_mode = continuous_mode
+        self.buy_price = buy_price
+        self.dirty.clear()  # Значения из конструктора уже совпадают с базой
+
+    # Изменение только отмечается: запись ставит в очередь save_user_params владельца,
+    # поэтому поля можно менять из любого потока, в том числе без цикла событий
+    def __setattr__(self, name, value):
+        if name in self.PERSISTED_FIELDS and getattr(self, name, None) != value:
+            self.dirty.add(name)
+        object.__setattr__(self, name, value)
 
     def set_params(self, profit_percentage, fall_percentage, delay_seconds, order_size):
         self.profit_percentage = profit_percentage
@@ -22,114 +39,151 @@ class BotParams:
 
 
 class UserContext:
-    def __init__(self, user_id: int):
+    def __init__(self, user_id: int, user: User = None):
         self.user_id = user_id
-        self.bot_params = self.load_user_params()
-        self.api_key = None
-        self.api_secret = None
+        self.bot_params = BotParams()
+        # API-ключи хранятся зашифрованными и расшифровываются один раз при первом обращении
+        self._api_key_encrypted = None
+        self._api_secret_encrypted = None
+        self._api_key = None
+        self._api_secret = None
+        self._credentials_decrypted = True
+        self._credentials_changed = False
         self.buy_executed = {}
-        self.current_level = 0
+        self.open_levels = {}  # Открытые уровни сетки по парам
+        self._current_level = 0
+        self._current_level_changed = False
+        if user is not None:
+            self.apply_user_row(user)
+        else:
+            self.load_user_params()
+
+    # Заполнение контекста из уже прочитанной строки users (без обращения к базе)
+    def apply_user_row(self, user: User):
+        self._api_key_encrypted = user.api_key_encrypted
+        self._api_secret_encrypted = user.api_secret_encrypted
+        self._api_key = None
+        self._api_secret = None
+        self._credentials_decrypted = False
+        self._credentials_changed = False
+        self._current_level = user.current_level or 0
+        self._current_level_changed = False
+        self.bot_params = BotParams(
+            profit_percentage=user.profit_percentage,
+            fall_percentage=user.fall_percentage,
+            delay_seconds=user.delay_seconds,
+            order_size=user.order_size,
+            continuous_mode=bool(user.continuous_mode),
+            buy_price=user.buy_price
+        )
 
     # Загрузка параметров пользователя из базы данных
     def load_user_params(self):
         with db_session() as session:
-            user = session.query(User).filter_by(id=self.user_id).first()
+            user = session.get(User, self.user_id)
             if user:
-                # Загрузка API-ключей
-                if user.api_key_encrypted and user.api_secret_encrypted:
-                    try:
-                        self.api_key = encryption_manager.decrypt(user.api_key_encrypted)
-                        self.api_secret = encryption_manager.decrypt(user.api_secret_encrypted)
-                        logger.info(f"API-ключи успешно загружены для пользователя {self.user_id}.")
-                    except Exception as e:
-                        logger.error(f"Ошибка при дешифровании API-ключей для пользователя {self.user_id}: {e}")
-                        self.api_key = None
-                        self.api_secret = None
-                else:
-                    logger.warning(f"Зашифрованные API-ключи отсутствуют для пользователя {self.user_id}.")
-
-                # Загрузка параметров бота
-                self.bot_params = BotParams(
-                    profit_percentage=user.profit_percentage,
-                    fall_percentage=user.fall_percentage,
-                    delay_seconds=user.delay_seconds,
-                    order_size=user.order_size
-                )
+                self.apply_user_row(user)
         
         logger.info(f"Параметры успешно загружены для пользователя {self.user_id}.")
         return self.bot_params
 
-    # Сохранение параметров пользователя в базу данных
+    # Расшифровка API-ключей при первом обращении; результат хранится, пока контекст в кэше
+    def _decrypt_credentials(self):
+        if self._credentials_decrypted:
+            return
+        self._credentials_decrypted = True
+        if not (self._api_key_encrypted and self._api_secret_encrypted):
+            logger.warning(f"Зашифрованные API-ключи отсутствуют для пользователя {self.user_id}.")
+            return
+        try:
+            self._api_key = encryption_manager.decrypt(self._api_key_encrypted)
+            self._api_secret = encryption_manager.decrypt(self._api_secret_encrypted)
+            logger.info(f"API-ключи успешно загружены для пользователя {self.user_id}.")
+        except Exception as e:
+            logger.error(f"Ошибка при дешифровании API-ключей для пользователя {self.user_id}: {e}")
+            self._api_key = None
+            self._api_secret = None
+
+    @property
+    def api_key(self):
+        self._decrypt_credentials()
+        return self._api_key
+
+    @property
+    def api_secret(self):
+        self._decrypt_credentials()
+        return self._api_secret
+
+    # Текущий уровень сетки; сохраняется вместе с параметрами
+    @property
+    def current_level(self) -> int:
+        return self._current_level
+
+    @current_level.setter
+    def current_level(self, value: int):
+        if value != self._current_level:
+            self._current_level = value
+            self._current_level_changed = True
+            self.save_user_params()
+
+    # Сохранение параметров пользователя: изменения записываются в фоне и объединяются
     def save_user_params(self):
-        with db_session() as session:
-            user = session.query(User).filter_by(id=self.user_id).first()
-            if not user:
-                user = User(id=self.user_id)
-                session.add(user)
-            if self.api_key and self.api_secret:
-                user.api_key_encrypted = encryption_manager.encrypt(self.api_key)
-                user.api_secret_encrypted = encryption_manager.encrypt(self.api_secret)
-            user.profit_percentage = self.bot_params.profit_percentage
-            user.fall_percentage = self.bot_params.fall_percentage
-            user.delay_seconds = self.bot_params.delay_seconds
-            user.order_size = self.bot_params.order_size
-            session.commit()
-        logger.info(f"Параметры успешно сохранены для пользователя {self.user_id}.")
+        user_state_writer.schedule(self)
+
+    # Измененные с прошлой записи столбцы users; флаги изменений сбрасываются
+    def take_changes(self) -> dict:
+        columns = {name: getattr(self.bot_params, name) for name in self.bot_params.dirty}
+        self.bot_params.dirty.clear()
+        if self._current_level_changed:
+            columns['current_level'] = self._current_level
+            self._current_level_changed = False
+        if self._credentials_changed and self._api_key and self._api_secret:
+            columns['credentials'] = (self._api_key, self._api_secret)
+            self._credentials_changed = False
+        return columns
+
+    # Возврат изменений, которые не удалось записать (более новые значения не затираются)
+    def restore_changes(self, columns: dict):
+        for name in columns:
+            if name in BotParams.PERSISTED_FIELDS:
+                self.bot_params.dirty.add(name)
+            elif name == 'current_level':
+                self._current_level_changed = True
+            elif name == 'credentials':
+                self._credentials_changed = True
 
     # Установка API-ключей
     def set_api_credentials(self, api_key: str, api_secret: str):
-        self.api_key = api_key
-        self.api_secret = api_secret
+        self._api_key = api_key
+        self._api_secret = api_secret
+        self._credentials_decrypted = True
+        self._credentials_changed = True
 
-    # Получение экземпляра биржи MEXC
-    def get_mexc_instance(self):
+    # Получение клиента биржи MEXC из пула (вызовы выполняются вне цикла событий)
+    def get_mexc_instance(self) -> ExchangeAdapter:
         if not self.api_key or not self.api_secret:
             raise ValueError("API-ключи не установлены.")
-        return ccxt.mexc({
-            'apiKey': self.api_key,
-            'secret': self.api_secret,
-            'enableRateLimit': True,
-            'options': {
-                'createMarketBuyOrderRequiresPrice': False  # Разрешаем использование cost вместо amount
-            }
-        })
-
-    # Логирование сделки в базу данных
+        return exchange_client_pool.get(self.user_id, self.api_key, self.api_secret)
+
+    # Логирование сделки в базу данных (запись выполняется в фоне пакетами)
     def log_trade(self, trade_type: str, symbol: str, amount: float, price: float, profit: float):
+        trade_journal.record(self.user_id, trade_type, symbol, amount, price, profit)
+
+    # Сумма прибыли из дневной сводки начиная с указанного дня (UTC)
+    def _sum_profit(self, since_day: date = None) -> float:
+        query = select(func.coalesce(func.sum(DailyPnl.profit), 0.0)).where(DailyPnl.user_id == self.user_id)
+        if since_day is not None:
+            query = query.where(DailyPnl.day >= since_day)
         with db_session() as session:
-            trade = TradeHistory(
-                user_id=self.user_id,
-                trade_type=trade_type,
-                symbol=symbol,
-                amount=amount,
-                price=price,
-                profit=profit,
-                timestamp=datetime.utcnow()
-            )
-            session.add(trade)
-            session.commit()
+            return session.execute(query).scalar()
 
     # Расчет профита за день
     def calculate_profit_today(self):
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        with db_session() as session:
-            trades = session.query(TradeHistory).filter(
-                TradeHistory.user_id == self.user_id,
-                TradeHistory.trade_type == "sell",
-                TradeHistory.timestamp >= today_start
-            ).all()
-        return sum(trade.profit for trade in trades)
-
-    # Расчет профита за период
+        return self._sum_profit(utc_today())
+
+    # Расчет профита за период (последние days календарных дней, включая сегодня)
     def calculate_profit_period(self, days: int):
-        period_start = datetime.now() - timedelta(days=days)
-        with db_session() as session:
-            trades = session.query(TradeHistory).filter(
-                TradeHistory.user_id == self.user_id,
-                TradeHistory.trade_type == "sell",
-                TradeHistory.timestamp >= period_start
-            ).all()
-        return sum(trade.profit for trade in trades)
+        return self._sum_profit(utc_today() - timedelta(days=days - 1))
 
     # Расчет профита за месяц
     def calculate_profit_month(self):
@@ -137,9 +191,39 @@ class UserContext:
 
     # Расчет профита за всё время
     def calculate_profit_total(self):
+        return self._sum_profit()
+
+    # Профит за сегодня, за 30 дней и за всё время одним запросом
+    def calculate_profit_summary(self) -> dict:
+        today = utc_today()
+        month_start = today - timedelta(days=29)
+        query = select(
+            func.coalesce(func.sum(case((DailyPnl.day >= today, DailyPnl.profit), else_=0.0)), 0.0),
+            func.coalesce(func.sum(case((DailyPnl.day >= month_start, DailyPnl.profit), else_=0.0)), 0.0),
+            func.coalesce(func.sum(DailyPnl.profit), 0.0),
+        ).where(DailyPnl.user_id == self.user_id)
+        with db_session() as session:
+            today_profit, month_profit, total_profit = session.execute(query).one()
+        return {'today': today_profit, 'month': month_profit, 'total': total_profit}
+
+    # Профит по дням (UTC) за последние days дней, от новых к старым
+    def calculate_daily_profit(self, days: int) -> list:
+        query = select(DailyPnl.day, func.sum(DailyPnl.profit)).where(
+            DailyPnl.user_id == self.user_id,
+            DailyPnl.day >= utc_today() - timedelta(days=days - 1)
+        ).group_by(DailyPnl.day).order_by(DailyPnl.day.desc())
+        with db_session() as session:
+            return [(row[0], row[1]) for row in session.execute(query)]
+
+    # Профит по торговым парам за всё время
+    def calculate_profit_by_symbol(self) -> dict:
+        query = select(DailyPnl.symbol, func.sum(DailyPnl.profit)).where(
+            DailyPnl.user_id == self.user_id
+        ).group_by(DailyPnl.symbol)
         with db_session() as session:
-            trades = session.query(TradeHistory).filter(
-                TradeHistory.user_id == self.user_id,
-                TradeHistory.trade_type == "sell"
-            ).all()
-        return sum(trade.profit for trade in trades)
\ No newline at end of file
+            return {row[0]: row[1] for row in session.execute(query)}
+
+
+# Текущий день по UTC (время сделок хранится в UTC)
+def utc_today() -> date:
+    return datetime.utcnow().date()
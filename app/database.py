@@ -1,9 +1,13 @@
 # app/database.py
 
+import asyncio
 import os
 import sys
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Float, Text, DateTime, Date, Boolean
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
 from cryptography.fernet import Fernet
 from datetime import datetime
 
@@ -12,7 +16,8 @@ PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, PROJECT_ROOT)
 
 # Импортируем конфигурацию
-from config.config import DATABASE_URL  # Импортируем URL базы данных
+from config.config import DATABASE_URL, DB_MAX_WORKERS, DB_POOL_SIZE, DB_BUSY_TIMEOUT  # Импортируем настройки базы данных
+from app.metrics import db_latency, db_wait  # Время запросов к базе и ожидания потока
 
 # Создание базового класса для моделей (используем declarative_base из sqlalchemy.orm)
 Base = declarative_base()
@@ -27,6 +32,9 @@ class User(Base):
     fall_percentage = Column(Float, default=1.0)    # Процент падения
     delay_seconds = Column(Integer, default=30)     # Задержка между ордерами
     order_size = Column(Float, default=40)          # Размер ордера
+    continuous_mode = Column(Boolean, default=False)  # Непрерывные циклы автоторговли
+    buy_price = Column(Float)                       # Цена последней покупки автоторговли
+    current_level = Column(Integer, default=0)      # Текущий уровень сетки
 
 # Модель истории торговли
 class TradeHistory(Base):
@@ -40,16 +48,103 @@ class TradeHistory(Base):
     profit = Column(Float)  # Прибыль от сделки
     timestamp = Column(DateTime, default=datetime.utcnow)  # Время выполнения сделки
 
+# Дневная сводка прибыли: обновляется при каждой записи продажи в журнал
+class DailyPnl(Base):
+    __tablename__ = 'daily_pnl'
+    user_id = Column(Integer, primary_key=True)  # Telegram ID пользователя
+    symbol = Column(String, primary_key=True)    # Торговая пара
+    day = Column(Date, primary_key=True)         # День по UTC
+    profit = Column(Float, default=0.0)          # Прибыль за день
+    sells = Column(Integer, default=0)           # Число закрытых уровней
+    volume = Column(Float, default=0.0)          # Объем продаж в USDT
+
+# Состояние активных сессий автоторговли для восстановления после перезапуска
+class TradingSession(Base):
+    __tablename__ = 'trading_sessions'
+    user_id = Column(Integer, primary_key=True)  # Telegram ID пользователя
+    symbol = Column(String, primary_key=True)    # Торговая пара
+    chat_id = Column(Integer)                    # Чат для уведомлений сессии
+    state = Column(Text)                         # Состояние сетки и цикла в JSON
+    updated_at = Column(DateTime, default=datetime.utcnow)  # Время последней контрольной точки
+
+# Индексы, удаленные из моделей: отчеты о прибыли читают daily_pnl, и эти индексы
+# только замедляли бы запись журнала сделок
+OBSOLETE_INDEXES = ('ix_trade_history_user_type_time',)
+
+# Добавление новых столбцов в уже существующие таблицы (create_all их не создает)
+def migrate_db(engine):
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if column.default is not None and column.default.is_scalar:
+                    default = column.default.arg
+                    ddl += f" DEFAULT {int(default) if isinstance(default, bool) else repr(default)}"
+                connection.execute(text(ddl))
+            # Индексы, добавленные в модели после создания таблицы
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+        for name in OBSOLETE_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+# Настройка каждого нового соединения SQLite: WAL позволяет читать параллельно с записью
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT * 1000}")
+    cursor.close()
+
+# Создание движка: соединения переиспользуются потоками db_executor
+def create_db_engine(url: str = DATABASE_URL):
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_size=DB_POOL_SIZE, pool_pre_ping=True)
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT},
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=0,
+    )
+    event.listen(engine, "connect", configure_sqlite_connection)
+    return engine
+
 # Функция для создания подключения к базе данных
 def init_db():
-    engine = create_engine(DATABASE_URL)
+    engine = create_db_engine()
     Base.metadata.create_all(engine)
+    migrate_db(engine)
     return sessionmaker(bind=engine)
 
 # Глобальный sessionmaker
 Session = init_db()  # Создаем sessionmaker
 db_session = Session  # Оставляем как sessionmaker
 
+# Потоки для запросов к базе: корутины не ждут дисковый ввод-вывод SQLite
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+# Выполнение синхронной функции работы с базой в потоке db_executor (с замером ожидания и выполнения)
+async def run_db(func, *args):
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+
+    def timed():
+        started = time.perf_counter()
+        db_wait.observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            db_latency.observe(time.perf_counter() - started, getattr(func, '__name__', type(func).__name__))
+
+    return await loop.run_in_executor(db_executor, timed)
+
 # Шифрование/дешифрование данных
 class EncryptionManager:
     def __init__(self, key: bytes):
@@ -0,0 +1,100 @@
+# app/exchange.py
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.metrics import exchange_latency, exchange_errors
+from app.single_flight import SingleFlight
+from app.rate_budget import ip_rate_budget, PRIORITY_ORDER, PRIORITY_TRACK, PRIORITY_READ
+from config.config import EXCHANGE_MAX_WORKERS
+from config.logging_config import logger
+
+# Общий ограниченный пул потоков для блокирующих вызовов ccxt.
+# Все сессии и обработчики команд делят его, поэтому число одновременных
+# REST-запросов ограничено, а цикл событий никогда не ждет сеть.
+exchange_executor = ThreadPoolExecutor(max_workers=EXCHANGE_MAX_WORKERS, thread_name_prefix="exchange")
+
+
+class ExchangeAdapter:
+    """
+    Асинхронная обертка над синхронным клиентом ccxt.
+
+    Каждый вызов выполняется в пуле потоков exchange_executor, а корутина
+    ожидает результат через run_in_executor. Исключения ccxt пробрасываются без изменений.
+
+    Перед запросом вызов получает разрешение у планировщика лимитов: приватные
+    запросы - у rate_budget API-ключа (ключ бюджета - торговая пара), все запросы -
+    у общего ip_rate_budget. Ордера идут с высшим приоритетом, чтения - с низшим.
+    Чтения проходят через single_flight: одинаковые одновременные чтения выполняются
+    одним запросом, а свежий результат отдается из кэша на время TTL метода.
+    """
+
+    def __init__(self, client, executor: ThreadPoolExecutor = None, rate_budget=None, ip_budget=None):
+        self.client = client
+        self.executor = executor or exchange_executor
+        self.rate_budget = rate_budget
+        self.ip_budget = ip_budget or ip_rate_budget
+        self.last_used = time.monotonic()
+        self.single_flight = SingleFlight()
+
+    async def call(self, method: str, *args, budget_key: str = '*', priority: int = PRIORITY_READ, private: bool = True,
+                   **kwargs):
+        """Выполняет метод клиента ccxt в пуле потоков."""
+        if private and self.rate_budget is not None:
+            await self.rate_budget.acquire(budget_key, priority)
+        await self.ip_budget.acquire(budget_key, priority)
+        loop = asyncio.get_running_loop()
+        self.last_used = time.monotonic()
+        func = functools.partial(getattr(self.client, method), *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.executor, func)
+        except Exception as e:
+            exchange_errors.inc(method)
+            logger.debug(f"Вызов {method} завершился ошибкой: {e}")
+            raise
+        finally:
+            exchange_latency.observe(time.perf_counter() - started, method)
+
+    async def read(self, method: str, *args, budget_key: str = '*', priority: int = PRIORITY_READ, private: bool = True):
+        """Чтение через single_flight: объединение одинаковых запросов и кэш с TTL."""
+        return await self.single_flight.do(method, args, lambda: self.call(
+            method, *args, budget_key=budget_key, priority=priority, private=private))
+
+    async def write(self, method: str, *args, budget_key: str = '*'):
+        """Запрос, меняющий состояние счета: сбрасывает кэш чтений, которые от него зависят."""
+        try:
+            return await self.call(method, *args, budget_key=budget_key, priority=PRIORITY_ORDER)
+        finally:
+            self.single_flight.invalidate('fetch_balance', 'fetch_open_orders', 'fetch_order')
+
+    @property
+    def markets(self):
+        return self.client.markets
+
+    async def load_markets(self, reload: bool = False):
+        return await self.read('load_markets', reload, private=False)
+
+    async def fetch_balance(self, params=None):
+        return await self.read('fetch_balance', params or {})
+
+    async def fetch_ticker(self, symbol: str, params=None):
+        return await self.read('fetch_ticker', symbol, params or {}, budget_key=symbol, private=False)
+
+    async def fetch_open_orders(self, symbol: str = None, since=None, limit=None, params=None):
+        return await self.read('fetch_open_orders', symbol, since, limit, params or {}, budget_key=symbol or '*',
+                               priority=PRIORITY_TRACK)
+
+    async def fetch_order(self, order_id: str, symbol: str = None, params=None):
+        return await self.read('fetch_order', order_id, symbol, params or {}, budget_key=symbol or '*',
+                               priority=PRIORITY_TRACK)
+
+    async def create_market_buy_order(self, symbol: str, amount, params=None):
+        return await self.write('create_market_buy_order', symbol, amount, params or {}, budget_key=symbol)
+
+    async def create_limit_sell_order(self, symbol: str, amount, price, params=None):
+        return await self.write('create_limit_sell_order', symbol, amount, price, params or {}, budget_key=symbol)
+
+    async def cancel_order(self, order_id: str, symbol: str = None, params=None):
+        return await self.write('cancel_order', order_id, symbol, params or {}, budget_key=symbol or '*')
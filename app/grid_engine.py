@@ -0,0 +1,177 @@
+# app/grid_engine.py
+
+import bisect
+import itertools
+
+
+class GridLevel:
+    """Один уровень сетки: покупка по рынку и take-profit ордер на продажу."""
+
+    def __init__(self, number: int, buy_price: float, amount: float, sell_price: float, opened_at: float):
+        self.number = number
+        self.buy_price = buy_price
+        self.amount = amount
+        self.sell_price = sell_price
+        self.opened_at = opened_at
+        self.buy_order_id = None
+        self.sell_order_id = None
+
+    @property
+    def cost(self) -> float:
+        return self.buy_price * self.amount
+
+    def profit(self, sell_price: float = None) -> float:
+        """Прибыль уровня при продаже по указанной цене (по умолчанию - по цене take-profit)."""
+        price = self.sell_price if sell_price is None else sell_price
+        return (price - self.buy_price) * self.amount
+
+    def __repr__(self):
+        return f"GridLevel(#{self.number}, buy={self.buy_price}, amount={self.amount}, sell={self.sell_price})"
+
+
+class GridEngine:
+    """
+    Логика DCA-сетки без обращений к бирже.
+
+    Первый уровень покупается сразу. Каждый следующий - когда цена опускается на
+    fall_percentage ниже самой низкой открытой покупки, но не раньше чем через
+    delay_seconds после предыдущей покупки. Каждый уровень закрывается своим
+    take-profit на profit_percentage выше цены покупки.
+
+    Открытые уровни хранятся в двух упорядоченных списках - по цене покупки и по
+    цене продажи, поэтому проверка тика занимает O(log n), а не перебор уровней.
+    Этот же класс использует бэктестер, чтобы решения совпадали с живой торговлей.
+    """
+
+    def __init__(self, profit_percentage: float, fall_percentage: float, delay_seconds: float):
+        self.profit_percentage = profit_percentage
+        self.fall_percentage = fall_percentage
+        self.delay_seconds = delay_seconds
+        self._by_buy = []   # Уровни, упорядоченные по цене покупки
+        self._by_sell = []  # Уровни, упорядоченные по цене продажи
+        self._numbers = itertools.count(1)
+        self.last_buy_time = None
+        self.last_fill_price = None
+
+    def update_params(self, profit_percentage: float, fall_percentage: float, delay_seconds: float):
+        """Применяет новые параметры к следующим уровням (уже открытые уровни не меняются)."""
+        self.profit_percentage = profit_percentage
+        self.fall_percentage = fall_percentage
+        self.delay_seconds = delay_seconds
+
+    @property
+    def levels(self) -> list:
+        return list(self._by_buy)
+
+    def __len__(self):
+        return len(self._by_buy)
+
+    @property
+    def lowest_level(self):
+        return self._by_buy[0] if self._by_buy else None
+
+    @property
+    def lowest_sell_price(self):
+        """Самая низкая цена take-profit среди открытых уровней или None."""
+        return self._by_sell[0].sell_price if self._by_sell else None
+
+    def take_profit_price(self, buy_price: float) -> float:
+        return buy_price * (1 + self.profit_percentage / 100)
+
+    def next_buy_price(self):
+        """Цена, при которой покупается следующий уровень, или None, если уровней нет."""
+        lowest = self.lowest_level
+        if lowest is None:
+            return None
+        return lowest.buy_price * (1 - self.fall_percentage / 100)
+
+    def should_buy(self, price: float, now: float) -> bool:
+        """Нужно ли покупать новый уровень при текущей цене."""
+        if self.last_buy_time is not None and now - self.last_buy_time < self.delay_seconds:
+            return False
+        trigger = self.next_buy_price()
+        return trigger is None or price <= trigger
+
+    def defer(self, now: float):
+        """Откладывает следующую покупку на delay_seconds (например, после ошибки ордера)."""
+        self.last_buy_time = now
+
+    def open_level(self, buy_price: float, amount: float, now: float, sell_price: float = None) -> GridLevel:
+        """Регистрирует исполненную покупку как новый уровень."""
+        if sell_price is None:
+            sell_price = self.take_profit_price(buy_price)
+        level = GridLevel(next(self._numbers), buy_price, amount, sell_price, now)
+        bisect.insort(self._by_buy, level, key=lambda item: item.buy_price)
+        bisect.insort(self._by_sell, level, key=lambda item: item.sell_price)
+        self.last_buy_time = now
+        self.last_fill_price = buy_price
+        return level
+
+    def set_sell_price(self, level: GridLevel, sell_price: float):
+        """Обновляет цену take-profit (например, после округления до шага цены биржи)."""
+        self._remove(self._by_sell, level, lambda item: item.sell_price)
+        level.sell_price = sell_price
+        bisect.insort(self._by_sell, level, key=lambda item: item.sell_price)
+
+    def close_level(self, level: GridLevel):
+        """Удаляет уровень после исполнения или отмены его take-profit."""
+        self._remove(self._by_buy, level, lambda item: item.buy_price)
+        self._remove(self._by_sell, level, lambda item: item.sell_price)
+
+    def levels_without_take_profit(self) -> list:
+        """Уровни, для которых ордер take-profit еще не выставлен."""
+        return [level for level in self._by_buy if level.sell_order_id is None]
+
+    def levels_to_take_profit(self, price: float) -> list:
+        """Уровни, чей take-profit не выше текущей цены."""
+        index = bisect.bisect_right(self._by_sell, price, key=lambda item: item.sell_price)
+        return self._by_sell[:index]
+
+    def to_state(self) -> dict:
+        """Состояние сетки для сохранения между перезапусками (JSON-совместимое)."""
+        return {
+            'profit_percentage': self.profit_percentage,
+            'fall_percentage': self.fall_percentage,
+            'delay_seconds': self.delay_seconds,
+            'last_fill_price': self.last_fill_price,
+            'levels': [
+                {
+                    'number': level.number,
+                    'buy_price': level.buy_price,
+                    'amount': level.amount,
+                    'sell_price': level.sell_price,
+                    'buy_order_id': level.buy_order_id,
+                    'sell_order_id': level.sell_order_id,
+                }
+                for level in self._by_buy
+            ],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict, now: float) -> 'GridEngine':
+        """
+        Восстанавливает сетку из to_state(). Монотонное время не переживает перезапуск,
+        поэтому задержка до следующей покупки отсчитывается от now.
+        """
+        engine = cls(state['profit_percentage'], state['fall_percentage'], state['delay_seconds'])
+        for item in state['levels']:
+            level = GridLevel(item['number'], item['buy_price'], item['amount'], item['sell_price'], now)
+            level.buy_order_id = item.get('buy_order_id')
+            level.sell_order_id = item.get('sell_order_id')
+            bisect.insort(engine._by_buy, level, key=lambda entry: entry.buy_price)
+            bisect.insort(engine._by_sell, level, key=lambda entry: entry.sell_price)
+        engine._numbers = itertools.count(max((item['number'] for item in state['levels']), default=0) + 1)
+        engine.last_fill_price = state.get('last_fill_price')
+        if engine._by_buy:
+            engine.last_buy_time = now
+        return engine
+
+    @staticmethod
+    def _remove(ordered: list, level: GridLevel, key):
+        index = bisect.bisect_left(ordered, key(level), key=key)
+        while index < len(ordered) and key(ordered[index]) == key(level):
+            if ordered[index] is level:
+                del ordered[index]
+                return
+            index += 1
+        raise ValueError(f"Уровень {level} не найден в сетке")
@@ -18,7 +18,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"Команда /start вызвана пользователем {user_id}")
     
     # Получаем или создаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     await update.message.reply_text('Привет! Это торговый бот для биржи MEXC.\n'
                                     'Команды:\n'
@@ -26,8 +26,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                                     '/balance - показать баланс\n'
                                     '/buy <symbol> <amount> - купить валюту\n'
                                     '/set_params <процент_прибыли> <процент_падения> <задержка> <размер_ордера> - установить параметры\n'
-                                    '/autobuy - запустить автоматическую торговлю KAS/USDT\n'
-                                    '/stop - остановить автоматическую торговлю\n'
+                                    '/set_continuous <on|off> - непрерывные циклы автоторговли\n'
+                                    '/autobuy [symbol] - запустить автоматическую торговлю (по умолчанию KAS/USDT)\n'
+                                    '/stop [symbol] - остановить автоматическую торговлю по паре или по всем парам\n'
                                     '/set_api_keys <api_key> <api_secret> - установить API-ключи\n'
                                     '/check_api_keys - проверить установленные API-ключи\n'
                                     '/stats - показать статистику\n'
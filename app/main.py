@@ -24,6 +24,53 @@ logging.basicConfig(
 )
 logging.getLogger("httpx").setLevel(logging.WARNING)  # Скрыть INFO-сообщения httpx
 
+# Запуск фоновых задач после инициализации приложения
+async def on_startup(app) -> None:
+    from app.client_pool import exchange_client_pool
+    from app.market_cache import market_cache
+    from app.market_data import market_data_hub
+    from app.market_store import market_recorder
+    from app.metrics import loop_lag_monitor, metrics_server, register_runtime_gauges
+    from app.trading_logic import resume_trading_sessions
+
+    market_cache.start_background_refresh(exchange_client_pool.public())
+    market_recorder.start(market_data_hub)
+    register_runtime_gauges()
+    loop_lag_monitor.start()
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        logger.error(f"Не удалось запустить сервер метрик: {e}")
+    # Сессии восстанавливаются в фоне, чтобы бот сразу начал отвечать на команды
+    asyncio.create_task(resume_trading_sessions(app.bot))
+
+# Остановка сессий автоторговли, пока бот еще может отправлять сообщения
+# (post_stop вызывается до Application.shutdown(), который закрывает HTTP-клиент бота)
+async def on_stop(app) -> None:
+    from app.supervisor import session_supervisor
+
+    await session_supervisor.shutdown()  # Сессии сохраняют состояние, уведомляют пользователей и завершаются
+
+# Остановка фоновых задач при завершении работы (без обращений к Telegram)
+async def on_shutdown(app) -> None:
+    from app.database import db_executor
+    from app.market_cache import market_cache
+    from app.market_store import market_recorder
+    from app.metrics import loop_lag_monitor, metrics_server
+    from app.order_tracker import order_tracker
+    from app.trade_journal import trade_journal
+    from app.user_state import user_state_writer
+
+    await order_tracker.stop()
+    await market_cache.stop_background_refresh()
+    await market_recorder.stop()  # Дописываем накопленные тики и свечи
+    await trade_journal.stop()  # Дописываем сделки, оставшиеся в очереди
+    await user_state_writer.stop()  # Сохраняем несохраненные параметры пользователей
+    db_executor.shutdown(wait=True)  # Дожидаемся завершения всех записей в базу
+    await metrics_server.stop()
+    await loop_lag_monitor.stop()
+    logger.info("Фоновые задачи остановлены, данные сохранены.")
+
 # Главная функция
 def main() -> None:
     global application  # Используем глобальную переменную
@@ -33,29 +80,38 @@ def main() -> None:
         logger.info("База данных успешно инициализирована.")
 
         logger.info("Бот успешно запущен!")
-        application = ApplicationBuilder().token(TOKEN).build()
+        application = ApplicationBuilder().token(TOKEN).post_init(on_startup).post_stop(on_stop).post_shutdown(on_shutdown).build()
         
         # Добавляем обработчики команд
         from app.handlers import start
         from app.buy_handlers import buy, balance
         from app.profit_handlers import profit_today, profit_history, profit_month, profit_total
-        from app.settings_handlers import set_params, set_api_keys, check_api_keys, stats, reset_trading
-        from app.autotrade_handlers import autobuy, stop
+        from app.settings_handlers import set_params, set_continuous, set_api_keys, check_api_keys, stats, reset_trading
+        from app.autotrade_handlers import autobuy, stop, sessions, metrics
+        from app.metrics import instrument_handler
 
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("buy", buy))
-        application.add_handler(CommandHandler("balance", balance))
-        application.add_handler(CommandHandler("set_params", set_params))
-        application.add_handler(CommandHandler("autobuy", autobuy))
-        application.add_handler(CommandHandler("stop", stop))
-        application.add_handler(CommandHandler("set_api_keys", set_api_keys))
-        application.add_handler(CommandHandler("check_api_keys", check_api_keys))
-        application.add_handler(CommandHandler("stats", stats))
-        application.add_handler(CommandHandler("profit_today", profit_today))
-        application.add_handler(CommandHandler("profit_history", profit_history))
-        application.add_handler(CommandHandler("profit_month", profit_month))
-        application.add_handler(CommandHandler("profit_total", profit_total))
-        application.add_handler(CommandHandler("reset_trading", reset_trading))
+        commands = [
+            ("start", start),
+            ("buy", buy),
+            ("balance", balance),
+            ("set_params", set_params),
+            ("set_continuous", set_continuous),
+            ("autobuy", autobuy),
+            ("stop", stop),
+            ("sessions", sessions),
+            ("metrics", metrics),
+            ("set_api_keys", set_api_keys),
+            ("check_api_keys", check_api_keys),
+            ("stats", stats),
+            ("profit_today", profit_today),
+            ("profit_history", profit_history),
+            ("profit_month", profit_month),
+            ("profit_total", profit_total),
+            ("reset_trading", reset_trading),
+        ]
+        # Каждый обработчик измеряется: время выполнения и ошибки попадают в метрики
+        for command, callback in commands:
+            application.add_handler(CommandHandler(command, instrument_handler(command, callback)))
 
         application.run_polling()
     
@@ -0,0 +1,158 @@
+# app/market_cache.py
+
+import asyncio
+import math
+import time
+from ccxt.base.decimal_to_precision import TICK_SIZE
+from config.config import MARKETS_CACHE_TTL
+from config.logging_config import logger
+
+DEFAULT_PRECISION = 8  # Количество знаков по умолчанию
+
+# Атрибуты клиента ccxt, которые заполняет load_markets
+MARKET_ATTRIBUTES = (
+    'markets', 'markets_by_id', 'symbols', 'ids',
+    'currencies', 'currencies_by_id', 'codes', 'baseCurrencies', 'quoteCurrencies',
+)
+
+
+def precision_to_decimals(prec_value, precision_mode=TICK_SIZE) -> int:
+    """
+    Переводит значение market['precision'] в количество десятичных знаков.
+
+    В режиме TICK_SIZE биржа отдает шаг цены (например 0.01), иначе - число знаков.
+    """
+    if prec_value is None:
+        return DEFAULT_PRECISION
+    try:
+        prec_value = float(prec_value)
+    except (ValueError, TypeError):
+        logger.error(f"Невозможно преобразовать precision в целое число: {prec_value}")
+        return DEFAULT_PRECISION
+    if precision_mode == TICK_SIZE or 0 < prec_value < 1:
+        if prec_value <= 0:
+            return DEFAULT_PRECISION
+        return max(0, int(round(-math.log10(prec_value))))
+    return int(prec_value)
+
+
+class MarketInfo:
+    """Предвычисленные параметры торговой пары: точность и минимальные ограничения."""
+
+    def __init__(self, symbol: str, amount_precision: int, price_precision: int, min_amount=None, min_cost=None):
+        self.symbol = symbol
+        self.amount_precision = amount_precision
+        self.price_precision = price_precision
+        self.min_amount = min_amount
+        self.min_cost = min_cost
+
+    @classmethod
+    def from_market(cls, market: dict, precision_mode=TICK_SIZE) -> 'MarketInfo':
+        precision = market.get('precision') or {}
+        limits = market.get('limits') or {}
+        min_amount = (limits.get('amount') or {}).get('min')
+        min_cost = (limits.get('cost') or {}).get('min')
+        return cls(
+            symbol=market['symbol'],
+            amount_precision=precision_to_decimals(precision.get('amount'), precision_mode),
+            price_precision=precision_to_decimals(precision.get('price'), precision_mode),
+            min_amount=float(min_amount) if min_amount is not None else None,
+            min_cost=float(min_cost) if min_cost is not None else None,
+        )
+
+    def round_amount(self, amount: float) -> float:
+        return round(amount, self.amount_precision)
+
+    def round_price(self, price: float) -> float:
+        return round(price, self.price_precision)
+
+
+class MarketMetadataCache:
+    """
+    Общий для процесса кэш метаданных рынков.
+
+    Рынки загружаются один раз через публичный клиент и переиспользуются всеми
+    клиентами пользователей; в фоне кэш обновляется раз в ttl секунд.
+    """
+
+    def __init__(self, ttl: float = MARKETS_CACHE_TTL):
+        self.ttl = ttl
+        self.info = {}  # symbol -> MarketInfo
+        self.loaded_at = None
+        self._source = None  # Клиент ccxt, в котором лежат загруженные рынки
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._source is not None
+
+    def is_expired(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at >= self.ttl
+
+    async def refresh(self, adapter):
+        """Загружает рынки заново и пересчитывает параметры всех пар."""
+        started = time.perf_counter()
+        await adapter.load_markets(True)
+        client = adapter.client
+        precision_mode = getattr(client, 'precisionMode', TICK_SIZE)
+        self.info = {symbol: MarketInfo.from_market(market, precision_mode) for symbol, market in client.markets.items()}
+        self._source = client
+        self.loaded_at = time.monotonic()
+        logger.info(f"Метаданные рынков обновлены: {len(self.info)} пар за {time.perf_counter() - started:.2f} сек")
+
+    def _needs_refresh(self) -> bool:
+        if not self.is_loaded:
+            return True
+        # Устаревший кэш обновляет фоновая задача, если она запущена
+        background = self._refresh_task is not None and not self._refresh_task.done()
+        return not background and self.is_expired()
+
+    async def ensure_loaded(self, adapter):
+        """Загружает рынки, если кэш пуст или устарел. Одновременные вызовы ждут одну загрузку."""
+        if not self._needs_refresh():
+            return
+        async with self._lock:
+            if self._needs_refresh():
+                await self.refresh(adapter)
+
+    async def get_market(self, adapter, symbol: str):
+        """Возвращает MarketInfo пары или None, если пары нет на бирже."""
+        await self.ensure_loaded(adapter)
+        return self.info.get(symbol)
+
+    def apply_to(self, client):
+        """Передает клиенту ссылки на уже загруженные рынки, чтобы он не скачивал их сам."""
+        if self._source is None or client is self._source:
+            return
+        for attribute in MARKET_ATTRIBUTES:
+            if hasattr(self._source, attribute):
+                setattr(client, attribute, getattr(self._source, attribute))
+
+    async def _refresh_loop(self, adapter):
+        while True:
+            try:
+                async with self._lock:
+                    if self.is_expired():
+                        await self.refresh(adapter)
+            except Exception as e:
+                logger.error(f"Ошибка при фоновом обновлении рынков: {e}")
+            # После ошибки повторяем попытку раньше, чем через полный ttl
+            await asyncio.sleep(self.ttl if not self.is_expired() else min(self.ttl, 60))
+
+    def start_background_refresh(self, adapter):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop(adapter))
+
+    async def stop_background_refresh(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+
+# Глобальный кэш метаданных рынков
+market_cache = MarketMetadataCache()
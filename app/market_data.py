@@ -0,0 +1,131 @@
+# app/market_data.py
+
+import asyncio
+import time
+from app.client_pool import exchange_client_pool
+from config.config import MARKET_DATA_POLL_INTERVAL
+from config.logging_config import logger
+
+
+class SymbolFeed:
+    """Одна подписка на котировки пары, общая для всех торговых сессий."""
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.subscribers = set()  # asyncio.Queue каждого подписчика
+        self.last_ticker = None
+        self.published_at = None  # Время рассылки последней котировки (monotonic)
+        self.updated = asyncio.Event()
+        self.task = None
+
+
+class MarketDataHub:
+    """
+    Общий поток рыночных данных.
+
+    На каждую пару опрашивается один fetch_ticker независимо от числа сессий,
+    а цена рассылается подписчикам через очереди asyncio. Очередь подписчика
+    хранит только последнюю котировку: медленная сессия не копит устаревшие цены.
+    Режим опроса - REST; WebSocket-режим можно подключить, заменив _poll.
+    """
+
+    def __init__(self, poll_interval: float = MARKET_DATA_POLL_INTERVAL, adapter_provider=None):
+        self.poll_interval = poll_interval
+        self.adapter_provider = adapter_provider or exchange_client_pool.public
+        self._feeds = {}  # symbol -> SymbolFeed
+        self._listeners = []  # Обработчики каждой котировки: callback(symbol, ticker)
+        self.requests = 0  # Число REST-запросов котировок
+
+    def add_listener(self, callback):
+        """Добавляет обработчик, который получает каждую котировку всех опрашиваемых пар."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def subscribe(self, symbol: str) -> asyncio.Queue:
+        """Подписывает на котировки пары и возвращает очередь обновлений."""
+        feed = self._feeds.get(symbol)
+        if feed is None:
+            feed = SymbolFeed(symbol)
+            self._feeds[symbol] = feed
+        queue = asyncio.Queue(maxsize=1)
+        feed.subscribers.add(queue)
+        if feed.last_ticker is not None:
+            queue.put_nowait(feed.last_ticker)
+        if feed.task is None or feed.task.done():
+            feed.task = asyncio.create_task(self._poll(feed))
+            logger.info(f"Запущен общий поток котировок {symbol}")
+        return queue
+
+    def unsubscribe(self, symbol: str, queue: asyncio.Queue):
+        """Отписывает очередь; опрос пары прекращается, когда подписчиков не осталось."""
+        feed = self._feeds.get(symbol)
+        if feed is None:
+            return
+        feed.subscribers.discard(queue)
+        if not feed.subscribers:
+            if feed.task:
+                feed.task.cancel()
+            del self._feeds[symbol]
+            logger.info(f"Общий поток котировок {symbol} остановлен: нет подписчиков")
+
+    def last_ticker(self, symbol: str):
+        feed = self._feeds.get(symbol)
+        return feed.last_ticker if feed else None
+
+    async def get_ticker(self, symbol: str, timeout: float = None):
+        """Возвращает последнюю котировку пары, дожидаясь первой при необходимости."""
+        feed = self._feeds.get(symbol)
+        if feed is None:
+            raise KeyError(f"Нет подписки на котировки {symbol}")
+        if feed.last_ticker is None:
+            await asyncio.wait_for(feed.updated.wait(), timeout)
+        return feed.last_ticker
+
+    def published_at(self, symbol: str, default: float = None):
+        """Время рассылки последней котировки пары по time.monotonic()."""
+        feed = self._feeds.get(symbol)
+        return feed.published_at if feed and feed.published_at is not None else default
+
+    def subscriber_count(self, symbol: str) -> int:
+        feed = self._feeds.get(symbol)
+        return len(feed.subscribers) if feed else 0
+
+    def _publish(self, feed: SymbolFeed, ticker: dict):
+        feed.last_ticker = ticker
+        feed.published_at = time.monotonic()
+        feed.updated.set()
+        for queue in feed.subscribers:
+            if queue.full():
+                queue.get_nowait()  # Выбрасываем устаревшую котировку
+            queue.put_nowait(ticker)
+        for callback in self._listeners:
+            try:
+                callback(feed.symbol, ticker)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика котировок {feed.symbol}: {e}")
+
+    async def _poll(self, feed: SymbolFeed):
+        adapter = self.adapter_provider()
+        errors = 0
+        while feed.subscribers:
+            started = time.monotonic()
+            try:
+                ticker = await adapter.fetch_ticker(feed.symbol)
+                self.requests += 1
+                errors = 0
+                self._publish(feed, ticker)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors += 1
+                logger.error(f"Ошибка при получении котировки {feed.symbol}: {e}")
+            # При ошибках увеличиваем паузу, чтобы не упираться в лимиты биржи
+            delay = self.poll_interval * min(2 ** errors, 30)
+            await asyncio.sleep(max(0.0, delay - (time.monotonic() - started)))
+
+
+# Глобальный поток рыночных данных
+market_data_hub = MarketDataHub()
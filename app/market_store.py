@@ -0,0 +1,325 @@
+# app/market_store.py
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from app.backtesting import Candles
+from config.config import (
+    MARKET_STORE_DIR, MARKET_RECORDER_SYMBOLS, MARKET_RECORDER_FLUSH_INTERVAL,
+    MARKET_STORE_COMPACT_INTERVAL, MARKET_TICK_RETENTION_DAYS,
+)
+from config.logging_config import logger
+
+# Столбцы таблиц: имя -> тип фиксированной ширины. Первый столбец - время в мс, по нему индекс
+TICK_COLUMNS = (('timestamp', np.int64), ('price', np.float64), ('bid', np.float64), ('ask', np.float64))
+CANDLE_COLUMNS = (
+    ('timestamp', np.int64), ('open', np.float64), ('high', np.float64), ('low', np.float64), ('close', np.float64),
+)
+TICKS = 'ticks'
+CANDLES_1M = 'candles_1m'
+TABLES = {TICKS: TICK_COLUMNS, CANDLES_1M: CANDLE_COLUMNS}
+
+CANDLE_MS = 60_000
+
+
+class ColumnTable:
+    """
+    Таблица из append-only файлов-столбцов фиксированной ширины (<столбец>.bin).
+
+    Строка добавляется дописыванием значения в конец каждого файла, поэтому
+    читатели открывают столбцы через np.memmap без копирования. Время в первом
+    столбце возрастает, и поиск диапазона - это двоичный поиск np.searchsorted
+    по отображенному столбцу, O(log n). Если запись оборвалась посередине строки,
+    лишние значения в более длинных столбцах игнорируются до уплотнения.
+    """
+
+    def __init__(self, directory: str, columns: tuple):
+        self.directory = directory
+        self.columns = columns
+        self.dtypes = dict(columns)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def __len__(self):
+        lengths = []
+        for name, dtype in self.columns:
+            path = self._path(name)
+            lengths.append(os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0)
+        return min(lengths)
+
+    def append(self, rows: dict):
+        """Дописывает строки: rows - столбец -> последовательность значений одинаковой длины."""
+        os.makedirs(self.directory, exist_ok=True)
+        for name, dtype in self.columns:
+            with open(self._path(name), 'ab') as f:
+                f.write(np.asarray(rows[name], dtype=dtype).tobytes())
+
+    def read(self) -> dict:
+        """Все строки как memmap-столбцы (только чтение, без копирования)."""
+        length = len(self)
+        if length == 0:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in self.columns}
+        return {
+            name: np.memmap(self._path(name), dtype=dtype, mode='r', shape=(length,))
+            for name, dtype in self.columns
+        }
+
+    def range(self, start_ms: int = None, end_ms: int = None) -> dict:
+        """Строки с временем в полуинтервале [start_ms, end_ms) - срезы memmap без копирования."""
+        columns = self.read()
+        timestamps = columns[self.columns[0][0]]
+        first = 0 if start_ms is None else int(np.searchsorted(timestamps, start_ms, side='left'))
+        last = len(timestamps) if end_ms is None else int(np.searchsorted(timestamps, end_ms, side='left'))
+        return {name: column[first:last] for name, column in columns.items()}
+
+    def last_timestamp(self):
+        length = len(self)
+        if length == 0:
+            return None
+        name, dtype = self.columns[0]
+        return int(np.memmap(self._path(name), dtype=dtype, mode='r', shape=(length,))[-1])
+
+    def compact(self, min_timestamp: int = None) -> tuple:
+        """
+        Переписывает таблицу: выравнивает длины столбцов, сортирует по времени,
+        удаляет повторы времени (остается последняя запись) и строки старше
+        min_timestamp. Возвращает (строк до, строк после).
+        """
+        columns = {name: np.array(column) for name, column in self.read().items()}
+        before = len(columns[self.columns[0][0]])
+        timestamps = columns[self.columns[0][0]]
+        order = np.argsort(timestamps, kind='stable')
+        timestamps = timestamps[order]
+        # Из одинаковых меток времени оставляем последнюю записанную
+        keep = np.ones(len(timestamps), dtype=bool)
+        keep[:-1] = timestamps[1:] != timestamps[:-1]
+        if min_timestamp is not None:
+            keep &= timestamps >= min_timestamp
+        rows = {name: column[order][keep] for name, column in columns.items()}
+        for name, dtype in self.columns:
+            path = self._path(name)
+            temporary = path + '.tmp'
+            with open(temporary, 'wb') as f:
+                f.write(rows[name].astype(dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+        return before, int(keep.sum())
+
+
+class MarketStore:
+    """Локальное хранилище тиков и минутных свечей: каталог на пару, таблица на вид данных."""
+
+    def __init__(self, directory: str = MARKET_STORE_DIR):
+        self.directory = directory
+
+    @staticmethod
+    def symbol_dir(symbol: str) -> str:
+        return symbol.replace('/', '_')
+
+    def table(self, symbol: str, kind: str) -> ColumnTable:
+        return ColumnTable(os.path.join(self.directory, self.symbol_dir(symbol), kind), TABLES[kind])
+
+    def symbols(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name.replace('_', '/', 1) for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def ticks(self, symbol: str, start_ms: int = None, end_ms: int = None) -> dict:
+        return self.table(symbol, TICKS).range(start_ms, end_ms)
+
+    def candles(self, symbol: str, start_ms: int = None, end_ms: int = None) -> Candles:
+        """Минутные свечи пары в формате бэктестера (столбцы - memmap)."""
+        return Candles(**self.table(symbol, CANDLES_1M).range(start_ms, end_ms))
+
+    def compact(self, tick_retention_days: float = MARKET_TICK_RETENTION_DAYS) -> dict:
+        """Уплотняет все таблицы; тики старше tick_retention_days удаляются, свечи хранятся бессрочно."""
+        min_tick = int((time.time() - tick_retention_days * 86400) * 1000)
+        report = {}
+        for symbol in self.symbols():
+            for kind in TABLES:
+                table = self.table(symbol, kind)
+                if os.path.isdir(table.directory):
+                    report[(symbol, kind)] = table.compact(min_tick if kind == TICKS else None)
+        return report
+
+
+class CandleBuilder:
+    """Собирает минутную свечу пары из тиков."""
+
+    def __init__(self):
+        self.minute = None
+        self.open = self.high = self.low = self.close = None
+
+    def add(self, timestamp: int, price: float):
+        """Учитывает тик; возвращает завершенную свечу предыдущей минуты или None."""
+        minute = timestamp - timestamp % CANDLE_MS
+        finished = None
+        if self.minute is not None and minute > self.minute:
+            finished = (self.minute, self.open, self.high, self.low, self.close)
+        if self.minute is None or minute > self.minute:
+            self.minute = minute
+            self.open = self.high = self.low = self.close = price
+        elif minute == self.minute:
+            self.high = max(self.high, price)
+            self.low = min(self.low, price)
+            self.close = price
+        return finished
+
+
+class MarketRecorder:
+    """
+    Запись котировок из market_data_hub в MarketStore.
+
+    Записываются все пары, которые опрашивает общий поток котировок, а пары из
+    MARKET_RECORDER_SYMBOLS опрашиваются постоянно, даже без торговых сессий.
+    Тики и завершенные свечи копятся в памяти и дописываются на диск раз в
+    flush_interval секунд в отдельном потоке; в этом же потоке раз в
+    compact_interval секунд выполняется уплотнение, поэтому оно не пересекается
+    с записью. Незавершенная свеча при остановке не сохраняется: после
+    перезапуска она собирается заново из тиков, уже записанных на диск.
+    """
+
+    def __init__(self, store: MarketStore = None, symbols=MARKET_RECORDER_SYMBOLS,
+                 flush_interval: float = MARKET_RECORDER_FLUSH_INTERVAL,
+                 compact_interval: float = MARKET_STORE_COMPACT_INTERVAL):
+        self.store = store or MarketStore()
+        self.symbols = list(symbols)
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='market_store')
+        self._ticks = {}  # symbol -> список (timestamp, price, bid, ask)
+        self._candles = {}  # symbol -> список завершенных свечей
+        self._builders = {}  # symbol -> CandleBuilder
+        self._last_timestamp = {}  # symbol -> время последнего записанного тика
+        self._last_candle = {}  # symbol -> минута последней записанной свечи
+        self._queues = {}  # symbol -> очередь подписки
+        self._task = None
+        self._hub = None
+        self._last_compact = time.monotonic()
+        self.recorded = 0  # Число записанных тиков
+
+    def start(self, hub):
+        if self._task is not None:
+            return
+        self._hub = hub
+        hub.add_listener(self.on_ticker)
+        for symbol in self.symbols:
+            self._seed(symbol)
+            self._queues[symbol] = hub.subscribe(symbol)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Запись рыночных данных запущена: {self.store.directory}")
+
+    def _seed(self, symbol: str):
+        """
+        Продолжает запись после перезапуска: тики и свечи не старше уже сохраненных
+        на диске отбрасываются, иначе время в таблицах перестанет возрастать.
+        Незавершенная до остановки минута собирается заново из ее сохраненных тиков.
+        """
+        ticks = self.store.table(symbol, TICKS)
+        last_tick = ticks.last_timestamp()
+        last_candle = self.store.table(symbol, CANDLES_1M).last_timestamp()
+        self._last_timestamp[symbol] = -1 if last_tick is None else last_tick
+        self._last_candle[symbol] = -1 if last_candle is None else last_candle
+        if last_tick is not None and last_tick - last_tick % CANDLE_MS > self._last_candle[symbol]:
+            minute = last_tick - last_tick % CANDLE_MS
+            stored = ticks.range(minute, minute + CANDLE_MS)
+            builder = self._builders[symbol] = CandleBuilder()
+            for timestamp, price in zip(stored['timestamp'], stored['price']):
+                builder.add(int(timestamp), float(price))
+
+    def on_ticker(self, symbol: str, ticker: dict):
+        price = ticker.get('last')
+        if price is None:
+            return
+        if symbol not in self._last_timestamp:
+            self._seed(symbol)
+        timestamp = ticker.get('timestamp') or int(time.time() * 1000)
+        # Время должно возрастать: повтор той же котировки не записываем
+        if timestamp <= self._last_timestamp.get(symbol, -1):
+            return
+        self._last_timestamp[symbol] = timestamp
+        bid = ticker.get('bid')
+        ask = ticker.get('ask')
+        self._ticks.setdefault(symbol, []).append(
+            (timestamp, price, np.nan if bid is None else bid, np.nan if ask is None else ask)
+        )
+        builder = self._builders.get(symbol)
+        if builder is None:
+            builder = self._builders[symbol] = CandleBuilder()
+        candle = builder.add(timestamp, price)
+        # Первая свеча после перезапуска неполная: если ее минута уже на диске, не дублируем ее
+        if candle is not None and candle[0] > self._last_candle[symbol]:
+            self._last_candle[symbol] = candle[0]
+            self._candles.setdefault(symbol, []).append(candle)
+
+    def _take(self) -> tuple:
+        ticks, self._ticks = self._ticks, {}
+        candles, self._candles = self._candles, {}
+        return ticks, candles
+
+    def _write(self, ticks: dict, candles: dict):
+        for symbol, rows in ticks.items():
+            data = np.array(rows, dtype=np.float64)
+            self.store.table(symbol, TICKS).append({
+                'timestamp': np.array([row[0] for row in rows], dtype=np.int64),
+                'price': data[:, 1], 'bid': data[:, 2], 'ask': data[:, 3],
+            })
+        for symbol, rows in candles.items():
+            data = np.array(rows, dtype=np.float64)
+            self.store.table(symbol, CANDLES_1M).append({
+                'timestamp': np.array([row[0] for row in rows], dtype=np.int64),
+                'open': data[:, 1], 'high': data[:, 2], 'low': data[:, 3], 'close': data[:, 4],
+            })
+
+    async def flush(self):
+        ticks, candles = self._take()
+        if not ticks and not candles:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, ticks, candles)
+            self.recorded += sum(len(rows) for rows in ticks.values())
+        except Exception as e:
+            logger.error(f"Ошибка записи рыночных данных: {e}")
+
+    async def compact(self):
+        report = await asyncio.get_running_loop().run_in_executor(self._executor, self.store.compact)
+        removed = sum(before - after for before, after in report.values())
+        logger.info(f"Уплотнение рыночных данных завершено: таблиц {len(report)}, удалено строк {removed}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() - self._last_compact >= self.compact_interval:
+                self._last_compact = time.monotonic()
+                try:
+                    await self.compact()
+                except Exception as e:
+                    logger.error(f"Ошибка уплотнения рыночных данных: {e}")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._hub.remove_listener(self.on_ticker)
+        for symbol, queue in self._queues.items():
+            self._hub.unsubscribe(symbol, queue)
+        self._queues.clear()
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        logger.info(f"Запись рыночных данных остановлена. Записано тиков: {self.recorded}")
+
+
+# Глобальное хранилище рыночных данных и запись котировок в него
+market_store = MarketStore()
+market_recorder = MarketRecorder(market_store)
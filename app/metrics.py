@@ -0,0 +1,372 @@
+# app/metrics.py
+
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from config.config import METRICS_HOST, METRICS_PORT, LOOP_LAG_INTERVAL
+from config.logging_config import logger
+
+# Границы корзин гистограмм задержек, сек
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class HistogramValue:
+    def __init__(self, buckets: tuple):
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - значения больше всех границ
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """
+    Гистограмма с метками, как histogram в Prometheus.
+
+    observe() может вызываться из потоков пулов (биржа, база), поэтому
+    изменения защищены блокировкой.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}  # значения меток -> HistogramValue
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            item = self._values.get(label_values)
+            if item is None:
+                item = self._values[label_values] = HistogramValue(self.buckets)
+            item.counts[bisect.bisect_left(self.buckets, value)] += 1
+            item.sum += value
+            item.count += 1
+
+    def snapshot(self) -> dict:
+        """Копия значений: метки -> (счетчики корзин, сумма, количество)."""
+        with self._lock:
+            return {labels: (list(item.counts), item.sum, item.count) for labels, item in self._values.items()}
+
+    def quantile(self, q: float, *label_values):
+        """Оценка квантиля по корзинам (верхняя граница корзины) или None, если наблюдений нет."""
+        data = self.snapshot().get(label_values)
+        if not data or not data[2]:
+            return None
+        counts, _, count = data
+        target = q * count
+        running = 0
+        for index, bucket_count in enumerate(counts):
+            running += bucket_count
+            if running >= target:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.snapshot().items()):
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                running += bucket_count
+                bucket_labels = _format_labels(self.labels + ('le',), labels + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {running}")
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(self.labels, labels)} {value}" for labels, value in values]
+        return lines
+
+
+class Gauge:
+    """Показатель, значения которого вычисляются при каждом сборе: collect() -> {значения меток: число}."""
+
+    def __init__(self, name: str, help: str, collect, labels: tuple = (), type: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+        self.type = type
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.error(f"Ошибка сбора метрики {self.name}: {e}")
+            return lines
+        lines += [f"{self.name}{_format_labels(self.labels, labels)} {value}" for labels, value in sorted(values.items())]
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса; render() отдает их в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics = {}  # имя -> метрика
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.get(name) or self.register(Histogram(name, help, labels, buckets))
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._metrics.get(name) or self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, collect, labels: tuple = (), type: str = 'gauge') -> Gauge:
+        return self.register(Gauge(name, help, collect, labels, type))
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+# Глобальный реестр метрик
+metrics_registry = MetricsRegistry()
+
+handler_latency = metrics_registry.histogram(
+    'bot_handler_seconds', 'Время обработки команды Telegram', ('command',))
+handler_errors = metrics_registry.counter(
+    'bot_handler_errors_total', 'Команды, завершившиеся исключением', ('command',))
+exchange_latency = metrics_registry.histogram(
+    'exchange_request_seconds', 'Время запроса к бирже (без ожидания лимитов)', ('method',))
+exchange_errors = metrics_registry.counter(
+    'exchange_errors_total', 'Запросы к бирже, завершившиеся ошибкой', ('method',))
+db_latency = metrics_registry.histogram(
+    'db_query_seconds', 'Время выполнения запроса к базе в потоке db_executor', ('operation',))
+db_wait = metrics_registry.histogram(
+    'db_queue_seconds', 'Ожидание свободного потока db_executor')
+loop_lag = metrics_registry.histogram(
+    'event_loop_lag_seconds', 'Опоздание пробуждения цикла событий относительно расписания')
+
+
+def instrument_handler(command: str, callback):
+    """Оборачивает обработчик команды: время выполнения и ошибки попадают в метрики."""
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            handler_errors.inc(command)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, command)
+
+    return wrapper
+
+
+class LoopLagMonitor:
+    """Фоновая задача: раз в interval секунд измеряет, насколько позже срока просыпается цикл событий."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, time.perf_counter() - started - self.interval)
+            loop_lag.observe(self.last_lag)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+class MetricsServer:
+    """
+    Минимальный HTTP-сервер на asyncio: GET /metrics отдает metrics_registry.render().
+    Слушает только METRICS_HOST (по умолчанию локальный адрес); METRICS_PORT = 0 отключает сервер.
+    """
+
+    def __init__(self, registry: MetricsRegistry = None, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.registry = registry or metrics_registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        if not self.port or self._server is not None:
+            return
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Метрики доступны по адресу http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, но их нужно дочитать до пустой строки
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                status, body, content_type = '404 Not Found', b'not found\n', 'text/plain'
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка при отдаче метрик: {e}")
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+
+def register_runtime_gauges(registry: MetricsRegistry = None):
+    """Показатели состояния бота, вычисляемые при сборе: сессии, кэши, очереди лимитов."""
+    from app.rate_budget import ip_rate_budget
+    from app.shared import user_context_cache
+    from app.single_flight import single_flight_metrics
+    from app.supervisor import session_supervisor
+
+    registry = registry or metrics_registry
+
+    def sessions_by_state():
+        counts = {}
+        for info in session_supervisor.describe():
+            counts[(info['state'],)] = counts.get((info['state'],), 0) + 1
+        return counts
+
+    def tick_latency():
+        latencies = [info['last_tick_latency'] for info in session_supervisor.describe()
+                     if info['last_tick_latency'] is not None]
+        return {(): max(latencies)} if latencies else {}
+
+    def context_cache(field):
+        return lambda: {(): user_context_cache.stats()[field]}
+
+    def context_cache_hit_ratio():
+        stats = user_context_cache.stats()
+        total = stats['hits'] + stats['misses']
+        return {(): stats['hits'] / total if total else 0.0}
+
+    def read_metric(field):
+        return lambda: {(method,): stats[field] for method, stats in single_flight_metrics().items()}
+
+    def read_hit_ratio():
+        return {
+            (method,): (stats['hits'] + stats['shared']) / stats['requests'] if stats['requests'] else 0.0
+            for method, stats in single_flight_metrics().items()
+        }
+
+    registry.gauge('trading_sessions', 'Сессии автоторговли по состояниям', sessions_by_state, ('state',))
+    registry.gauge('trading_session_tick_latency_max_seconds',
+                   'Наибольшая задержка обработки котировки среди сессий', tick_latency)
+    registry.gauge('user_context_cache_size', 'Контекстов пользователей в кэше', context_cache('size'))
+    registry.gauge('user_context_cache_hits_total', 'Попадания в кэш контекстов', context_cache('hits'), type='counter')
+    registry.gauge('user_context_cache_misses_total', 'Промахи кэша контекстов', context_cache('misses'), type='counter')
+    registry.gauge('user_context_cache_evictions_total', 'Вытеснения из кэша контекстов',
+                   context_cache('evictions'), type='counter')
+    registry.gauge('user_context_cache_hit_ratio', 'Доля попаданий в кэш контекстов', context_cache_hit_ratio)
+    registry.gauge('exchange_reads_total', 'Обращения к чтениям с биржи', read_metric('requests'), ('method',), 'counter')
+    registry.gauge('exchange_read_cache_hits_total', 'Чтения, отданные из кэша', read_metric('hits'), ('method',), 'counter')
+    registry.gauge('exchange_read_shared_total', 'Чтения, объединенные с выполнявшимся запросом',
+                   read_metric('shared'), ('method',), 'counter')
+    registry.gauge('exchange_read_hit_ratio', 'Доля чтений без отдельного запроса к бирже', read_hit_ratio, ('method',))
+    registry.gauge('exchange_ip_budget_pending', 'Запросы, ожидающие общий лимит IP, по приоритетам',
+                   lambda: {(str(priority),): count for priority, count in ip_rate_budget.pending().items()},
+                   ('priority',))
+    registry.gauge('event_loop_lag_last_seconds', 'Последний замер лага цикла событий',
+                   lambda: {(): loop_lag_monitor.last_lag})
+
+
+def metrics_summary() -> str:
+    """Краткая сводка метрик для администратора в Telegram."""
+
+    def ms(value):
+        return '—' if value is None else ('>30 с' if value == float('inf') else f"≤{value * 1000:g} мс")
+
+    def describe(histogram: Histogram, title: str, limit: int = 15) -> list:
+        snapshot = histogram.snapshot()
+        if not snapshot:
+            return []
+        lines = [title]
+        ordered = sorted(snapshot.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        for labels, (_, total, count) in ordered:
+            name = ' '.join(str(label) for label in labels) or 'все'
+            lines.append(
+                f"{name}: n={count}, ср {total / count * 1000:.1f} мс, "
+                f"p50 {ms(histogram.quantile(0.5, *labels))}, p99 {ms(histogram.quantile(0.99, *labels))}"
+            )
+        return lines
+
+    lines = []
+    lines += describe(handler_latency, 'Команды:')
+    lines += describe(exchange_latency, '\nЗапросы к бирже:')
+    lines += describe(db_latency, '\nЗапросы к базе:')
+    lines += describe(db_wait, '\nОжидание потока базы:')
+    lines += describe(loop_lag, '\nЛаг цикла событий:')
+    lines.append(f"Последний лаг: {loop_lag_monitor.last_lag * 1000:.1f} мс")
+    return '\n'.join(lines)
+
+
+# Глобальные монитор лага цикла событий и HTTP-сервер метрик
+loop_lag_monitor = LoopLagMonitor()
+metrics_server = MetricsServer()
@@ -0,0 +1,46 @@
+# app/notifier.py
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessage:
+    """Отправка сообщений в чат пользователя с тем же интерфейсом, что и у update.message."""
+
+    def __init__(self, bot, chat_id: int):
+        self.bot = bot
+        self.chat_id = chat_id
+
+    async def reply_text(self, text: str, **kwargs):
+        return await self.bot.send_message(chat_id=self.chat_id, text=text, **kwargs)
+
+
+class ChatIdentity:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class SessionUpdate:
+    """
+    Замена telegram.Update для сессий, запущенных без входящего сообщения
+    (например, восстановленных после перезапуска). Предоставляет только то, что
+    использует торговая логика: effective_user, effective_chat и message.reply_text.
+    """
+
+    def __init__(self, bot, user_id: int, chat_id: int):
+        self.effective_user = ChatIdentity(user_id)
+        self.effective_chat = ChatIdentity(chat_id)
+        self.message = ChatMessage(bot, chat_id)
+
+
+async def notify(update, text: str, **kwargs):
+    """
+    Уведомление пользователя из торговой сессии. Ошибка отправки (сеть, блокировка
+    бота пользователем, лимиты Telegram) только записывается в лог и не прерывает торговлю.
+    """
+    try:
+        return await update.message.reply_text(text, **kwargs)
+    except Exception as e:
+        logger.warning(f"Не удалось отправить уведомление пользователю {update.effective_user.id}: {e}")
+        return None
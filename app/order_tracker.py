@@ -0,0 +1,164 @@
+# app/order_tracker.py
+
+import asyncio
+import time
+from app.market_data import market_data_hub
+from config.config import ORDER_POLL_MIN_INTERVAL, ORDER_POLL_MAX_INTERVAL
+from config.logging_config import logger
+
+
+class TrackedOrder:
+    def __init__(self, order_id: str, symbol: str, side: str, price: float):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.side = side
+        self.price = price
+        self.future = asyncio.get_running_loop().create_future()
+
+    def price_reached(self, last_price) -> bool:
+        """Проверяет, дошла ли рыночная цена до лимитной цены ордера."""
+        if last_price is None or self.price is None:
+            return False
+        if self.side == 'sell':
+            return last_price >= self.price
+        return last_price <= self.price
+
+
+class UserOrders:
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.orders = {}  # order_id -> TrackedOrder
+        self.interval = ORDER_POLL_MIN_INTERVAL
+        self.next_poll = 0.0
+
+
+class OrderTracker:
+    """
+    Отслеживание исполнения ордеров всех пользователей одним циклом.
+
+    Для каждого ордера создается asyncio.Future, который разрешается данными
+    ордера, когда биржа сообщает о его исполнении или отмене. Один цикл опрашивает
+    open orders всех пользователей; интервал опроса пользователя растет от
+    min_interval до max_interval, пока ничего не меняется. Если цена из общего
+    потока котировок дошла до лимитной цены ордера, пользователь опрашивается
+    сразу - так исполнение замечается примерно за секунду без частых запросов.
+    """
+
+    def __init__(self, min_interval: float = ORDER_POLL_MIN_INTERVAL, max_interval: float = ORDER_POLL_MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._users = {}  # user_id -> UserOrders
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self.polls = 0  # Число запросов к бирже
+
+    def track(self, user_id: int, adapter, order_id: str, symbol: str, side: str = 'sell', price: float = None) -> asyncio.Future:
+        """Начинает отслеживать ордер и возвращает Future с данными исполненного ордера."""
+        user_orders = self._users.get(user_id)
+        if user_orders is None:
+            user_orders = UserOrders(adapter)
+            self._users[user_id] = user_orders
+        user_orders.adapter = adapter
+        tracked = TrackedOrder(str(order_id), symbol, side, price)
+        user_orders.orders[tracked.order_id] = tracked
+        # Новый ордер проверяем часто, пока он свежий
+        user_orders.interval = self.min_interval
+        user_orders.next_poll = time.monotonic() + self.min_interval
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        return tracked.future
+
+    def untrack(self, user_id: int, order_id: str):
+        user_orders = self._users.get(user_id)
+        if user_orders is None:
+            return
+        tracked = user_orders.orders.pop(str(order_id), None)
+        if tracked and not tracked.future.done():
+            tracked.future.cancel()
+        if not user_orders.orders:
+            del self._users[user_id]
+
+    def untrack_user(self, user_id: int):
+        user_orders = self._users.get(user_id)
+        if user_orders is None:
+            return
+        for order_id in list(user_orders.orders):
+            self.untrack(user_id, order_id)
+
+    def tracked_count(self) -> int:
+        return sum(len(user_orders.orders) for user_orders in self._users.values())
+
+    def _is_due(self, user_orders: UserOrders, now: float) -> bool:
+        if now >= user_orders.next_poll:
+            return True
+        for tracked in user_orders.orders.values():
+            ticker = market_data_hub.last_ticker(tracked.symbol)
+            if ticker and tracked.price_reached(ticker.get('last')):
+                return True
+        return False
+
+    async def _run(self):
+        while self._users:
+            now = time.monotonic()
+            due = [(user_id, user_orders) for user_id, user_orders in self._users.items() if self._is_due(user_orders, now)]
+            if due:
+                await asyncio.gather(*(self._poll_user(user_id, user_orders) for user_id, user_orders in due))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.min_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_user(self, user_id: int, user_orders: UserOrders):
+        changed = False
+        # Ордера, ожидание которых отменила сессия, больше не опрашиваем
+        for order_id in [order_id for order_id, tracked in user_orders.orders.items() if tracked.future.cancelled()]:
+            del user_orders.orders[order_id]
+        symbols = {tracked.symbol for tracked in user_orders.orders.values()}
+        for symbol in symbols:
+            try:
+                open_orders = await user_orders.adapter.fetch_open_orders(symbol)
+                self.polls += 1
+            except Exception as e:
+                logger.error(f"Ошибка при проверке открытых ордеров пользователя {user_id}: {e}")
+                continue
+            open_ids = {str(order['id']) for order in open_orders}
+            for tracked in list(user_orders.orders.values()):
+                if tracked.symbol != symbol or tracked.order_id in open_ids:
+                    continue
+                # Ордера нет среди открытых: уточняем итоговый статус
+                try:
+                    order = await user_orders.adapter.fetch_order(tracked.order_id, symbol)
+                    self.polls += 1
+                except Exception as e:
+                    logger.error(f"Ошибка при получении ордера {tracked.order_id} пользователя {user_id}: {e}")
+                    continue
+                if order.get('status') in ('closed', 'canceled', 'expired', 'rejected'):
+                    logger.info(f"Ордер {tracked.order_id} пользователя {user_id} завершен со статусом {order.get('status')}")
+                    user_orders.orders.pop(tracked.order_id, None)
+                    if not tracked.future.done():
+                        tracked.future.set_result(order)
+                    changed = True
+
+        if not user_orders.orders:
+            if self._users.get(user_id) is user_orders:
+                del self._users[user_id]
+            return
+        user_orders.interval = self.min_interval if changed else min(user_orders.interval * 2, self.max_interval)
+        user_orders.next_poll = time.monotonic() + user_orders.interval
+
+    async def stop(self):
+        for user_id in list(self._users):
+            self.untrack_user(user_id)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Глобальный трекер ордеров
+order_tracker = OrderTracker()
@@ -0,0 +1,131 @@
+# app/param_sweep.py
+
+import csv
+import heapq
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+from app.backtesting import BacktestParams, Candles, run_backtest
+
+# Столбцы свечей, которые сохраняются в отдельные файлы для memmap
+CANDLE_FIELDS = ('timestamp', 'open', 'high', 'low', 'close')
+
+# Столбцы файла результатов перебора
+RESULT_COLUMNS = (
+    'profit_percentage', 'fall_percentage', 'delay_seconds', 'order_size',
+    'total_profit', 'realized_profit', 'buys', 'sells', 'cycles', 'open_levels',
+    'max_drawdown', 'max_drawdown_percent', 'max_capital_used', 'final_equity',
+)
+
+# Свечи, открытые в процессе-воркере (заполняется в _init_worker)
+_worker_candles = None
+
+
+def parse_range(text: str) -> list:
+    """
+    Разбирает значения параметра: "0.3" - одно значение, "0.2,0.5,1" - список,
+    "0.2:1:0.1" - диапазон start:stop:step включительно.
+    """
+    if ':' in text:
+        start, stop, step = (float(part) for part in text.split(':'))
+        if step <= 0:
+            raise ValueError(f"Шаг диапазона должен быть положительным: {text}")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + step * index, 10) for index in range(max(count, 0))]
+    return [float(part) for part in text.split(',') if part.strip()]
+
+
+def save_candles(candles: Candles, directory: str):
+    """Сохраняет столбцы свечей в .npy файлы, которые воркеры открывают через memmap."""
+    for field in CANDLE_FIELDS:
+        np.save(os.path.join(directory, f"{field}.npy"), getattr(candles, field))
+
+
+def open_candles(directory: str) -> Candles:
+    """Открывает свечи из save_candles() без копирования в память процесса."""
+    columns = {field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode='r') for field in CANDLE_FIELDS}
+    return Candles(**columns)
+
+
+def _init_worker(directory: str):
+    global _worker_candles
+    _worker_candles = open_candles(directory)
+
+
+def _run_point(point: tuple, capital: float, continuous_mode: bool, fee_rate: float) -> dict:
+    profit_percentage, fall_percentage, delay_seconds, order_size = point
+    params = BacktestParams(profit_percentage, fall_percentage, delay_seconds, order_size,
+                            capital, continuous_mode, fee_rate)
+    result = run_backtest(_worker_candles, params)
+    return {
+        'profit_percentage': profit_percentage,
+        'fall_percentage': fall_percentage,
+        'delay_seconds': delay_seconds,
+        'order_size': order_size,
+        'total_profit': round(result.total_profit, 6),
+        'realized_profit': round(result.realized_profit, 6),
+        'buys': result.buys,
+        'sells': result.sells,
+        'cycles': result.cycles,
+        'open_levels': result.open_levels,
+        'max_drawdown': round(result.max_drawdown, 6),
+        'max_drawdown_percent': round(result.max_drawdown_percent, 4),
+        'max_capital_used': round(result.max_capital_used, 6),
+        'final_equity': round(result.final_equity, 6),
+    }
+
+
+def sweep(candles: Candles, output_path: str, profit_values, fall_values, delay_values, order_size_values,
+          capital: float = 1000.0, continuous_mode: bool = False, fee_rate: float = 0.0,
+          workers: int = None, top: int = 10, progress=None) -> list:
+    """
+    Прогоняет бэктест по декартову произведению параметров на всех ядрах.
+
+    Свечи один раз сохраняются во временные .npy файлы; каждый воркер открывает
+    их через memmap, поэтому ряд цен не копируется и не передается в задачах.
+    Результаты дописываются в CSV output_path по мере готовности, в памяти
+    хранятся только top лучших по итоговой прибыли, которые и возвращаются.
+    """
+    points = itertools.product(profit_values, fall_values, delay_values, order_size_values)
+    total = len(profit_values) * len(fall_values) * len(delay_values) * len(order_size_values)
+    workers = workers or os.cpu_count() or 1
+    best = []  # Куча (прибыль, номер, строка) лучших результатов
+    done = 0
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix='sweep_') as directory, open(output_path, 'w', newline='') as f:
+        save_candles(candles, directory)
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(directory,)) as executor:
+            pending = set()
+            # В полете держим ограниченное число задач, чтобы не создавать все сразу
+            limit = workers * 4
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < limit:
+                    point = next(points, None)
+                    if point is None:
+                        exhausted = True
+                        break
+                    pending.add(executor.submit(_run_point, point, capital, continuous_mode, fee_rate))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    row = future.result()
+                    writer.writerow(row)
+                    done += 1
+                    entry = (row['total_profit'], done, row)
+                    if len(best) < top:
+                        heapq.heappush(best, entry)
+                    else:
+                        heapq.heappushpop(best, entry)
+                f.flush()
+                if progress is not None:
+                    progress(done, total, time.perf_counter() - started)
+
+    return [row for _, _, row in sorted(best, key=lambda entry: entry[0], reverse=True)]
@@ -4,6 +4,7 @@ from telegram import Update
 from telegram.ext import CommandHandler, ContextTypes
 import logging
 from app.shared import get_user_context  # Импортируем get_user_context
+from app.database import run_db
 from config.logging_config import logger
 
 # Настройка логирования
@@ -18,11 +19,11 @@ async def profit_today(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     logger.info(f"Команда /profit_today вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     try:
         # Вычисляем профит за сегодня
-        profit = user_context.calculate_profit_today()
+        profit = await run_db(user_context.calculate_profit_today)
         await update.message.reply_text(f'Ваш профит за сегодня: ${profit:.2f}')
     
     except Exception as e:
@@ -35,7 +36,7 @@ async def profit_history(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     logger.info(f"Команда /profit_history вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     if len(context.args) != 1:
         await update.message.reply_text('Использование: /profit_history <дни>')
@@ -46,9 +47,13 @@ async def profit_history(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         if days <= 0:
             raise ValueError("Количество дней должно быть положительным числом.")
         
-        # Вычисляем профит за указанный период
-        profit = user_context.calculate_profit_period(days)
-        await update.message.reply_text(f'Ваш профит за последние {days} дней: ${profit:.2f}')
+        # Вычисляем профит за указанный период и разбивку по дням
+        profit = await run_db(user_context.calculate_profit_period, days)
+        daily_profit = await run_db(user_context.calculate_daily_profit, days)
+        reply = f'Ваш профит за последние {days} дней: ${profit:.2f}'
+        if daily_profit:
+            reply += '\n\nПо дням (UTC):\n' + '\n'.join(f'{day}: ${day_profit:.2f}' for day, day_profit in daily_profit[:31])
+        await update.message.reply_text(reply)
     
     except ValueError as e:
         logger.error(f"Ошибка валидации периода для пользователя {user_id}: {e}")
@@ -63,11 +68,11 @@ async def profit_month(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     logger.info(f"Команда /profit_month вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     try:
         # Вычисляем профит за последний месяц
-        profit = user_context.calculate_profit_month()
+        profit = await run_db(user_context.calculate_profit_month)
         await update.message.reply_text(f'Ваш профит за последний месяц: ${profit:.2f}')
     
     except Exception as e:
@@ -80,12 +85,20 @@ async def profit_total(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     logger.info(f"Команда /profit_total вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     try:
-        # Вычисляем общий профит
-        profit = user_context.calculate_profit_total()
-        await update.message.reply_text(f'Ваш общий профит: ${profit:.2f}')
+        # Вычисляем общий профит вместе с профитом за день и месяц одним запросом
+        summary = await run_db(user_context.calculate_profit_summary)
+        reply = (
+            f'Ваш общий профит: ${summary["total"]:.2f}\n'
+            f'За сегодня: ${summary["today"]:.2f}\n'
+            f'За последний месяц: ${summary["month"]:.2f}'
+        )
+        by_symbol = await run_db(user_context.calculate_profit_by_symbol)
+        if len(by_symbol) > 1:
+            reply += '\n\nПо парам:\n' + '\n'.join(f'{symbol}: ${profit:.2f}' for symbol, profit in sorted(by_symbol.items()))
+        await update.message.reply_text(reply)
     
     except Exception as e:
         logger.error(f"Ошибка при расчете общего профита для пользователя {user_id}: {e}")
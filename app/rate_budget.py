@@ -0,0 +1,103 @@
+# app/rate_budget.py
+
+import asyncio
+import time
+from collections import deque
+from config.config import USER_RATE_LIMIT, USER_RATE_BURST, IP_RATE_LIMIT, IP_RATE_BURST
+
+# Приоритеты запросов к бирже (меньше - важнее)
+PRIORITY_ORDER = 0  # Создание и отмена ордеров
+PRIORITY_TRACK = 1  # Проверка статуса ордеров
+PRIORITY_READ = 2   # Баланс, котировки, рынки
+PRIORITIES = (PRIORITY_ORDER, PRIORITY_TRACK, PRIORITY_READ)
+
+
+class RateBudget:
+    """
+    Token bucket с приоритетами и честным разделением между ключами.
+
+    Бюджет - rate запросов в секунду с запасом burst. Пока запас есть и никто не
+    ждет, запрос выполняется сразу. Иначе запрос встает в очередь своего
+    приоритета: освободившийся токен получает самый важный ожидающий запрос
+    (ордера раньше чтений), а внутри приоритета токены раздаются по кругу между
+    ключами (торговыми парами), чтобы активная пара не заняла весь бюджет.
+
+    Ожидающие запросы будит фоновая задача-диспетчер (_dispatch). Она создается
+    первым запросом, которому пришлось встать в очередь, раздает токены по мере
+    их пополнения и завершается, когда очереди пусты.
+    """
+
+    def __init__(self, rate: float = USER_RATE_LIMIT, burst: float = USER_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._queues = {priority: {} for priority in PRIORITIES}  # приоритет -> ключ -> deque Future
+        self._order = {priority: deque() for priority in PRIORITIES}  # приоритет -> порядок обхода ключей
+        self._dispatcher = None
+        self.waited = 0  # Число запросов, которым пришлось ждать
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _has_waiters(self, max_priority: int) -> bool:
+        return any(self._order[priority] for priority in PRIORITIES if priority <= max_priority)
+
+    async def acquire(self, key: str = '*', priority: int = PRIORITY_READ):
+        """Ждет разрешения на один запрос."""
+        self._refill()
+        if self._tokens >= 1 and not self._has_waiters(priority):
+            self._tokens -= 1
+            return
+        self.waited += 1
+        future = asyncio.get_running_loop().create_future()
+        queues = self._queues[priority]
+        queue = queues.get(key)
+        if queue is None:
+            queue = queues[key] = deque()
+            self._order[priority].append(key)
+        queue.append(future)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    def _next_waiter(self):
+        for priority in PRIORITIES:
+            order = self._order[priority]
+            if not order:
+                continue
+            key = order.popleft()
+            queues = self._queues[priority]
+            queue = queues[key]
+            future = queue.popleft()
+            if queue:
+                order.append(key)  # Ключ встает в конец круга
+            else:
+                del queues[key]
+            return future
+        return None
+
+    async def _dispatch(self):
+        """
+        Раздает токены ожидающим: спит до пополнения очередного токена и отдает его
+        следующему по приоритету и кругу ключей. Отмененное ожидание токен не расходует.
+        """
+        while self._has_waiters(PRIORITY_READ):
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            future = self._next_waiter()
+            if future is not None and not future.done():  # Ожидание могло быть отменено
+                self._tokens -= 1
+                future.set_result(None)
+
+    def pending(self) -> dict:
+        """Число ожидающих запросов по приоритетам."""
+        return {priority: sum(len(queue) for queue in self._queues[priority].values()) for priority in PRIORITIES}
+
+
+# Общий бюджет запросов с IP-адреса бота: через него проходят все вызовы биржи
+ip_rate_budget = RateBudget(IP_RATE_LIMIT, IP_RATE_BURST)
@@ -0,0 +1,86 @@
+# app/session_store.py
+
+import json
+from datetime import datetime
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.database import TradingSession, db_session, run_db
+from config.logging_config import logger
+
+
+class StoredSession:
+    """Сохраненная сессия автоторговли, прочитанная из базы при запуске."""
+
+    def __init__(self, user_id: int, symbol: str, chat_id: int, state: dict):
+        self.user_id = user_id
+        self.symbol = symbol
+        self.chat_id = chat_id
+        self.state = state
+
+
+class SessionStore:
+    """
+    Надежное хранилище состояния сессий автоторговли.
+
+    Строка в trading_sessions существует, пока сессия активна. Сессия записывает
+    контрольную точку после каждого изменения состояния (покупка уровня,
+    исполнение take-profit, смена цикла) и дожидается записи, поэтому после падения
+    процесса теряется не больше одного незаписанного перехода. Запись выполняется
+    в потоке db_executor и не блокирует цикл событий.
+    """
+
+    async def save(self, user_id: int, symbol: str, chat_id: int, state: dict):
+        """Записывает контрольную точку сессии."""
+        try:
+            await run_db(write_session, user_id, symbol, chat_id, json.dumps(state))
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояния сессии {user_id} {symbol}: {e}")
+
+    async def remove(self, user_id: int, symbol: str):
+        """Удаляет сессию, завершенную пользователем или из-за ошибки."""
+        try:
+            await run_db(delete_session, user_id, symbol)
+        except Exception as e:
+            logger.error(f"Ошибка при удалении состояния сессии {user_id} {symbol}: {e}")
+
+    async def load_all(self) -> list:
+        """Возвращает все сохраненные сессии."""
+        return await run_db(read_sessions)
+
+
+def write_session(user_id: int, symbol: str, chat_id: int, state: str):
+    statement = sqlite_insert(TradingSession).values(
+        user_id=user_id, symbol=symbol, chat_id=chat_id, state=state, updated_at=datetime.utcnow()
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id', 'symbol'],
+        set_={'chat_id': statement.excluded.chat_id, 'state': statement.excluded.state,
+              'updated_at': statement.excluded.updated_at}
+    )
+    with db_session() as session:
+        session.execute(statement)
+        session.commit()
+
+
+def delete_session(user_id: int, symbol: str):
+    with db_session() as session:
+        session.execute(delete(TradingSession).where(
+            TradingSession.user_id == user_id, TradingSession.symbol == symbol
+        ))
+        session.commit()
+
+
+def read_sessions() -> list:
+    with db_session() as session:
+        rows = session.execute(select(TradingSession)).scalars().all()
+        sessions = []
+        for row in rows:
+            try:
+                sessions.append(StoredSession(row.user_id, row.symbol, row.chat_id, json.loads(row.state)))
+            except (TypeError, ValueError) as e:
+                logger.error(f"Поврежденное состояние сессии {row.user_id} {row.symbol}: {e}")
+        return sessions
+
+
+# Глобальное хранилище сессий
+session_store = SessionStore()
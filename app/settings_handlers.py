@@ -3,7 +3,9 @@
 from telegram import Update
 from telegram.ext import CommandHandler, ContextTypes
 import logging
-from app.shared import get_user_context, bot_state_manager  # Импортируем get_user_context
+from app.shared import get_user_context  # Импортируем get_user_context
+from app.supervisor import session_supervisor
+from app.client_pool import exchange_client_pool
 from config.logging_config import logger
 
 # Настройка логирования
@@ -29,7 +31,7 @@ async def set_params(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     logger.info(f"Команда /set_params вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     # Формируем сообщение с текущими параметрами
     current_params_message = (
@@ -68,7 +70,7 @@ async def set_params(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         
         # Устанавливаем новые параметры
         user_context.bot_params.set_params(profit_percentage, fall_percentage, delay_seconds, order_size)
-        user_context.save_user_params()  # Сохраняем изменения в базе данных
+        user_context.save_user_params()  # Изменения будут записаны в базу в фоне
         
         logger.info(f"Параметры успешно сохранены для пользователя {user_id}.")
         
@@ -101,6 +103,32 @@ async def set_params(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         logger.error(f"Ошибка преобразования параметров для пользователя {user_id}: {e}")
         await update.message.reply_text(f'Ошибка: все параметры должны быть числами.\n{current_params_message}')
 
+# Команда /set_continuous
+async def set_continuous(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+    logger.info(f"Команда /set_continuous вызвана пользователем {user_id}")
+    
+    # Получаем контекст пользователя
+    user_context = await get_user_context(user_id)
+    current_mode = 'включен' if user_context.bot_params.continuous_mode else 'выключен'
+    
+    if len(context.args) != 1 or context.args[0].lower() not in ('on', 'off'):
+        await update.message.reply_text(
+            f'Непрерывный режим сейчас {current_mode}.\n'
+            f'Использование: /set_continuous <on|off>\n'
+            f'В непрерывном режиме после закрытия всех уровней сразу начинается новый цикл.'
+        )
+        return
+    
+    user_context.bot_params.continuous_mode = context.args[0].lower() == 'on'
+    user_context.save_user_params()  # Изменения будут записаны в базу в фоне
+    
+    logger.info(f"Непрерывный режим для пользователя {user_id}: {user_context.bot_params.continuous_mode}")
+    if user_context.bot_params.continuous_mode:
+        await update.message.reply_text('✅ Непрерывный режим включен: новый цикл начнется сразу после закрытия всех уровней.')
+    else:
+        await update.message.reply_text('✅ Непрерывный режим выключен: после цикла автоторговля будет ждать /stop.')
+
 # Команда /set_api_keys
 async def set_api_keys(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
@@ -115,11 +143,12 @@ async def set_api_keys(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     
     try:
         # Получаем контекст пользователя
-        user_context = get_user_context(user_id)
+        user_context = await get_user_context(user_id)
         
         # Устанавливаем API-ключи
         user_context.set_api_credentials(api_key, api_secret)
-        user_context.save_user_params()  # Сохраняем изменения в базе данных
+        user_context.save_user_params()  # Изменения будут записаны в базу в фоне
+        exchange_client_pool.invalidate(user_id)  # Клиент со старыми ключами больше не нужен
         
         logger.info(f"API-ключи успешно сохранены для пользователя {user_id}.")
         
@@ -138,7 +167,7 @@ async def check_api_keys(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     logger.info(f"Команда /check_api_keys вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     if user_context.api_key and user_context.api_secret:
         logger.info(f"API-ключи успешно загружены для пользователя {user_id}.")
@@ -153,7 +182,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"Команда /stats вызвана пользователем {user_id}")
     
     # Получаем контекст пользователя
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
     
     reply = (
         f"Статистика торговли для пользователя {user_id}:\n"
@@ -161,6 +190,10 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         f"Выполненные покупки: {list(user_context.buy_executed.keys())}\n"
         f"Текущая цена покупки: ${user_context.bot_params.buy_price or 'Не определена'}\n"
     )
+    for session in session_supervisor.user_sessions(user_id):
+        reply += (f"Сессия {session.symbol}: {session.state}, уровней {user_context.open_levels.get(session.symbol, 0)}, "
+                  f"работает {int(session.uptime // 60)} мин\n")
+
     await update.message.reply_text(reply)
 
 
@@ -171,10 +204,11 @@ async def reset_trading(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user_id = update.effective_user.id
     logger.info(f"Команда /reset_trading вызвана пользователем {user_id}")
 
-    previous_state = bot_state_manager.is_trading_active(user_id)
+    previous_state = session_supervisor.is_active(user_id)
 
     if previous_state:
-        bot_state_manager.stop(user_id)
+        # Останавливаем сессии и дожидаемся их завершения, чтобы можно было сразу запустить новую
+        await session_supervisor.wait_stopped(session_supervisor.stop(user_id), timeout=10)
         logger.info(f"Состояние автоторговли сброшено для пользователя {user_id}")
         await update.message.reply_text("✅ Состояние автоторговли сброшено. Теперь вы можете запустить новую сессию.")
     else:
@@ -1,51 +1,126 @@
 # shared.py
 
-from app.database import User, db_session  # Импортируем User и db_session
+from app.database import User, db_session, run_db  # Импортируем User, db_session и run_db
 from app.contexts import UserContext  # Импортируем UserContext
+from app.supervisor import session_supervisor  # Активные сессии не вытесняются из кэша
+from collections import OrderedDict
+import time
+from config.config import USER_CONTEXT_CACHE_SIZE, USER_CONTEXT_IDLE_TTL
+from config.logging_config import logger
 
-# Глобальный кэш для хранения экземпляров UserContext
-user_context_cache = {}
+class UserContextCache:
+    """
+    Ограниченный кэш контекстов пользователей (LRU + время жизни без обращений).
 
-# Класс для управления состоянием бота
-class BotStateManager:
-    def __init__(self):
-        self.active_users = {}  # Словарь для отслеживания состояния торговли для каждого пользователя
-    
-    def start(self, user_id: int):
-        """Запускает торговлю для указанного пользователя."""
-        self.active_users[user_id] = True
-    
-    def stop(self, user_id: int):
-        """Останавливает торговлю для указанного пользователя."""
-        if user_id in self.active_users:
-            self.active_users[user_id] = False
-    
-    def is_trading_active(self, user_id: int) -> bool:
-        """Проверяет, активна ли торговля для указанного пользователя."""
-        return self.active_users.get(user_id, False)
+    При переполнении вытесняются давно не использовавшиеся контексты, а контексты,
+    к которым не обращались дольше idle_ttl секунд, удаляются при очередном обращении
+    к кэшу. Контексты пользователей с активной торговлей не вытесняются никогда:
+    торговая сессия и команды должны работать с одним и тем же объектом.
+    Вытесненный пользователь загружается из базы заново при следующей команде.
+    """
+
+    def __init__(self, max_size: int = USER_CONTEXT_CACHE_SIZE, idle_ttl: float = USER_CONTEXT_IDLE_TTL, is_pinned=None):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.is_pinned = is_pinned or session_supervisor.is_active
+        self._contexts = OrderedDict()  # user_id -> UserContext, от давно использованных к недавним
+        self._last_used = {}  # user_id -> время последнего обращения
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int):
+        now = time.monotonic()
+        if now - self._last_sweep >= min(self.idle_ttl, 60):
+            self.evict_idle(now)
+        user_context = self._contexts.get(user_id)
+        if user_context is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._contexts.move_to_end(user_id)
+        self._last_used[user_id] = now
+        return user_context
+
+    def put(self, user_id: int, user_context: UserContext) -> UserContext:
+        """Добавляет контекст; если он уже есть в кэше, возвращает существующий."""
+        existing = self._contexts.get(user_id)
+        if existing is not None:
+            return existing
+        self._contexts[user_id] = user_context
+        self._last_used[user_id] = time.monotonic()
+        self._evict_overflow()
+        return user_context
+
+    def _evict(self, user_id: int):
+        del self._contexts[user_id]
+        del self._last_used[user_id]
+        self.evictions += 1
 
-# Глобальный экземпляр BotStateManager
-bot_state_manager = BotStateManager()
+    def _evict_overflow(self):
+        if len(self._contexts) <= self.max_size:
+            return
+        # Идем от давно использованных к недавним, пропуская пользователей с активной торговлей
+        for user_id in list(self._contexts):
+            if len(self._contexts) <= self.max_size:
+                break
+            if not self.is_pinned(user_id):
+                self._evict(user_id)
+
+    def evict_idle(self, now: float = None):
+        """Удаляет контексты, не использовавшиеся дольше idle_ttl секунд."""
+        now = time.monotonic() if now is None else now
+        self._last_sweep = now
+        evicted = 0
+        for user_id in list(self._contexts):
+            if now - self._last_used[user_id] < self.idle_ttl:
+                break  # Дальше идут контексты, использованные позже
+            if not self.is_pinned(user_id):
+                self._evict(user_id)
+                evicted += 1
+        if evicted:
+            logger.info(f"Из кэша удалено неиспользуемых контекстов: {evicted}. Осталось: {len(self._contexts)}")
+
+    def invalidate(self, user_id: int):
+        if user_id in self._contexts:
+            self._evict(user_id)
+
+    def stats(self) -> dict:
+        return {'size': len(self._contexts), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def __contains__(self, user_id: int):
+        return user_id in self._contexts
+
+    def __len__(self):
+        return len(self._contexts)
+
+# Глобальный кэш контекстов пользователей
+user_context_cache = UserContextCache()
+
+# Загрузка контекста пользователя из базы за один запрос (новый пользователь создается в той же транзакции)
+def load_user_context(user_id: int) -> 'UserContext':
+    with db_session() as session:
+        user = session.get(User, user_id)
+        if not user:
+            user = User(id=user_id)
+            session.add(user)
+            session.commit()  # Значения по умолчанию заполняются при вставке
+        return UserContext(user_id, user)
 
 # Функция для получения или создания контекста пользователя
-def get_user_context(user_id: int) -> 'UserContext':
+async def get_user_context(user_id: int) -> 'UserContext':
     """
     Получает или создает контекст пользователя с использованием кэша.
+    Загрузка из базы выполняется в потоке db_executor и не блокирует цикл событий.
     
     :param user_id: Уникальный идентификатор пользователя.
     :return: Экземпляр UserContext.
     """
-    global user_context_cache
-    
-    # Проверяем, есть ли контекст пользователя в кэше
-    if user_id not in user_context_cache:
-        # Если нет, создаем новый экземпляр UserContext
-        with db_session() as session:
-            user = session.query(User).filter_by(id=user_id).first()
-            if not user:
-                user = User(id=user_id)
-                session.add(user)
-                session.commit()
-        user_context_cache[user_id] = UserContext(user_id)
+    user_context = user_context_cache.get(user_id)
+    if user_context is None:
+        user_context = await run_db(load_user_context, user_id)
+        # Пока контекст загружался, его мог загрузить параллельный запрос
+        user_context = user_context_cache.put(user_id, user_context)
     
-    return user_context_cache[user_id]
\ No newline at end of file
+    return user_context
@@ -0,0 +1,87 @@
+# app/single_flight.py
+
+import asyncio
+import time
+from config.config import READ_CACHE_TTL
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0  # Обращения к чтению
+        self.hits = 0      # Ответы из кэша
+        self.shared = 0    # Ответы чужого запроса, выполнявшегося в тот момент
+
+    @property
+    def calls(self) -> int:
+        """Число реальных запросов к бирже."""
+        return self.requests - self.hits - self.shared
+
+
+# Статистика по методам биржи, общая для всех клиентов
+endpoint_stats = {}  # метод -> EndpointStats
+
+
+def single_flight_metrics() -> dict:
+    """Статистика объединения чтений по методам биржи."""
+    return {
+        method: {'requests': stats.requests, 'hits': stats.hits, 'shared': stats.shared, 'calls': stats.calls}
+        for method, stats in endpoint_stats.items()
+    }
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых чтений одного клиента.
+
+    Пока запрос с теми же аргументами выполняется, новые вызовы ждут его Future,
+    а не отправляют свой запрос. Готовый результат хранится ttl секунд,
+    заданных для метода в READ_CACHE_TTL (0 - не кэшировать), и отдается без
+    обращения к бирже.
+    """
+
+    def __init__(self, ttls: dict = None):
+        self.ttls = READ_CACHE_TTL if ttls is None else ttls
+        self._inflight = {}  # ключ -> задача запроса
+        self._cache = {}  # ключ -> (время истечения, результат)
+
+    async def do(self, method: str, args: tuple, request):
+        """Возвращает результат чтения method(*args); request() выполняет настоящий запрос."""
+        stats = endpoint_stats.get(method)
+        if stats is None:
+            stats = endpoint_stats[method] = EndpointStats()
+        stats.requests += 1
+        key = (method, repr(args))
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                stats.hits += 1
+                return cached[1]
+            del self._cache[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(request())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._complete(method, key, done))
+        else:
+            stats.shared += 1
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    def _complete(self, method: str, key, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        # Исключение забирается всегда: если все ожидающие отменены, иначе asyncio
+        # выведет "Task exception was never retrieved"
+        if task.exception() is not None:
+            return
+        ttl = self.ttls.get(method, 0)
+        if ttl > 0:
+            self._cache[key] = (time.monotonic() + ttl, task.result())
+
+    def invalidate(self, *methods: str):
+        """Сбрасывает кэш указанных методов (после изменений на счете)."""
+        for key in [key for key in self._cache if key[0] in methods]:
+            del self._cache[key]
@@ -0,0 +1,189 @@
+# app/supervisor.py
+
+import asyncio
+import time
+from config.config import SHUTDOWN_DEADLINE
+from config.logging_config import logger
+
+# Состояния сессии автоторговли
+STARTING = 'starting'
+RUNNING = 'running'
+STOPPING = 'stopping'
+STOPPED = 'stopped'
+
+# Причины остановки сессии
+STOP_BY_USER = 'user'          # /stop: сессия завершается, ее состояние удаляется
+STOP_BY_SHUTDOWN = 'shutdown'  # Остановка бота: состояние сохраняется для восстановления
+
+
+class SessionAlreadyRunning(RuntimeError):
+    pass
+
+
+class CancellationToken:
+    """Сигнал остановки сессии: сессия проверяет его и завершается сама."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self.reason = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = STOP_BY_USER):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+
+
+class SupervisedSession:
+    """Одна сессия автоторговли (пользователь + пара) и ее состояние."""
+
+    def __init__(self, user_id: int, symbol: str):
+        self.user_id = user_id
+        self.symbol = symbol
+        self.token = CancellationToken()
+        self.task = None
+        self.state = STARTING
+        self.started_at = time.monotonic()
+        self.last_tick_at = None
+        self.last_tick_latency = None  # Задержка обработки последней котировки, сек
+
+    def set_running(self):
+        if self.state == STARTING:
+            self.state = RUNNING
+
+    def record_tick(self, latency: float):
+        self.last_tick_at = time.monotonic()
+        self.last_tick_latency = latency
+
+    @property
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def active(self) -> bool:
+        return self.state != STOPPED
+
+
+class SessionSupervisor:
+    """
+    Владелец всех задач автоторговли с машиной состояний сессии:
+    starting -> running -> stopping -> stopped.
+
+    На каждую пару (пользователь, символ) допускается не больше одной живой
+    задачи. Остановка выставляет токен сессии, который основной цикл ждет вместе
+    с котировками и исполнениями, поэтому сессия завершается сразу. Сессия,
+    которая еще запускается, отменяется через task.cancel(); покупка уровня при
+    этом доводится до конца (run_to_completion в торговой логике). При остановке бота
+    shutdown() останавливает все сессии и ждет их параллельно не дольше deadline
+    секунд, после чего отменяет оставшиеся задачи.
+    """
+
+    def __init__(self, deadline: float = SHUTDOWN_DEADLINE):
+        self.deadline = deadline
+        self._sessions = {}  # (user_id, symbol) -> SupervisedSession
+        self.shutting_down = False
+
+    def start(self, user_id: int, symbol: str, session_factory) -> SupervisedSession:
+        """
+        Запускает сессию. session_factory(session) должна вернуть корутину сессии.
+        """
+        if self.shutting_down:
+            raise RuntimeError("Бот останавливается, новые сессии не запускаются.")
+        key = (user_id, symbol)
+        existing = self._sessions.get(key)
+        if existing is not None and existing.active:
+            raise SessionAlreadyRunning(f"Сессия {symbol} пользователя {user_id} уже {existing.state}")
+        session = SupervisedSession(user_id, symbol)
+        self._sessions[key] = session
+        session.task = asyncio.create_task(session_factory(session))
+        session.task.add_done_callback(lambda _: self._finish(key, session))
+        logger.info(f"Сессия {symbol} пользователя {user_id} запущена. Активных сессий: {len(self._sessions)}")
+        return session
+
+    def _finish(self, key, session: SupervisedSession):
+        session.state = STOPPED
+        if self._sessions.get(key) is session:
+            del self._sessions[key]
+
+    def _stop_session(self, session: SupervisedSession, reason: str):
+        if not session.active:
+            return
+        starting = session.state == STARTING
+        session.state = STOPPING
+        session.token.cancel(reason)
+        if starting:
+            # Сессия еще не вошла в основной цикл и может ждать биржу: отменяем задачу.
+            # Начатая покупка уровня защищена от отмены и завершается до выхода из сессии
+            session.task.cancel()
+
+    def stop(self, user_id: int, symbol: str = None, reason: str = STOP_BY_USER) -> list:
+        """Останавливает сессии пользователя (все или по одной паре) и возвращает их."""
+        sessions = [session for session in self.user_sessions(user_id) if symbol is None or session.symbol == symbol]
+        for session in sessions:
+            self._stop_session(session, reason)
+        return sessions
+
+    async def wait_stopped(self, sessions: list, timeout: float = None) -> bool:
+        """Ждет завершения задач указанных сессий."""
+        tasks = [session.task for session in sessions if not session.task.done()]
+        if not tasks:
+            return True
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        return not pending
+
+    def get(self, user_id: int, symbol: str):
+        return self._sessions.get((user_id, symbol))
+
+    def user_sessions(self, user_id: int) -> list:
+        return [session for (session_user, _), session in self._sessions.items() if session_user == user_id]
+
+    def is_active(self, user_id: int, symbol: str = None) -> bool:
+        """Есть ли у пользователя незавершенная сессия (по паре или любая)."""
+        return any(session.active for session in self.user_sessions(user_id)
+                   if symbol is None or session.symbol == symbol)
+
+    def sessions(self) -> list:
+        return list(self._sessions.values())
+
+    def describe(self) -> list:
+        """Сведения о сессиях для администратора."""
+        return [
+            {
+                'user_id': session.user_id,
+                'symbol': session.symbol,
+                'state': session.state,
+                'uptime': session.uptime,
+                'last_tick_latency': session.last_tick_latency,
+            }
+            for session in self.sessions()
+        ]
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def shutdown(self):
+        """Останавливает все сессии: сначала по токену, по истечении срока - отменой задач."""
+        self.shutting_down = True
+        sessions = self.sessions()
+        if not sessions:
+            return
+        logger.info(f"Остановка сессий автоторговли: {len(sessions)}")
+        for session in sessions:
+            self._stop_session(session, STOP_BY_SHUTDOWN)
+        _, pending = await asyncio.wait([session.task for session in sessions], timeout=self.deadline)
+        if pending:
+            logger.warning(f"Сессий не завершилось за {self.deadline} с: {len(pending)}, отменяем задачи")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        logger.info("Все сессии автоторговли остановлены.")
+
+
+# Глобальный супервизор сессий
+session_supervisor = SessionSupervisor()
@@ -0,0 +1,186 @@
+# app/trade_journal.py
+
+import asyncio
+from datetime import datetime
+from sqlalchemy import select, insert, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.database import TradeHistory, DailyPnl, db_session, run_db
+from config.config import (
+    TRADE_JOURNAL_BATCH_SIZE,
+    TRADE_JOURNAL_FLUSH_INTERVAL,
+    TRADE_JOURNAL_RETRY_DELAY,
+    TRADE_JOURNAL_RETRY_MAX_DELAY,
+    TRADE_JOURNAL_STOP_RETRIES,
+)
+from config.logging_config import logger
+
+
+class TradeJournal:
+    """
+    Журнал сделок с фоновой пакетной записью в TradeHistory.
+
+    record() только ставит сделку в очередь и сразу возвращает управление.
+    Фоновая задача собирает накопившиеся сделки (до batch_size штук или за
+    flush_interval секунд) и записывает их одной транзакцией в потоке db_executor.
+    Пакет, который не удалось записать, повторяется с растущей задержкой и
+    остается первым в очереди, поэтому порядок сделок сохраняется. Отбрасывается
+    он только при остановке после stop_retries неудачных попыток.
+    """
+
+    def __init__(self, batch_size: int = TRADE_JOURNAL_BATCH_SIZE, flush_interval: float = TRADE_JOURNAL_FLUSH_INTERVAL,
+                 retry_delay: float = TRADE_JOURNAL_RETRY_DELAY, retry_max_delay: float = TRADE_JOURNAL_RETRY_MAX_DELAY,
+                 stop_retries: int = TRADE_JOURNAL_STOP_RETRIES):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.stop_retries = stop_retries
+        self._queue = None
+        self._writer_task = None
+        self._stopping = asyncio.Event()
+        self.written = 0  # Число записанных сделок
+        self.dropped = 0  # Число сделок, отброшенных при остановке
+
+    def _ensure_writer(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writer())
+
+    def record(self, user_id: int, trade_type: str, symbol: str, amount: float, price: float, profit: float = 0.0):
+        """Ставит сделку в очередь на запись."""
+        self._ensure_writer()
+        self._queue.put_nowait({
+            'user_id': user_id,
+            'trade_type': trade_type,
+            'symbol': symbol,
+            'amount': amount,
+            'price': price,
+            'profit': profit,
+            'timestamp': datetime.utcnow(),
+        })
+
+    async def _writer(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Даем накопиться пакету, если в очереди еще нет полного пакета
+            if self._queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write(batch)
+
+    async def _write(self, batch: list):
+        delay = self.retry_delay
+        stop_attempts = 0
+        try:
+            while True:
+                try:
+                    await run_db(write_trades, batch)
+                    self.written += len(batch)
+                    return
+                except Exception as e:
+                    if not self._stopping.is_set():
+                        logger.error(f"Ошибка при записи {len(batch)} сделок в журнал, повтор через {delay} с: {e}")
+                        await self._wait_stopping(delay)
+                        delay = min(delay * 2, self.retry_max_delay)
+                        continue
+                    stop_attempts += 1
+                    if stop_attempts < self.stop_retries:
+                        logger.error(f"Ошибка при записи {len(batch)} сделок в журнал при остановке "
+                                     f"(попытка {stop_attempts} из {self.stop_retries}): {e}")
+                        await asyncio.sleep(self.retry_delay)
+                        continue
+                    self.dropped += len(batch)
+                    logger.error(f"Сделки не записаны в журнал после {stop_attempts} попыток и отброшены: {e}")
+                    for row in batch:
+                        logger.error(f"Отброшенная сделка: {row}")
+                    return
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _wait_stopping(self, delay: float):
+        # Пауза перед повтором прерывается остановкой бота
+        try:
+            await asyncio.wait_for(self._stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def flush(self):
+        """Ожидает записи всех сделок, поставленных в очередь."""
+        if self._queue is not None and self._writer_task is not None and not self._writer_task.done():
+            await self._queue.join()
+
+    async def stop(self):
+        """Записывает оставшиеся сделки и останавливает фоновую задачу."""
+        if self._writer_task is None:
+            return
+        self._stopping.set()
+        await self.flush()
+        self._writer_task.cancel()
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+        self._writer_task = None
+        self._stopping.clear()
+        logger.info(f"Журнал сделок остановлен. Записано сделок: {self.written}, отброшено: {self.dropped}")
+
+
+# Запись пакета сделок одной транзакцией вместе с обновлением дневной сводки
+def write_trades(rows: list):
+    with db_session() as session:
+        session.bulk_insert_mappings(TradeHistory, rows)
+        update_daily_pnl(session, rows)
+        session.commit()
+
+
+# Инкрементальное обновление daily_pnl по продажам из пакета
+def update_daily_pnl(session, rows: list):
+    totals = {}
+    for row in rows:
+        if row['trade_type'] != 'sell':
+            continue
+        key = (row['user_id'], row['symbol'], row['timestamp'].date())
+        profit, sells, volume = totals.get(key, (0.0, 0, 0.0))
+        totals[key] = (profit + (row['profit'] or 0.0), sells + 1, volume + row['amount'] * row['price'])
+    if not totals:
+        return
+    statement = sqlite_insert(DailyPnl).values([
+        {'user_id': user_id, 'symbol': symbol, 'day': day, 'profit': profit, 'sells': sells, 'volume': volume}
+        for (user_id, symbol, day), (profit, sells, volume) in totals.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id', 'symbol', 'day'],
+        set_={
+            'profit': DailyPnl.profit + statement.excluded.profit,
+            'sells': DailyPnl.sells + statement.excluded.sells,
+            'volume': DailyPnl.volume + statement.excluded.volume,
+        }
+    )
+    session.execute(statement)
+
+
+# Полный пересчет daily_pnl по истории сделок (для существующих данных)
+def rebuild_daily_pnl() -> int:
+    with db_session() as session:
+        session.query(DailyPnl).delete()
+        day = func.date(TradeHistory.timestamp)
+        source = select(
+            TradeHistory.user_id,
+            TradeHistory.symbol,
+            day,
+            func.coalesce(func.sum(TradeHistory.profit), 0.0),
+            func.count(),
+            func.coalesce(func.sum(TradeHistory.amount * TradeHistory.price), 0.0),
+        ).where(TradeHistory.trade_type == "sell").group_by(TradeHistory.user_id, TradeHistory.symbol, day)
+        session.execute(
+            insert(DailyPnl).from_select(['user_id', 'symbol', 'day', 'profit', 'sells', 'volume'], source)
+        )
+        session.commit()
+        return session.query(DailyPnl).count()
+
+
+# Глобальный журнал сделок
+trade_journal = TradeJournal()
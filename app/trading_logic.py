@@ -5,7 +5,22 @@ import logging
 import math
 import traceback
 import time
-from app.shared import bot_state_manager, get_user_context
+from app.shared import get_user_context
+from app.client_pool import exchange_client_pool
+from app.market_cache import market_cache
+from app.market_data import market_data_hub
+from app.order_tracker import order_tracker
+from app.grid_engine import GridEngine, GridLevel
+from app.session_store import session_store
+from app.notifier import SessionUpdate, notify
+from app.supervisor import SupervisedSession, session_supervisor, STOP_BY_USER, STOP_BY_SHUTDOWN
+from config.config import (
+    ADMIN_ID,
+    SESSION_RESUME_CONCURRENCY,
+    TAKE_PROFIT_RETRIES,
+    TAKE_PROFIT_RETRY_DELAY,
+    TAKE_PROFIT_RETRY_INTERVAL,
+)
 from telegram import Update
 import ccxt
 
@@ -17,39 +32,326 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-# Исправление для начала функции start_trading
+# Покупка нового уровня сетки по рынку и выставление его take-profit
+async def open_grid_level(update: Update, user_context, mexc_instance, market, engine: GridEngine, symbol: str,
+                          current_price: float) -> GridLevel:
+    base_currency = symbol.split('/')[0]
+    cost = user_context.bot_params.order_size
+    logger.info(f"Размер ордера: {cost} USDT")
+
+    # Расчет количества монет
+    amount = cost / current_price
+    logger.info(f"Расчетное количество для покупки: {amount}")
+
+    # Проверяем, соответствует ли количество минимальным требованиям
+    if market.min_amount is not None and amount < market.min_amount:
+        logger.warning(f"Расчетное количество ({amount}) меньше минимального ({market.min_amount}). Корректируем.")
+        amount = market.min_amount
+        cost = amount * current_price
+        logger.info(f"Скорректированная стоимость: {cost} USDT")
+        await notify(
+            update,
+            f"⚠️ Рассчитанное количество меньше минимального.\n"
+            f"Увеличиваем заказ до минимального: {amount} {base_currency} (≈{cost} USDT)"
+        )
+
+    amount = market.round_amount(amount)
+    logger.info(f"Создание рыночного ордера на покупку {amount} {base_currency}")
+
+    try:
+        # Пробуем покупку методом 1: Указание количества
+        logger.info("Попытка покупки методом 1 (указание количества)...")
+        buy_order = await mexc_instance.create_market_buy_order(symbol, amount)
+        logger.info(f"Ордер на покупку успешно создан (метод 1): {buy_order}")
+    except Exception as e:
+        logger.error(f"Ошибка при создании ордера методом 1: {e}")
+        logger.info("Попытка покупки методом 2 (quoteOrderQty)...")
+
+        # Пробуем покупку методом 2: Использование quoteOrderQty
+        params = {'quoteOrderQty': cost}
+        buy_order = await mexc_instance.create_market_buy_order(symbol, None, params)
+        logger.info(f"Ордер на покупку успешно создан (метод 2): {buy_order}")
+
+    # Фактическое количество и цена исполнения, если биржа их вернула
+    actual_amount = buy_order.get('filled') or buy_order.get('amount') or amount
+    fill_price = buy_order.get('average') or buy_order.get('price') or current_price
+    logger.info(f"Фактическое количество купленных монет: {actual_amount}, цена: {fill_price}")
+
+    level = engine.open_level(fill_price, actual_amount, time.monotonic())
+    level.buy_order_id = buy_order.get('id')
+    user_context.log_trade('buy', symbol, actual_amount, fill_price, 0.0)
+    engine.set_sell_price(level, market.round_price(level.sell_price))
+
+    await notify(
+        update,
+        f"✅ Покупка уровня #{level.number} выполнена!\n"
+        f"- Символ: {symbol}\n"
+        f"- Количество: {actual_amount}\n"
+        f"- Цена: ≈{fill_price}\n"
+        f"- Стоимость: ≈{cost} USDT"
+    )
+
+    # Создаем ордер на продажу; если он не выставился, уровень ждет повторной попытки
+    logger.info(f"Создание лимитного ордера на продажу {actual_amount} {base_currency} по цене {level.sell_price}")
+    await place_take_profit(update, mexc_instance, market, engine, symbol, level)
+
+    return level
+
+
+# Поиск take-profit уровня среди открытых ордеров пары: после сетевой ошибки или
+# остановки бота ордер мог быть создан на бирже, хотя его id не сохранился
+def find_take_profit(open_orders: list, engine: GridEngine, level: GridLevel, amount: float):
+    known_ids = {str(item.sell_order_id) for item in engine.levels if item.sell_order_id is not None}
+    for order in open_orders:
+        if order.get('side') != 'sell' or str(order['id']) in known_ids:
+            continue
+        if (math.isclose(order.get('price') or 0.0, level.sell_price, rel_tol=1e-9)
+                and math.isclose(order.get('amount') or 0.0, amount, rel_tol=1e-9)):
+            return order
+    return None
+
+
+# Свободное количество монет для take-profit уровня (не больше amount), None - баланс недоступен
+async def available_amount(mexc_instance, market, currency: str, amount: float):
+    try:
+        balance = await mexc_instance.fetch_balance()
+    except Exception as e:
+        logger.error(f"Ошибка при проверке баланса {currency}: {e}")
+        return None
+    free = balance.get(currency, {}).get('free') or 0.0
+    rounded = market.round_amount(min(amount, free))
+    # Округление не должно превышать остаток на счете
+    return rounded - 10 ** -market.amount_precision if rounded > free else rounded
+
+
+# Выставление take-profit уровня с повторами и растущей задержкой. Возвращает True, если
+# уровень больше не ждет продажи: ордер выставлен (или найден среди открытых) либо монет
+# уровня на счете нет и уровень закрыт. При False уровень остается в сетке без take-profit,
+# и основной цикл повторяет попытку раз в TAKE_PROFIT_RETRY_INTERVAL секунд
+async def place_take_profit(update: Update, mexc_instance, market, engine: GridEngine, symbol: str,
+                            level: GridLevel, attempts: int = TAKE_PROFIT_RETRIES, check_open_orders: bool = False,
+                            report_failure: bool = True) -> bool:
+    base_currency = symbol.split('/')[0]
+    delay = TAKE_PROFIT_RETRY_DELAY
+    error = None
+    for attempt in range(1, attempts + 1):
+        if attempt > 1:
+            await asyncio.sleep(delay)
+            delay *= 2
+        amount = market.round_amount(level.amount)
+        try:
+            sell_order = None
+            if check_open_orders or attempt > 1:
+                open_orders = await mexc_instance.fetch_open_orders(symbol)
+                sell_order = find_take_profit(open_orders, engine, level, amount)
+            if sell_order is None:
+                sell_order = await mexc_instance.create_limit_sell_order(symbol, amount, level.sell_price)
+        except ccxt.InsufficientFunds as e:
+            # Монет меньше, чем куплено: комиссия в базовой валюте или продажа вручную
+            error = e
+            logger.error(f"Недостаточно {base_currency} для take-profit уровня #{level.number}: {e}")
+            free = await available_amount(mexc_instance, market, base_currency, amount)
+            if free is None:
+                continue
+            if free <= 0 or (market.min_amount is not None and free < market.min_amount):
+                engine.close_level(level)
+                logger.warning(f"Монет уровня #{level.number} нет на счете, уровень закрыт без продажи")
+                await notify(
+                    update,
+                    f"⚠️ Монет уровня #{level.number} ({base_currency}) нет на счете: "
+                    f"уровень закрыт без продажи."
+                )
+                return True
+            level.amount = free
+            continue
+        except Exception as e:
+            error = e
+            logger.error(f"Ошибка при создании ордера на продажу уровня #{level.number} "
+                         f"(попытка {attempt} из {attempts}): {e}")
+            continue
+
+        level.sell_order_id = sell_order['id']
+        logger.info(f"Ордер на продажу уровня #{level.number} создан: {sell_order}")
+        await notify(
+            update,
+            f"✅ Ордер на продажу уровня #{level.number} создан: {amount} {base_currency} "
+            f"по {level.sell_price} (+{engine.profit_percentage}%)"
+        )
+        return True
+
+    logger.error(f"Take-profit уровня #{level.number} не выставлен: {error}")
+    if report_failure:
+        await notify(
+            update,
+            f"⚠️ Не удалось выставить ордер на продажу уровня #{level.number}: {error}\n"
+            f"Монеты остаются на счете, бот будет повторять попытку каждые {TAKE_PROFIT_RETRY_INTERVAL} с."
+        )
+    return False
+
+
+# Повтор выставления take-profit для уровней, оставшихся без него.
+# Возвращает True, если состояние сетки изменилось
+async def retry_take_profits(update: Update, mexc_instance, market, engine: GridEngine, symbol: str,
+                             sell_futures: dict) -> bool:
+    changed = False
+    for level in engine.levels_without_take_profit():
+        settled = await run_to_completion(place_take_profit(
+            update, mexc_instance, market, engine, symbol, level, attempts=1, check_open_orders=True,
+            report_failure=False))
+        if settled:
+            track_level(update.effective_user.id, mexc_instance, symbol, level, sell_futures)
+            changed = True
+    return changed
+
+
+# Выполнение корутины до конца даже при отмене задачи сессии. Отмена посреди покупки
+# оставила бы на бирже позицию без take-profit, записи в журнале и контрольной точки,
+# поэтому отмена ждет завершения операции и только после этого передается дальше
+async def run_to_completion(coro):
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        while not task.done():
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                continue
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка операции, завершенной после отмены сессии: {task.exception()}")
+        raise
+
 
-async def start_trading(symbol: str, update: Update) -> None:
+# Подписка на исполнение take-profit уровня
+def track_level(user_id: int, mexc_instance, symbol: str, level: GridLevel, sell_futures: dict):
+    if level.sell_order_id is None:
+        return
+    future = order_tracker.track(user_id, mexc_instance, level.sell_order_id, symbol, 'sell', level.sell_price)
+    sell_futures[future] = level
+
+
+# Покупка уровня вместе с подпиской на его take-profit и контрольной точкой сессии.
+# Вызывается через run_to_completion: уровень попадает в сетку и в сохраненное состояние целиком
+async def place_grid_level(update: Update, user_context, mexc_instance, market, engine: GridEngine, symbol: str,
+                           current_price: float, sell_futures: dict, cycle_number: int,
+                           cycle_completed: bool) -> GridLevel:
+    level = await open_grid_level(update, user_context, mexc_instance, market, engine, symbol, current_price)
+    track_level(update.effective_user.id, mexc_instance, symbol, level, sell_futures)
+    update_context_state(user_context, engine, symbol)
+    await checkpoint_session(update, symbol, engine, cycle_number, True, cycle_completed)
+    return level
+
+
+# Закрытие уровня после исполнения или отмены его take-profit.
+# Возвращает выручку от продажи в USDT (0, если ордер не исполнен)
+async def close_grid_level(update: Update, user_context, symbol: str, engine: GridEngine, level: GridLevel,
+                           sell_result: dict) -> float:
+    engine.close_level(level)
+    if sell_result.get('status') == 'closed':
+        sell_price = sell_result.get('average') or sell_result.get('price') or level.sell_price
+        profit = level.profit(sell_price)
+        user_context.log_trade('sell', symbol, level.amount, sell_price, profit)
+        logger.info(f"Take-profit уровня #{level.number} исполнен по {sell_price}, прибыль {profit:.4f} USDT")
+        await notify(
+            update,
+            f"💰 Уровень #{level.number} закрыт по {sell_price}. Прибыль: ≈${profit:.4f}"
+        )
+        return sell_price * level.amount
+    else:
+        logger.warning(f"Ордер на продажу уровня #{level.number} завершен со статусом {sell_result.get('status')}")
+        await notify(
+            update,
+            f"⚠️ Ордер на продажу уровня #{level.number} завершен со статусом {sell_result.get('status')}."
+        )
+        return 0.0
+
+
+# Синхронизация состояния сетки с контекстом пользователя (для /stats)
+def update_context_state(user_context, engine: GridEngine, symbol: str):
+    # Уровни считаются по всем парам пользователя
+    if len(engine):
+        user_context.open_levels[symbol] = len(engine)
+    else:
+        user_context.open_levels.pop(symbol, None)
+    user_context.current_level = sum(user_context.open_levels.values())
+    user_context.bot_params.buy_price = engine.last_fill_price
+    if len(engine):
+        user_context.buy_executed[symbol] = True
+    else:
+        user_context.buy_executed.pop(symbol, None)
+    user_context.save_user_params()
+
+
+# Контрольная точка сессии: состояние сетки и цикла для восстановления после перезапуска
+async def checkpoint_session(update: Update, symbol: str, engine: GridEngine, cycle_number: int, cycle_open: bool,
+                             cycle_completed: bool):
+    await session_store.save(update.effective_user.id, symbol, update.effective_chat.id, {
+        'engine': engine.to_state(),
+        'cycle_number': cycle_number,
+        'cycle_open': cycle_open,
+        'cycle_completed': cycle_completed,
+    })
+
+
+# Сверка восстановленных уровней с биржей: один запрос открытых ордеров на пару,
+# уровни, чьи take-profit исполнились во время простоя, закрываются. Выручка этих
+# продаж уже входит в баланс, полученный при запуске сессии, и повторно не учитывается.
+# Уровням без take-profit ордер выставляется заново (или находится среди открытых)
+async def reconcile_levels(update: Update, user_context, mexc_instance, market, symbol: str,
+                           engine: GridEngine) -> None:
+    if not len(engine):
+        return
+    open_orders = await mexc_instance.fetch_open_orders(symbol)
+    open_ids = {str(order['id']) for order in open_orders}
+    for level in engine.levels:
+        if level.sell_order_id is None or str(level.sell_order_id) in open_ids:
+            continue
+        order = await mexc_instance.fetch_order(level.sell_order_id, symbol)
+        logger.info(f"Ордер уровня #{level.number} завершился во время простоя со статусом {order.get('status')}")
+        await close_grid_level(update, user_context, symbol, engine, level, order)
+    for level in engine.levels_without_take_profit():
+        sell_order = find_take_profit(open_orders, engine, level, market.round_amount(level.amount))
+        if sell_order is not None:
+            level.sell_order_id = sell_order['id']
+            logger.info(f"Take-profit уровня #{level.number} найден среди открытых ордеров: {sell_order['id']}")
+            continue
+        logger.warning(f"Восстановленный уровень #{level.number} без take-profit, выставляем ордер")
+        await run_to_completion(place_take_profit(update, mexc_instance, market, engine, symbol, level))
+
+
+async def start_trading(symbol: str, update: Update, session: SupervisedSession, restored: dict = None,
+                        ready: asyncio.Future = None) -> None:
+    """
+    Сессия автоторговли по сетке, запускается через session_supervisor.
+    restored - сохраненное состояние сессии для продолжения после перезапуска;
+    ready разрешается True, когда сессия вошла в основной цикл, или False, если
+    запуск не удался. Сессия завершается по токену session.token; при остановке
+    бота ее состояние сохраняется для восстановления.
+    """
     user_id = update.effective_user.id
-    logger.info(f"========== НАЧАЛО АВТОТОРГОВЛИ ==========")
+    logger.info("========== НАЧАЛО АВТОТОРГОВЛИ ==========")
     logger.info(f"Автоторговля запущена для пользователя {user_id}, символ {symbol}")
+    restored_levels = bool(restored and restored['engine']['levels'])
 
     # Отправляем сообщение о начале процесса
-    await update.message.reply_text(f"🔄 Запускаю автоторговлю для {symbol}...")
-
-    # Сначала проверяем, не запущена ли уже торговля
-    if bot_state_manager.is_trading_active(user_id):
-        logger.warning(f"Автоторговля уже запущена для пользователя {user_id}")
-
-        # Принудительно сбрасываем и перезапускаем
-        logger.info(f"Сброс предыдущего состояния автоторговли")
-        bot_state_manager.stop(user_id)
-        await update.message.reply_text('Предыдущая сессия автоторговли была сброшена.')
+    if restored:
+        await notify(update, f"♻️ Восстанавливаю автоторговлю для {symbol} после перезапуска бота...")
+    else:
+        await notify(update, f"🔄 Запускаю автоторговлю для {symbol}...")
 
     # Получаем контекст пользователя
     try:
-        user_context = get_user_context(user_id)
-        logger.info(f"Контекст пользователя получен успешно")
-        await update.message.reply_text(f"✅ Контекст пользователя загружен")
+        user_context = await get_user_context(user_id)
+        logger.info("Контекст пользователя получен успешно")
+        await notify(update, "✅ Контекст пользователя загружен")
     except Exception as e:
         logger.error(f"Ошибка при получении контекста пользователя: {e}")
-        await update.message.reply_text(f"❌ Ошибка при получении контекста пользователя: {str(e)}")
+        await notify(update, f"❌ Ошибка при получении контекста пользователя: {str(e)}")
         return
 
-    # Отмечаем, что торговля запущена
-    bot_state_manager.start(user_id)
+    # Супервизор уже отметил сессию как запускающуюся
     logger.info(f"Статус торговли установлен в активный для пользователя {user_id}")
-    await update.message.reply_text('✅ Автоторговля активирована. Чтобы остановить, используйте команду /stop.')
+    await notify(update, '✅ Автоторговля активирована. Чтобы остановить, используйте команду /stop.')
 
     # Логируем параметры пользователя
     logger.info(f"Параметры пользователя {user_id}:")
@@ -58,7 +360,8 @@ async def start_trading(symbol: str, update: Update) -> None:
     logger.info(f"- Задержка: {user_context.bot_params.delay_seconds} сек")
     logger.info(f"- Размер ордера: {user_context.bot_params.order_size} USDT")
 
-    await update.message.reply_text(
+    await notify(
+        update,
         f"📊 Текущие параметры:\n"
         f"- Процент прибыли: {user_context.bot_params.profit_percentage}%\n"
         f"- Процент падения: {user_context.bot_params.fall_percentage}%\n"
@@ -66,306 +369,326 @@ async def start_trading(symbol: str, update: Update) -> None:
         f"- Размер ордера: {user_context.bot_params.order_size} USDT"
     )
 
+    price_queue = None
+    price_task = None
+    token_task = asyncio.ensure_future(session.token.wait())
+    sell_futures = {}  # Future исполнения take-profit -> GridLevel
+    engine = None
+    # Восстановленную сессию сохраняем при ошибке запуска: ее ордера остаются на бирже
+    keep_state = restored is not None
     try:
         # Получаем экземпляр MEXC для пользователя
         logger.info(f"Попытка создания экземпляра MEXC для пользователя {user_id}")
-        await update.message.reply_text("🔄 Подключение к MEXC...")
+        await notify(update, "🔄 Подключение к MEXC...")
 
         try:
             mexc_instance = user_context.get_mexc_instance()
-            logger.info(f"Экземпляр MEXC успешно создан")
-            await update.message.reply_text("✅ Подключение к MEXC успешно")
+            logger.info("Экземпляр MEXC успешно создан")
+            await notify(update, "✅ Подключение к MEXC успешно")
         except Exception as e:
             logger.error(f"Ошибка при создании экземпляра MEXC: {e}")
-            await update.message.reply_text(f"❌ Ошибка подключения к MEXC: {str(e)}")
-            bot_state_manager.stop(user_id)
+            await notify(update, f"❌ Ошибка подключения к MEXC: {str(e)}")
             return
 
         # Проверяем баланс
         logger.info(f"Проверка баланса пользователя {user_id}")
-        await update.message.reply_text("🔄 Проверка баланса...")
+        await notify(update, "🔄 Проверка баланса...")
 
         try:
-            balance = mexc_instance.fetch_balance()
+            balance = await mexc_instance.fetch_balance()
             usdt_balance = balance.get('USDT', {}).get('free', 0)
             logger.info(f"Баланс USDT пользователя {user_id}: {usdt_balance}")
-            await update.message.reply_text(f"💰 Доступный баланс: {usdt_balance} USDT")
+            await notify(update, f"💰 Доступный баланс: {usdt_balance} USDT")
 
-            # Проверяем, достаточно ли средств
-            if usdt_balance < user_context.bot_params.order_size:
+            # Проверяем, достаточно ли средств (восстановленной сессии с уровнями хватает открытых ордеров)
+            if usdt_balance < user_context.bot_params.order_size and not restored_levels:
                 logger.warning(f"Недостаточно средств для пользователя {user_id}. "
                                f"Баланс: {usdt_balance}, требуется: {user_context.bot_params.order_size}")
-                await update.message.reply_text(
+                await notify(
+                    update,
                     f"❌ Недостаточно средств для торговли.\n"
                     f"Доступно: {usdt_balance} USDT\n"
                     f"Требуется: {user_context.bot_params.order_size} USDT"
                 )
-                bot_state_manager.stop(user_id)
                 return
 
-            await update.message.reply_text("✅ Баланс достаточен для торговли")
+            await notify(update, "✅ Баланс достаточен для торговли")
         except Exception as e:
             logger.error(f"Ошибка при проверке баланса: {e}")
-            await update.message.reply_text(f"❌ Ошибка при проверке баланса: {str(e)}")
-            bot_state_manager.stop(user_id)
+            await notify(update, f"❌ Ошибка при проверке баланса: {str(e)}")
             return
 
         # Проверяем наличие торговой пары
         logger.info(f"Проверка наличия торговой пары {symbol}")
-        await update.message.reply_text(f"🔄 Проверка доступности {symbol}...")
+        await notify(update, f"🔄 Проверка доступности {symbol}...")
 
         try:
-            mexc_instance.load_markets()
-            if symbol not in mexc_instance.markets:
+            # Метаданные рынков берутся из общего кэша процесса
+            market = await market_cache.get_market(exchange_client_pool.public(), symbol)
+            market_cache.apply_to(mexc_instance.client)
+            if market is None:
                 logger.error(f"Торговая пара {symbol} не найдена на бирже")
-                await update.message.reply_text(f"❌ Торговая пара {symbol} не найдена на бирже MEXC")
-                bot_state_manager.stop(user_id)
+                await notify(update, f"❌ Торговая пара {symbol} не найдена на бирже MEXC")
                 return
 
             logger.info(f"Торговая пара {symbol} доступна для торговли")
-            await update.message.reply_text(f"✅ Пара {symbol} доступна для торговли")
+            await notify(update, f"✅ Пара {symbol} доступна для торговли")
         except Exception as e:
             logger.error(f"Ошибка при проверке торговой пары: {e}")
-            await update.message.reply_text(f"❌ Ошибка при проверке доступности {symbol}: {str(e)}")
-            bot_state_manager.stop(user_id)
+            await notify(update, f"❌ Ошибка при проверке доступности {symbol}: {str(e)}")
             return
 
         # Получаем текущую цену
         logger.info(f"Получение текущей цены для {symbol}")
-        await update.message.reply_text(f"🔄 Получение текущей цены {symbol}...")
+        await notify(update, f"🔄 Получение текущей цены {symbol}...")
 
         try:
-            ticker = mexc_instance.fetch_ticker(symbol)
+            # Котировки приходят из общего потока, один запрос на пару для всех сессий
+            price_queue = market_data_hub.subscribe(symbol)
+            ticker = await market_data_hub.get_ticker(symbol, timeout=30)
             current_price = ticker['last']
             logger.info(f"Текущая цена {symbol}: {current_price}")
-            await update.message.reply_text(f"💲 Текущая цена {symbol}: {current_price}")
+            await notify(update, f"💲 Текущая цена {symbol}: {current_price}")
         except Exception as e:
             logger.error(f"Ошибка при получении текущей цены: {e}")
-            await update.message.reply_text(f"❌ Ошибка при получении цены {symbol}: {str(e)}")
-            bot_state_manager.stop(user_id)
+            await notify(update, f"❌ Ошибка при получении цены {symbol}: {str(e)}")
             return
 
         # Подготовка к покупке
-        logger.info(f"Подготовка к созданию ордера на покупку")
-        await update.message.reply_text("🔄 Подготовка к покупке...")
-
-        # Установка цены покупки
-        user_context.bot_params.buy_price = current_price
-        logger.info(f"Цена покупки установлена: {user_context.bot_params.buy_price}")
-
-        # Определяем размер ордера
-        cost = user_context.bot_params.order_size
-        logger.info(f"Размер ордера: {cost} USDT")
-
-        # Получаем информацию о минимальных требованиях
-        try:
-            market = mexc_instance.markets[symbol]
-
-            # Проверяем наличие информации о минимальном размере ордера
-            min_cost = None
-            if 'limits' in market and 'cost' in market['limits'] and 'min' in market['limits']['cost']:
-                min_cost = float(market['limits']['cost']['min'])
-                logger.info(f"Минимальный размер ордера: {min_cost} USDT")
-
-            min_amount = None
-            if 'limits' in market and 'amount' in market['limits'] and 'min' in market['limits']['amount']:
-                min_amount = float(market['limits']['amount']['min'])
-                logger.info(f"Минимальное количество: {min_amount}")
-
-            # Расчет количества монет
-            amount = cost / current_price
-            logger.info(f"Расчетное количество для покупки: {amount}")
-
-            # Проверяем, соответствует ли количество минимальным требованиям
-            if min_amount is not None and amount < min_amount:
-                logger.warning(f"Расчетное количество ({amount}) меньше минимального ({min_amount}). Корректируем.")
-                amount = min_amount
-                cost = amount * current_price
-                logger.info(f"Скорректированная стоимость: {cost} USDT")
-                await update.message.reply_text(
-                    f"⚠️ Рассчитанное количество меньше минимального.\n"
-                    f"Увеличиваем заказ до минимального: {amount} {symbol.split('/')[0]} (≈{cost} USDT)"
-                )
-
-            precision = 8  # По умолчанию
-            if 'precision' in market and 'amount' in market['precision']:
-                prec_value = market['precision']['amount']
-                logger.info(f"Исходное значение precision для amount: {prec_value} (тип: {type(prec_value).__name__})")
-
-                # Конвертируем precision в целое число
-                if isinstance(prec_value, float):
-                    # Если precision - дробное число меньше 1 (например 0.01),
-                    # преобразуем его в количество десятичных знаков
-                    if prec_value < 1:
-                        precision = abs(int(math.log10(prec_value)))
-                    else:
-                        precision = int(prec_value)
-                elif prec_value is not None:
-                    try:
-                        precision = int(prec_value)
-                    except (ValueError, TypeError):
-                        logger.error(f"Невозможно преобразовать precision в целое число: {prec_value}")
-                        precision = 8  # Используем значение по умолчанию
-
-            logger.info(f"Итоговая точность для количества: {precision}")
-            amount = round(amount, precision)
-
-            await update.message.reply_text(
-                f"📝 Параметры ордера:\n"
-                f"- Символ: {symbol}\n"
-                f"- Количество: {amount}\n"
-                f"- Примерная цена: {current_price}\n"
-                f"- Общая стоимость: ≈{cost} USDT"
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при получении информации о минимальных требованиях: {e}")
-            await update.message.reply_text(f"❌ Ошибка при подготовке ордера: {str(e)}")
-            bot_state_manager.stop(user_id)
-            return
-
-        # Выполняем покупку
-        logger.info(f"Создание рыночного ордера на покупку {amount} {symbol.split('/')[0]}")
-        await update.message.reply_text("🔄 Создание ордера на покупку...")
-
-        try:
-            # Пробуем покупку методом 1: Указание количества
+        logger.info("Подготовка к созданию ордера на покупку")
+        await notify(update, "🔄 Подготовка к покупке...")
+
+        cycle_open = True  # В текущем цикле есть купленные уровни
+        cycle_completed = False  # Цикл завершен, новых покупок не будет
+        cycle_number = 1
+        low_balance_notified = False
+
+        if restored:
+            engine = GridEngine.from_state(restored['engine'], time.monotonic())
+            cycle_open = restored['cycle_open']
+            cycle_completed = restored['cycle_completed']
+            cycle_number = restored['cycle_number']
             try:
-                logger.info(f"Попытка покупки методом 1 (указание количества)...")
-                buy_order = mexc_instance.create_market_buy_order(symbol, amount)
-                logger.info(f"Ордер на покупку успешно создан (метод 1): {buy_order}")
-
-                await update.message.reply_text(
-                    f"✅ Покупка выполнена успешно!\n"
-                    f"- Символ: {symbol}\n"
-                    f"- Количество: {amount}\n"
-                    f"- Цена: ≈{current_price}\n"
-                    f"- Стоимость: ≈{cost} USDT"
-                )
+                await reconcile_levels(update, user_context, mexc_instance, market, symbol, engine)
             except Exception as e:
-                logger.error(f"Ошибка при создании ордера методом 1: {e}")
-                logger.info(f"Попытка покупки методом 2 (quoteOrderQty)...")
-
-                # Пробуем покупку методом 2: Использование quoteOrderQty
-                params = {'quoteOrderQty': cost}
-                buy_order = mexc_instance.create_market_buy_order(symbol, None, None, params)
-                logger.info(f"Ордер на покупку успешно создан (метод 2): {buy_order}")
-
-                await update.message.reply_text(
-                    f"✅ Покупка выполнена успешно (метод 2)!\n"
-                    f"- Символ: {symbol}\n"
-                    f"- Стоимость: {cost} USDT"
-                )
+                # Не сверенные уровни проверит трекер ордеров в основном цикле
+                logger.error(f"Ошибка при сверке ордеров восстановленной сессии: {e}")
+            for level in engine.levels:
+                track_level(user_id, mexc_instance, symbol, level, sell_futures)
+            update_context_state(user_context, engine, symbol)
+            await checkpoint_session(update, symbol, engine, cycle_number, cycle_open, cycle_completed)
+            await notify(
+                update,
+                f"✅ Автоторговля восстановлена: цикл #{cycle_number}, открытых уровней: {len(engine)}."
+            )
+        else:
+            engine = GridEngine(
+                user_context.bot_params.profit_percentage,
+                user_context.bot_params.fall_percentage,
+                user_context.bot_params.delay_seconds,
+            )
 
-            # Обновляем состояние после успешной покупки
-            user_context.current_level += 1
-            user_context.buy_executed[symbol] = True
-
-            # Получаем фактическое количество купленных монет
-            actual_amount = buy_order.get('amount', amount)
-            logger.info(f"Фактическое количество купленных монет: {actual_amount}")
-
-            # Рассчитываем цену продажи
-            sell_price = current_price * (1 + user_context.bot_params.profit_percentage / 100)
-            logger.info(f"Расчетная цена продажи: {sell_price}")
-
-            # Округляем цену продажи с учетом точности
-            # Округляем цену продажи с учетом точности
-            price_precision = 8  # По умолчанию
-            if 'precision' in market and 'price' in market['precision']:
-                prec_value = market['precision']['price']
-                logger.info(f"Исходное значение precision для price: {prec_value} (тип: {type(prec_value).__name__})")
-
-                # Конвертируем precision в целое число
-                if isinstance(prec_value, float):
-                    # Если precision - дробное число меньше 1 (например 0.01),
-                    # преобразуем его в количество десятичных знаков
-                    if prec_value < 1:
-                        price_precision = abs(int(math.log10(prec_value)))
-                    else:
-                        price_precision = int(prec_value)
-                elif prec_value is not None:
-                    try:
-                        price_precision = int(prec_value)
-                    except (ValueError, TypeError):
-                        logger.error(f"Невозможно преобразовать price_precision в целое число: {prec_value}")
-                        price_precision = 8  # Используем значение по умолчанию
-
-            logger.info(f"Итоговая точность для цены: {price_precision}")
-            sell_price = round(sell_price, price_precision)
-
-            # Создаем ордер на продажу
-            logger.info(
-                f"Создание лимитного ордера на продажу {actual_amount} {symbol.split('/')[0]} по цене {sell_price}")
-            await update.message.reply_text(f"🔄 Создание ордера на продажу по цене {sell_price}...")
+        # Последняя точка, где остановка запускающейся сессии безопасна: новых ордеров еще нет
+        if session.token.cancelled:
+            logger.info(f"Сессия {symbol} пользователя {user_id} остановлена до первой покупки")
+            return
 
+        if not restored_levels and not cycle_completed:
+            # Покупаем первый уровень сетки
             try:
-                sell_order = mexc_instance.create_limit_sell_order(symbol, actual_amount, sell_price)
-                logger.info(f"Ордер на продажу успешно создан: {sell_order}")
-
-                await update.message.reply_text(
-                    f"✅ Ордер на продажу создан успешно!\n"
-                    f"- Символ: {symbol}\n"
-                    f"- Количество: {actual_amount}\n"
-                    f"- Цена продажи: {sell_price}\n"
-                    f"- Ожидаемая прибыль: {user_context.bot_params.profit_percentage}%"
-                )
+                level = await run_to_completion(place_grid_level(
+                    update, user_context, mexc_instance, market, engine, symbol, current_price, sell_futures,
+                    cycle_number, cycle_completed))
             except Exception as e:
-                logger.error(f"Ошибка при создании ордера на продажу: {e}")
-                await update.message.reply_text(f"❌ Ошибка при создании ордера на продажу: {str(e)}")
-                # Продолжаем, т.к. монеты уже куплены, и пользователь может продать их вручную
+                logger.error(f"Ошибка при создании ордера на покупку: {e}")
+                logger.error(traceback.format_exc())  # Полный стек-трейс
+                await notify(update, f"❌ Ошибка при создании ордера на покупку: {str(e)}")
+                return
+
+            cycle_open = True
 
-            # Логируем успешное завершение первой покупки
             logger.info(f"Первая покупка и продажа успешно выполнены для пользователя {user_id}")
-            await update.message.reply_text(
-                "✅ Автоторговля выполнила первый цикл покупки и продажи.\n"
-                "Ожидаем исполнения ордера на продажу..."
+            await notify(
+                update,
+                "✅ Автоторговля выполнила первую покупку.\n"
+                f"Следующий уровень будет куплен при падении цены на {engine.fall_percentage}% "
+                f"(≈{market.round_price(engine.next_buy_price())}).\n"
+                "Ожидаем исполнения ордеров на продажу..."
             )
 
-        except Exception as e:
-            logger.error(f"Ошибка при создании ордера на покупку: {e}")
-            logger.error(traceback.format_exc())  # Полный стек-трейс
-            await update.message.reply_text(f"❌ Ошибка при создании ордера на покупку: {str(e)}")
-            bot_state_manager.stop(user_id)
-            return
-
-        # Ожидаем завершения торговли
+        # Основной цикл сетки: цены приходят из общего потока котировок,
+        # исполнения take-profit - из трекера ордеров
         logger.info(f"Ожидание завершения торговли для пользователя {user_id}")
-
-        iteration = 0
-        while bot_state_manager.is_trading_active(user_id):
-            iteration += 1
-            logger.info(f"Итерация ожидания #{iteration} для пользователя {user_id}")
-
-            # Добавляем проверку статуса ордера на продажу каждые 30 секунд
-            if iteration % 3 == 0:  # Каждые ~30 секунд (10 секунд между итерациями)
-                try:
-                    # Проверка открытых ордеров
-                    open_orders = mexc_instance.fetch_open_orders(symbol)
-                    num_open_orders = len(open_orders)
-                    logger.info(f"Количество открытых ордеров: {num_open_orders}")
-
-                    if num_open_orders > 0:
-                        logger.info(f"Ордер на продажу все еще открыт. Ожидаем исполнения.")
-                    else:
-                        logger.info(f"Все ордеры исполнены! Цикл автоторговли завершен.")
-                        await update.message.reply_text(
-                            "🎉 Все ордеры исполнены! Цикл торговли завершен успешно."
-                        )
-                        # Можно добавить логику для следующего цикла автоторговли здесь
-                except Exception as e:
-                    logger.error(f"Ошибка при проверке статуса ордеров: {e}")
-
-            # Ждем 10 секунд между проверками
-            await asyncio.sleep(10)
-
-        logger.info(f"Автоторговля остановлена для пользователя {user_id}")
-        await update.message.reply_text("⏹️ Автоторговля остановлена.")
+        keep_state = False
+        take_profit_retry_at = time.monotonic() + TAKE_PROFIT_RETRY_INTERVAL
+        session.set_running()
+        if ready is not None and not ready.done():
+            ready.set_result(True)
+
+        while not session.token.cancelled:
+            if price_task is None:
+                price_task = asyncio.ensure_future(price_queue.get())
+
+            done, _ = await asyncio.wait({price_task, token_task, *sell_futures}, timeout=1,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if session.token.cancelled:
+                break
+
+            state_changed = False
+            for future in [future for future in done if future in sell_futures]:
+                level = sell_futures.pop(future)
+                proceeds = await close_grid_level(update, user_context, symbol, engine, level, future.result())
+                state_changed = True
+                if proceeds:
+                    low_balance_notified = False
+
+            # Уровень без take-profit не дает завершить цикл: повторяем выставление ордера
+            if time.monotonic() >= take_profit_retry_at and engine.levels_without_take_profit():
+                take_profit_retry_at = time.monotonic() + TAKE_PROFIT_RETRY_INTERVAL
+                if await retry_take_profits(update, mexc_instance, market, engine, symbol, sell_futures):
+                    state_changed = True
+
+            if sell_futures or len(engine):
+                update_context_state(user_context, engine, symbol)
+            elif cycle_open:
+                cycle_open = False
+                state_changed = True
+                update_context_state(user_context, engine, symbol)
+                logger.info(f"Все уровни закрыты! Цикл автоторговли #{cycle_number} завершен.")
+                if user_context.bot_params.continuous_mode:
+                    # Непрерывный режим: сразу начинаем следующий цикл с теплым состоянием -
+                    # клиент, рынки, подписка на котировки и баланс уже известны
+                    cycle_number += 1
+                    engine.update_params(
+                        user_context.bot_params.profit_percentage,
+                        user_context.bot_params.fall_percentage,
+                        user_context.bot_params.delay_seconds,
+                    )
+                    engine.last_buy_time = None
+                    await notify(
+                        update,
+                        f"🔁 Цикл #{cycle_number - 1} завершен. Начинаем цикл #{cycle_number}..."
+                    )
+                else:
+                    cycle_completed = True
+                    await notify(
+                        update,
+                        "🎉 Все ордеры исполнены! Цикл торговли завершен успешно."
+                    )
+
+            if state_changed:
+                await checkpoint_session(update, symbol, engine, cycle_number, cycle_open, cycle_completed)
+
+            if price_task not in done:
+                continue
+
+            current_price = price_task.result()['last']
+            price_task = None
+            now = time.monotonic()
+            session.record_tick(now - market_data_hub.published_at(symbol, now))
+            if cycle_completed or not engine.should_buy(current_price, now):
+                continue
+
+            # Баланс USDT общий для всех пар пользователя: перед каждым уровнем берем его с биржи
+            # (чтение кэшируется на секунды и сбрасывается после каждого ордера пользователя)
+            try:
+                balance = await mexc_instance.fetch_balance()
+                usdt_balance = balance.get('USDT', {}).get('free', 0)
+            except Exception as e:
+                engine.defer(now)
+                logger.error(f"Ошибка при проверке баланса перед покупкой уровня: {e}")
+                continue
+            if usdt_balance < user_context.bot_params.order_size:
+                engine.defer(now)
+                if not low_balance_notified:
+                    low_balance_notified = True
+                    logger.warning(f"Недостаточно средств для нового уровня: {usdt_balance} USDT")
+                    await notify(
+                        update,
+                        f"⚠️ Недостаточно средств для нового уровня: ≈{usdt_balance:.2f} USDT. "
+                        f"Ожидаем исполнения ордеров на продажу."
+                    )
+                continue
+
+            # Цена упала на fall_percentage ниже самого низкого уровня (или начался новый цикл) - покупаем
+            logger.info(f"Цена {symbol}: {current_price}, покупаем уровень #{len(engine) + 1}")
+            try:
+                level = await run_to_completion(place_grid_level(
+                    update, user_context, mexc_instance, market, engine, symbol, current_price, sell_futures,
+                    cycle_number, cycle_completed))
+                cycle_open = True
+            except ccxt.InsufficientFunds as e:
+                # Средства заняла другая пара пользователя между проверкой баланса и ордером
+                engine.defer(now)
+                logger.error(f"Недостаточно средств для нового уровня: {e}")
+            except Exception as e:
+                engine.defer(now)
+                logger.error(f"Ошибка при покупке нового уровня: {e}")
+                await notify(update, f"❌ Ошибка при покупке нового уровня: {str(e)}")
+
+        if session.token.reason == STOP_BY_SHUTDOWN:
+            # Остановка процесса: сессия продолжится после перезапуска
+            keep_state = True
+            logger.info(f"Автоторговля приостановлена для пользователя {user_id} из-за остановки бота")
+            await notify(update, "⏸️ Бот перезапускается. Автоторговля продолжится после запуска.")
+        else:
+            logger.info(f"Автоторговля остановлена для пользователя {user_id}")
+            await notify(update, "⏹️ Автоторговля остановлена.")
 
     except Exception as e:
         logger.error(f"Неожиданная ошибка в автоторговле: {e}")
         logger.error(traceback.format_exc())  # Полный стек-трейс
-        await update.message.reply_text(f"❌ Неожиданная ошибка: {str(e)}")
+        # Открытые уровни остаются на бирже: сохраняем сессию, чтобы продолжить ее после перезапуска
+        keep_state = keep_state or (engine is not None and len(engine) > 0) or bool(sell_futures)
+        await notify(update, f"❌ Неожиданная ошибка: {str(e)}")
+    except asyncio.CancelledError:
+        # Отмена при остановке бота: состояние нужно для восстановления
+        keep_state = session.token.reason != STOP_BY_USER
+        raise
     finally:
-        # Обязательно останавливаем автоторговлю при выходе из функции
-        bot_state_manager.stop(user_id)
-        logger.info(f"========== КОНЕЦ АВТОТОРГОВЛИ ==========")
\ No newline at end of file
+        if ready is not None and not ready.done():
+            ready.set_result(False)
+        if not keep_state:
+            await session_store.remove(user_id, symbol)
+        if price_queue is not None:
+            market_data_hub.unsubscribe(symbol, price_queue)
+        if price_task is not None:
+            price_task.cancel()
+        token_task.cancel()
+        for future in sell_futures:
+            future.cancel()
+        logger.info("========== КОНЕЦ АВТОТОРГОВЛИ ==========")
+
+
+# Восстановление сессий автоторговли, активных на момент остановки процесса
+async def resume_trading_sessions(bot) -> None:
+    started = time.monotonic()
+    try:
+        stored_sessions = await session_store.load_all()
+    except Exception as e:
+        logger.error(f"Ошибка при чтении сохраненных сессий: {e}")
+        return
+    if not stored_sessions:
+        return
+    logger.info(f"Восстановление сессий автоторговли: {len(stored_sessions)}")
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(SESSION_RESUME_CONCURRENCY)
+
+    async def resume(stored) -> bool:
+        async with semaphore:
+            ready = loop.create_future()
+            update = SessionUpdate(bot, stored.user_id, stored.chat_id)
+            session_supervisor.start(stored.user_id, stored.symbol, lambda session: start_trading(
+                stored.symbol, update, session, restored=stored.state, ready=ready))
+            return await ready
+
+    results = await asyncio.gather(*(resume(stored) for stored in stored_sessions), return_exceptions=True)
+    resumed = sum(1 for result in results if result is True)
+    elapsed = time.monotonic() - started
+    message = f"Восстановлено сессий автоторговли: {resumed} из {len(stored_sessions)} за {elapsed:.2f} с"
+    logger.info(message)
+    try:
+        await bot.send_message(chat_id=ADMIN_ID, text=f"♻️ {message}")
+    except Exception as e:
+        logger.error(f"Не удалось отправить отчет о восстановлении администратору: {e}")
@@ -0,0 +1,112 @@
+# app/user_state.py
+
+import asyncio
+from sqlalchemy import update
+from app.database import User, db_session, run_db, encryption_manager
+from config.config import USER_STATE_FLUSH_INTERVAL
+from config.logging_config import logger
+
+
+class UserStateWriter:
+    """
+    Отложенная (write-behind) запись параметров и состояния пользователей.
+
+    Контекст, в котором изменилось поле, ставится в очередь на запись. Раз в
+    flush_interval секунд фоновая задача забирает у контекстов только измененные
+    поля и записывает их одной транзакцией в потоке db_executor. Несколько
+    изменений одного пользователя между записями сливаются в один UPDATE.
+
+    schedule() можно вызывать из любого потока. Вызов из другого потока передается
+    в цикл событий писателя через call_soon_threadsafe. Если цикла событий нет
+    (синхронный скрипт), контекст только запоминается, и его изменения запишет
+    следующая запись.
+    """
+
+    def __init__(self, flush_interval: float = USER_STATE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending = {}  # user_id -> UserContext с несохраненными изменениями
+        self._wakeup = None
+        self._writer_task = None
+        self._loop = None  # Цикл событий фоновой задачи
+        self.written = 0  # Число выполненных UPDATE
+
+    def schedule(self, user_context):
+        """Ставит контекст в очередь на запись изменений."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not self._loop and self._loop is not None and self._loop.is_running():
+            # Вызов из другого потока (например, из потока db_executor)
+            self._loop.call_soon_threadsafe(self.schedule, user_context)
+            return
+        self._pending[user_context.user_id] = user_context
+        if loop is None:
+            return
+        if loop is not self._loop or self._writer_task is None or self._writer_task.done():
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._writer_task = loop.create_task(self._writer())
+        self._wakeup.set()
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Даем изменениям накопиться, чтобы записать их одним UPDATE
+            await asyncio.sleep(self.flush_interval)
+            await self._write_pending()
+
+    async def _write_pending(self):
+        pending, self._pending = self._pending, {}
+        changes = {}
+        for user_id, user_context in pending.items():
+            columns = user_context.take_changes()
+            if columns:
+                changes[user_id] = columns
+        if not changes:
+            return
+        try:
+            await run_db(write_user_changes, changes)
+            self.written += len(changes)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении параметров {len(changes)} пользователей: {e}")
+            # Возвращаем изменения контекстам, чтобы записать их при следующей попытке
+            for user_id, columns in changes.items():
+                pending[user_id].restore_changes(columns)
+                self.schedule(pending[user_id])
+
+    async def flush(self):
+        """Сразу записывает все накопленные изменения."""
+        await self._write_pending()
+
+    async def stop(self):
+        """Записывает оставшиеся изменения и останавливает фоновую задачу."""
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+            self._writer_task = None
+        self._loop = None
+        await self.flush()
+        logger.info(f"Запись параметров пользователей остановлена. Выполнено обновлений: {self.written}")
+
+
+# Запись измененных столбцов пользователей одной транзакцией
+def write_user_changes(changes: dict):
+    with db_session() as session:
+        for user_id, columns in changes.items():
+            values = dict(columns)
+            # Ключи шифруются здесь, в потоке базы, и только когда они действительно изменились
+            credentials = values.pop('credentials', None)
+            if credentials is not None:
+                values['api_key_encrypted'] = encryption_manager.encrypt(credentials[0])
+                values['api_secret_encrypted'] = encryption_manager.encrypt(credentials[1])
+            session.execute(update(User).where(User.id == user_id).values(**values))
+        session.commit()
+
+
+# Глобальный писатель параметров пользователей
+user_state_writer = UserStateWriter()
@@ -0,0 +1,187 @@
+# benchmarks/bench_autobuy.py
+# Нагрузочный бенчмарк автоторговли на имитации биржи: N пользователей запускают /autobuy
+# через настоящие обработчик команды, супервизор сессий и торговую логику.
+#
+# Запуск: python benchmarks/bench_autobuy.py --users 300 --latency 0.05 --jitter 0.05 --error-rate 0.01 --duration 30
+#
+# Бот работает во временном каталоге с собственной базой SQLite и ключом шифрования,
+# поэтому рабочая база и настоящая биржа не затрагиваются. Отчет: p50/p99 задержки
+# команды и первой покупки, лаг цикла событий и число запросов к бирже на цикл торговли.
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+# Добавляем корневую директорию проекта в sys.path
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.bench_event_loop import loop_lag_probe, percentile
+from benchmarks.fake_exchange import FakeExchange, FakeMarket, PricePath
+
+
+class BenchBot:
+    """Вместо Telegram: запоминает время и текст сообщений, отправленных каждому пользователю."""
+
+    def __init__(self):
+        self.messages = {}  # chat_id -> список (время, текст)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.messages.setdefault(chat_id, []).append((time.perf_counter(), text))
+
+
+def prepare_workdir() -> str:
+    """Временный каталог с ключом шифрования: база и логи бота создаются в нем."""
+    from cryptography.fernet import Fernet
+
+    workdir = tempfile.mkdtemp(prefix='bench_autobuy_')
+    with open(os.path.join(workdir, 'encryption_key.txt'), 'wb') as f:
+        f.write(Fernet.generate_key())
+    os.chdir(workdir)
+    return workdir
+
+
+def first_time(messages: list, marker: str, since: float):
+    for sent_at, text in messages:
+        if marker in text:
+            return sent_at - since
+    return None
+
+
+async def run(args):
+    import logging
+    from app.autotrade_handlers import autobuy
+    from app.client_pool import exchange_client_pool
+    from app.main import on_stop, on_shutdown
+    from app.market_data import market_data_hub
+    from app.notifier import SessionUpdate
+    from app.order_tracker import order_tracker
+    from app.rate_budget import ip_rate_budget
+    from app.shared import get_user_context
+    from app.supervisor import session_supervisor
+    from app.user_state import user_state_writer
+
+    logging.disable(logging.INFO)  # Подробный журнал торговли искажает замеры
+
+    path = PricePath.saw(args.price, args.amplitude, args.period)
+    market = FakeMarket(args.price, path)
+    seeds = iter(range(args.seed, args.seed + 10 ** 6))
+    exchange_client_pool.client_factory = lambda api_key, api_secret: FakeExchange(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, market=market,
+        balance=args.balance, seed=next(seeds),
+    )
+    market_data_hub.poll_interval = args.poll_interval
+    order_tracker.min_interval = args.poll_interval
+    order_tracker.max_interval = args.poll_interval * 4
+    if args.ip_rate:
+        # Лимит IP-адреса ограничивает всех пользователей вместе; для имитации его можно поднять
+        ip_rate_budget.rate = ip_rate_budget.burst = args.ip_rate
+
+    bot = BenchBot()
+    users = list(range(1, args.users + 1))
+    for user_id in users:
+        user_context = await get_user_context(user_id)
+        user_context.set_api_credentials(f"bench-key-{user_id}", "bench-secret")
+        user_context.bot_params.set_params(args.profit, args.fall, args.delay, args.order_size)
+        user_context.bot_params.continuous_mode = True
+        user_context.save_user_params()
+    await user_state_writer.flush()
+
+    stop_event = asyncio.Event()
+    lags = []
+    probe = asyncio.create_task(loop_lag_probe(stop_event, lags))
+
+    command_latencies = []
+    started_at = {}
+
+    async def command(user_id: int, scheduled: float):
+        update = SessionUpdate(bot, user_id, user_id)
+        started_at[user_id] = scheduled
+        await autobuy(update, types.SimpleNamespace(args=[]))
+        command_latencies.append(time.perf_counter() - scheduled)
+
+    # Команды приходят равномерно за ramp секунд независимо от состояния цикла событий
+    started = time.perf_counter()
+    commands = []
+    for index, user_id in enumerate(users):
+        scheduled = started + args.ramp * index / len(users)
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        commands.append(asyncio.create_task(command(user_id, scheduled)))
+    await asyncio.gather(*commands)
+
+    calls_before = sum(market.calls.values())
+    await asyncio.sleep(max(0.0, args.duration - (time.perf_counter() - started)))
+    running = len(session_supervisor)
+    calls = sum(market.calls.values())
+
+    stop_event.set()
+    await probe
+    await on_stop(None)
+    await on_shutdown(None)
+
+    first_buys = [delay for user_id in users
+                  if (delay := first_time(bot.messages.get(user_id, []), 'Покупка уровня', started_at[user_id]))]
+    cycles = sum(1 for messages in bot.messages.values() for _, text in messages if 'завершен' in text and 'Цикл' in text)
+    elapsed = time.perf_counter() - started
+    by_method = ', '.join(f"{method}={count}" for method, count in market.calls.most_common())
+    errors = sum(market.errors.values())
+
+    print(
+        f"Пользователей: {len(users)}, задержка REST: {args.latency * 1000:.0f}+{args.jitter * 1000:.0f} мс, "
+        f"ошибки: {args.error_rate * 100:.1f}%, лимит IP: {ip_rate_budget.rate:g} запросов/с, "
+        f"длительность: {elapsed:.1f} с\n"
+        f"  /autobuy: p50={percentile(command_latencies, 50) * 1000:.1f} мс, "
+        f"p99={percentile(command_latencies, 99) * 1000:.1f} мс\n"
+        f"  до первой покупки: n={len(first_buys)}, p50={percentile(first_buys, 50) * 1000:.0f} мс, "
+        f"p99={percentile(first_buys, 99) * 1000:.0f} мс\n"
+        f"  лаг цикла событий: p50={percentile(lags, 50) * 1000:.1f} мс, "
+        f"p99={percentile(lags, 99) * 1000:.1f} мс, max={max(lags, default=0.0) * 1000:.1f} мс\n"
+        f"  сессий работало в конце: {running}, завершенных циклов торговли: {cycles}\n"
+        f"  запросов к бирже: {calls} (после запуска всех сессий: {calls - calls_before}), "
+        f"внедренных ошибок: {errors}\n"
+        f"  запросов на цикл торговли: {calls / cycles if cycles else float('nan'):.1f}, "
+        f"на пользователя в секунду: {calls / len(users) / elapsed:.2f}\n"
+        f"  по методам: {by_method}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк /autobuy на имитации биржи")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="Задержка одного REST-вызова, сек")
+    parser.add_argument('--jitter', type=float, default=0.02, help="Случайная добавка к задержке, до сек")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля вызовов, завершающихся ошибкой сети")
+    parser.add_argument('--duration', type=float, default=30.0, help="Длительность прогона, сек")
+    parser.add_argument('--ramp', type=float, default=5.0, help="За сколько секунд приходят все команды /autobuy")
+    parser.add_argument('--price', type=float, default=0.1, help="Начальная цена")
+    parser.add_argument('--amplitude', type=float, default=2.0, help="Глубина падения цены в сценарии, %%")
+    parser.add_argument('--period', type=float, default=10.0, help="Период сценария цены, сек")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="Интервал опроса котировок и ордеров, сек")
+    parser.add_argument('--ip-rate', type=float, default=None, help="Лимит запросов с IP в секунду (по умолчанию из конфига)")
+    parser.add_argument('--profit', type=float, default=0.5)
+    parser.add_argument('--fall', type=float, default=0.5)
+    parser.add_argument('--delay', type=float, default=0)
+    parser.add_argument('--order-size', type=float, default=10)
+    parser.add_argument('--balance', type=float, default=1000.0, help="Баланс USDT каждого пользователя")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help="Не удалять временный каталог с базой и логом")
+    args = parser.parse_args()
+
+    workdir = prepare_workdir()
+    try:
+        asyncio.run(run(args))
+    finally:
+        os.chdir(PROJECT_ROOT)
+        if args.keep:
+            print(f"Каталог прогона: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
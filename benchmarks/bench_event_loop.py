@@ -0,0 +1,120 @@
+# benchmarks/bench_event_loop.py
+# Бенчмарк отзывчивости цикла событий при N одновременных автотрейдерах.
+#
+# Запуск: python benchmarks/bench_event_loop.py --traders 50 --latency 0.2 --duration 10
+#
+# Режим "blocking" повторяет старое поведение start_trading (синхронные вызовы ccxt
+# прямо в корутине), режим "adapter" использует ExchangeAdapter с пулом потоков.
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Добавляем корневую директорию проекта в sys.path
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from app.exchange import ExchangeAdapter
+from benchmarks.fake_exchange import FakeExchange
+
+
+class BlockingAdapter:
+    """Вызывает методы клиента прямо в цикле событий, как это делал старый код."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def fetch_ticker(self, symbol):
+        return self.client.fetch_ticker(symbol)
+
+    async def fetch_open_orders(self, symbol):
+        return self.client.fetch_open_orders(symbol)
+
+    async def fetch_balance(self):
+        return self.client.fetch_balance()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def autotrader(adapter, stop_event: asyncio.Event, poll_interval: float):
+    # Упрощенный цикл сессии: цена + проверка открытых ордеров
+    while not stop_event.is_set():
+        await adapter.fetch_ticker('KAS/USDT')
+        await adapter.fetch_open_orders('KAS/USDT')
+        await asyncio.sleep(poll_interval)
+
+
+async def command_handler(adapter, latencies: list, scheduled: float):
+    # Имитация /balance: один REST-вызов и ответ пользователю.
+    # Задержка считается от момента, когда команда должна была начать обработку.
+    await adapter.fetch_balance()
+    latencies.append(time.perf_counter() - scheduled)
+
+
+async def loop_lag_probe(stop_event: asyncio.Event, lags: list, interval: float = 0.05):
+    while not stop_event.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(mode: str, traders: int, latency: float, duration: float, poll_interval: float):
+    stop_event = asyncio.Event()
+
+    def make_adapter():
+        client = FakeExchange(latency=latency)
+        return ExchangeAdapter(client) if mode == 'adapter' else BlockingAdapter(client)
+
+    tasks = [asyncio.create_task(autotrader(make_adapter(), stop_event, poll_interval)) for _ in range(traders)]
+    lags = []
+    tasks.append(asyncio.create_task(loop_lag_probe(stop_event, lags)))
+
+    handler_adapter = make_adapter()
+    handler_latencies = []
+    handlers = []
+    started = time.perf_counter()
+    # Команды приходят по расписанию каждые 100 мс независимо от состояния цикла
+    for i in range(int(duration / 0.1)):
+        scheduled = started + i * 0.1
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        handlers.append(asyncio.create_task(command_handler(handler_adapter, handler_latencies, scheduled)))
+    await asyncio.gather(*handlers)
+
+    stop_event.set()
+    await asyncio.gather(*tasks)
+    return handler_latencies, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка обработчиков команд при одновременной автоторговле")
+    parser.add_argument('--traders', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.2, help="Задержка одного REST-вызова, сек")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--mode', choices=['adapter', 'blocking', 'both'], default='both')
+    args = parser.parse_args()
+
+    modes = ['blocking', 'adapter'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        latencies, lags = asyncio.run(run(mode, args.traders, args.latency, args.duration, args.poll_interval))
+        print(
+            f"[{mode}] автотрейдеров: {args.traders}, задержка REST: {args.latency * 1000:.0f} мс\n"
+            f"  /balance: n={len(latencies)}, p50={percentile(latencies, 50) * 1000:.0f} мс, "
+            f"p99={percentile(latencies, 99) * 1000:.0f} мс, max={max(latencies) * 1000:.0f} мс\n"
+            f"  лаг цикла событий: p50={percentile(lags, 50) * 1000:.1f} мс, "
+            f"p99={percentile(lags, 99) * 1000:.1f} мс, "
+            f"среднее={statistics.mean(lags) * 1000 if lags else 0.0:.1f} мс"
+        )
+
+
+if __name__ == '__main__':
+    main()
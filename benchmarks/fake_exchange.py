@@ -0,0 +1,260 @@
+# benchmarks/fake_exchange.py
+
+import bisect
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+import ccxt
+
+DEFAULT_MARKET = {
+    'precision': {'amount': 0.01, 'price': 0.000001},
+    'limits': {'amount': {'min': 1.0}, 'cost': {'min': 1.0}},
+}
+
+
+class PricePath:
+    """
+    Сценарий цены: кусочно-линейная функция времени по точкам (секунда, цена).
+    С loop=True сценарий повторяется по кругу, иначе после последней точки цена не меняется.
+    """
+
+    def __init__(self, points: list, loop: bool = True):
+        if not points:
+            raise ValueError("Сценарий цены должен содержать хотя бы одну точку")
+        self.points = sorted(points)
+        self.loop = loop
+        self._times = [point[0] for point in self.points]
+
+    @classmethod
+    def saw(cls, base: float, amplitude_percent: float, period: float) -> 'PricePath':
+        """Пила: цена падает на amplitude_percent и возвращается обратно за period секунд."""
+        low = base * (1 - amplitude_percent / 100)
+        return cls([(0.0, base), (period / 2, low), (period, base)])
+
+    @classmethod
+    def random_walk(cls, base: float, volatility_percent: float, step: float, steps: int, seed: int = 0) -> 'PricePath':
+        """Детерминированное случайное блуждание: один шаг в step секунд."""
+        rng = random.Random(seed)
+        price = base
+        points = [(0.0, base)]
+        for index in range(1, steps + 1):
+            price *= 1 + rng.gauss(0, volatility_percent / 100)
+            points.append((index * step, price))
+        return cls(points)
+
+    def price_at(self, elapsed: float) -> float:
+        duration = self._times[-1]
+        if self.loop and duration > 0:
+            elapsed %= duration
+        index = bisect.bisect_right(self._times, elapsed)
+        if index == 0:
+            return self.points[0][1]
+        if index >= len(self.points):
+            return self.points[-1][1]
+        (t0, p0), (t1, p1) = self.points[index - 1], self.points[index]
+        return p0 + (p1 - p0) * (elapsed - t0) / (t1 - t0)
+
+
+class FakeMarket:
+    """
+    Общее для всех клиентов состояние имитируемой биржи: рынки, цена и счетчики вызовов.
+
+    Цена задается числом (атрибут price) или сценарием PricePath, который
+    отсчитывается от создания рынка.
+    """
+
+    def __init__(self, price: float = 0.1, path: PricePath = None, symbols=('KAS/USDT',)):
+        self.path = path
+        self._price = price
+        self.started = time.monotonic()
+        self.markets = {symbol: dict(DEFAULT_MARKET, symbol=symbol) for symbol in symbols}
+        self.calls = Counter()  # метод -> число вызовов всех клиентов
+        self.errors = Counter()  # метод -> число внедренных ошибок
+        self._lock = threading.Lock()
+
+    @property
+    def price(self) -> float:
+        if self.path is not None:
+            return self.path.price_at(time.monotonic() - self.started)
+        return self._price
+
+    @price.setter
+    def price(self, value: float):
+        self.path = None
+        self._price = value
+
+    def count(self, method: str, error: bool = False):
+        with self._lock:
+            self.calls[method] += 1
+            if error:
+                self.errors[method] += 1
+
+
+class FakeExchange:
+    """
+    Локальная имитация синхронного клиента ccxt.mexc для бенчмарков.
+
+    Каждый метод блокирует вызывающий поток на latency секунд (плюс случайный
+    разброс до jitter), как это делает настоящий REST-запрос, и возвращает
+    структуры в формате ccxt. С вероятностью error_rate (или своей для метода
+    в method_error_rates) вызов завершается ccxt.NetworkError. Счет клиента
+    ведется в USDT и базовых валютах; лимитные ордера исполняются, когда цена
+    рынка их достигает, - это проверяется при каждом запросе клиента.
+    Случайность задается seed, поэтому при одном сценарии прогоны повторяемы.
+    """
+
+    def __init__(self, latency: float = 0.2, price: float = 0.1, balance: float = 1000.0, market: FakeMarket = None,
+                 jitter: float = 0.0, error_rate: float = 0.0, method_error_rates: dict = None, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.method_error_rates = method_error_rates or {}
+        self.market = market or FakeMarket(price)
+        self.markets = self.market.markets  # Атрибут, как у ccxt: его заполняет и кэш рынков бота
+        self.balances = {'USDT': balance}
+        self.open_orders = {}
+        self.closed_orders = {}
+        self.calls = 0
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def price(self) -> float:
+        return self.market.price
+
+    @price.setter
+    def price(self, value: float):
+        self.market.price = value
+
+    def _request(self, method: str):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            rate = self.method_error_rates.get(method, self.error_rate)
+            failed = rate > 0 and self._random.random() < rate
+        self.market.count(method, failed)
+        time.sleep(delay)
+        if failed:
+            raise ccxt.NetworkError(f"mexc {method}: имитация сетевой ошибки")
+        self._match()
+
+    def _match(self):
+        price = self.market.price
+        with self._lock:
+            for order_id, order in list(self.open_orders.items()):
+                if order['side'] == 'sell' and price >= order['price'] or order['side'] == 'buy' and price <= order['price']:
+                    self._fill(order)
+                    del self.open_orders[order_id]
+
+    def _fill(self, order: dict):
+        base, quote = order['symbol'].split('/')
+        if order['side'] == 'sell':
+            self.balances[quote] = self.balances.get(quote, 0.0) + order['amount'] * order['price']
+        else:
+            self.balances[base] = self.balances.get(base, 0.0) + order['amount']
+        order.update(status='closed', filled=order['amount'], remaining=0.0, average=order['price'])
+        self.closed_orders[order['id']] = order
+
+    def _order(self, symbol: str, side: str, order_type: str, amount: float, price: float) -> dict:
+        return {'id': str(next(self._ids)), 'symbol': symbol, 'side': side, 'type': order_type,
+                'amount': amount, 'price': price, 'status': 'open', 'filled': 0.0, 'remaining': amount,
+                'timestamp': int(time.time() * 1000)}
+
+    def load_markets(self, reload=False, params={}):
+        self._request('load_markets')
+        return self.markets
+
+    def fetch_balance(self, params={}):
+        self._request('fetch_balance')
+        with self._lock:
+            used = Counter()
+            for order in self.open_orders.values():
+                base, quote = order['symbol'].split('/')
+                if order['side'] == 'sell':
+                    used[base] += order['amount']
+                else:
+                    used[quote] += order['amount'] * order['price']
+            # В balances хранится свободный остаток: средства открытых ордеров уже списаны
+            return {
+                currency: {'free': free, 'used': used[currency], 'total': free + used[currency]}
+                for currency, free in self.balances.items()
+            }
+
+    def fetch_ticker(self, symbol, params={}):
+        self._request('fetch_ticker')
+        price = self.market.price
+        return {'symbol': symbol, 'last': price, 'bid': price, 'ask': price, 'timestamp': int(time.time() * 1000)}
+
+    def create_market_buy_order(self, symbol, amount, params={}):
+        self._request('create_market_buy_order')
+        price = self.market.price
+        if amount is None:
+            amount = params['quoteOrderQty'] / price
+        base, quote = symbol.split('/')
+        with self._lock:
+            cost = amount * price
+            if self.balances.get(quote, 0.0) < cost:
+                raise ccxt.InsufficientFunds(f"mexc: недостаточно {quote} для покупки на {cost}")
+            self.balances[quote] -= cost
+            order = self._order(symbol, 'buy', 'market', amount, price)
+            order['price'] = None
+            order.update(status='closed', filled=amount, remaining=0.0, average=price, cost=cost)
+            self.balances[base] = self.balances.get(base, 0.0) + amount
+            self.closed_orders[order['id']] = order
+        return order
+
+    def create_limit_sell_order(self, symbol, amount, price, params={}):
+        self._request('create_limit_sell_order')
+        order = self._order(symbol, 'sell', 'limit', amount, price)
+        base, _ = symbol.split('/')
+        with self._lock:
+            self.balances[base] = self.balances.get(base, 0.0) - amount
+            self.open_orders[order['id']] = order
+        return order
+
+    def create_limit_buy_order(self, symbol, amount, price, params={}):
+        self._request('create_limit_buy_order')
+        order = self._order(symbol, 'buy', 'limit', amount, price)
+        _, quote = symbol.split('/')
+        with self._lock:
+            self.balances[quote] = self.balances.get(quote, 0.0) - amount * price
+            self.open_orders[order['id']] = order
+        return order
+
+    def cancel_order(self, id, symbol=None, params={}):
+        self._request('cancel_order')
+        with self._lock:
+            order = self.open_orders.pop(id, None)
+            if order is None:
+                raise ccxt.OrderNotFound(f"mexc: ордер {id} не найден")
+            base, quote = order['symbol'].split('/')
+            if order['side'] == 'sell':
+                self.balances[base] += order['amount']
+            else:
+                self.balances[quote] += order['amount'] * order['price']
+            order['status'] = 'canceled'
+            self.closed_orders[id] = order
+        return order
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        self._request('fetch_open_orders')
+        with self._lock:
+            return [dict(o) for o in self.open_orders.values() if symbol is None or o['symbol'] == symbol]
+
+    def fetch_order(self, id, symbol=None, params={}):
+        self._request('fetch_order')
+        with self._lock:
+            order = self.open_orders.get(id) or self.closed_orders.get(id)
+        if order is None:
+            raise ccxt.OrderNotFound(f"mexc: ордер {id} не найден")
+        return dict(order)
+
+    def fill_orders(self):
+        """Исполняет все открытые ордера (вызывается сценарием бенчмарка)."""
+        with self._lock:
+            for order in list(self.open_orders.values()):
+                self._fill(order)
+            self.open_orders.clear()
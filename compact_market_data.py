@@ -0,0 +1,16 @@
+# compact_market_data.py
+# Уплотняет локальное хранилище рыночных данных (market_data/): сортирует и выравнивает столбцы,
+# удаляет повторы и тики старше MARKET_TICK_RETENTION_DAYS. Бот делает это сам раз в сутки;
+# скрипт нужен для хранилища, скопированного с сервера, или при остановленном боте.
+
+from app.market_store import market_store
+from config.logging_config import logger
+
+logger.info(f"Начинаем уплотнение рыночных данных в {market_store.directory}.")
+
+report = market_store.compact()
+
+for (symbol, kind), (before, after) in sorted(report.items()):
+    logger.info(f"{symbol} {kind}: строк было {before}, стало {after}")
+
+logger.info(f"Уплотнение рыночных данных завершено. Таблиц: {len(report)}")
@@ -3,4 +3,89 @@ API_KEY = ""
 API_SECRET = ""
 TOKEN = '7669688877:AAGC-YFOBrquIcarniLczUBaZFC0XaODxT4'
 DATABASE_URL = "sqlite:///trading_bot.db"
-ADMIN_ID = 913981672
\ No newline at end of file
+ADMIN_ID = 913981672
+
+# Максимальное число потоков для блокирующих вызовов ccxt
+EXCHANGE_MAX_WORKERS = 32
+
+# Время жизни неиспользуемого клиента биржи в пуле, сек
+EXCHANGE_CLIENT_IDLE_TTL = 1800
+
+# Период обновления кэша метаданных рынков, сек
+MARKETS_CACHE_TTL = 3600
+
+# Интервал опроса котировок общим потоком рыночных данных, сек
+MARKET_DATA_POLL_INTERVAL = 2
+
+# Интервалы опроса статуса ордеров (адаптивный опрос), сек
+ORDER_POLL_MIN_INTERVAL = 1
+ORDER_POLL_MAX_INTERVAL = 30
+
+# Пакетная запись журнала сделок: размер пакета и максимальная задержка записи, сек
+TRADE_JOURNAL_BATCH_SIZE = 100
+TRADE_JOURNAL_FLUSH_INTERVAL = 1
+# Повтор записи журнала сделок при ошибке базы: первая задержка и ее предел, сек
+TRADE_JOURNAL_RETRY_DELAY = 1
+TRADE_JOURNAL_RETRY_MAX_DELAY = 30
+# Число попыток записи пакета при остановке бота, после которых пакет отбрасывается
+TRADE_JOURNAL_STOP_RETRIES = 5
+
+# База данных: потоки для запросов из корутин, размер пула соединений и ожидание блокировки SQLite, сек
+DB_MAX_WORKERS = 4
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT = 30
+
+# Кэш контекстов пользователей: максимальный размер и время жизни без обращений, сек
+USER_CONTEXT_CACHE_SIZE = 10000
+USER_CONTEXT_IDLE_TTL = 3600
+
+# Отложенная запись параметров и состояния пользователей: задержка записи, сек
+USER_STATE_FLUSH_INTERVAL = 2
+
+# Восстановление сессий автоторговли после перезапуска: сколько сессий поднимать одновременно
+SESSION_RESUME_CONCURRENCY = 20
+
+# Выставление take-profit после покупки: число попыток и первая задержка между ними, сек
+TAKE_PROFIT_RETRIES = 3
+TAKE_PROFIT_RETRY_DELAY = 1
+# Период повторных попыток для уровней, оставшихся без take-profit, сек
+TAKE_PROFIT_RETRY_INTERVAL = 30
+
+# Максимальное время ожидания завершения сессий автоторговли при остановке бота, сек
+SHUTDOWN_DEADLINE = 20
+
+# Лимит приватных запросов одного API-ключа (общий для всех пар пользователя): запросов в секунду и запас
+USER_RATE_LIMIT = 10
+USER_RATE_BURST = 20
+
+# Автоторговля: пара по умолчанию, котируемая валюта и максимум одновременных пар на пользователя
+DEFAULT_SYMBOL = "KAS/USDT"
+DEFAULT_QUOTE = "USDT"
+MAX_SYMBOLS_PER_USER = 10
+
+# Лимит запросов с IP-адреса бота (все ключи и публичные данные вместе): запросов в секунду и запас
+IP_RATE_LIMIT = 40
+IP_RATE_BURST = 40
+
+# Время хранения результатов чтений с биржи по методам, сек (0 - только объединение одновременных запросов)
+READ_CACHE_TTL = {
+    'fetch_ticker': 1,
+    'fetch_balance': 2,
+    'load_markets': 0,
+    'fetch_open_orders': 0,
+    'fetch_order': 0,
+}
+
+# Локальное хранилище рыночных данных: каталог, пары для постоянной записи и интервал сброса на диск, сек
+MARKET_STORE_DIR = "market_data"
+MARKET_RECORDER_SYMBOLS = [DEFAULT_SYMBOL]
+MARKET_RECORDER_FLUSH_INTERVAL = 10
+
+# Уплотнение хранилища рыночных данных: период, сек, и срок хранения тиков, дней (свечи хранятся бессрочно)
+MARKET_STORE_COMPACT_INTERVAL = 86400
+MARKET_TICK_RETENTION_DAYS = 90
+
+# Метрики: адрес и порт HTTP-эндпоинта /metrics (0 - не запускать) и период замера лага цикла событий, сек
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+LOOP_LAG_INTERVAL = 0.5
@@ -0,0 +1,12 @@
+# rebuild_daily_pnl.py
+# Пересчитывает таблицу daily_pnl по всей истории сделок (trade_history).
+# Нужен один раз для существующих данных; дальше сводка обновляется автоматически.
+
+from app.trade_journal import rebuild_daily_pnl
+from config.logging_config import logger
+
+logger.info("Начинаем пересчет дневной сводки прибыли.")
+
+rows = rebuild_daily_pnl()
+
+logger.info(f"Пересчет дневной сводки завершен. Строк в daily_pnl: {rows}")
@@ -0,0 +1,71 @@
+# run_backtest.py
+# Бэктест стратегии автоторговли по истории свечей OHLCV.
+# Пример: python run_backtest.py kas_usdt_1m.csv --profit 0.5 --fall 1 --delay 30 --order-size 40 --capital 1000
+# С ключом --download история сначала загружается с биржи (публичный fetch_ohlcv) и сохраняется в CSV.
+# С ключом --store вместо CSV указывается пара, и свечи берутся из локального хранилища market_data/.
+
+import argparse
+import time
+from app.backtesting import BacktestParams, load_ohlcv_csv, run_backtest, save_ohlcv_csv
+
+
+def download_ohlcv(path: str, symbol: str, timeframe: str, days: int):
+    import ccxt
+
+    exchange = ccxt.mexc({'enableRateLimit': True})
+    since = exchange.milliseconds() - days * 24 * 60 * 60 * 1000
+    rows = []
+    while True:
+        batch = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=1000)
+        if not batch:
+            break
+        rows.extend(batch)
+        since = batch[-1][0] + 1
+        if len(batch) < 1000:
+            break
+    save_ohlcv_csv(path, rows)
+    print(f"Загружено свечей: {len(rows)} -> {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэктест стратегии автоторговли по свечам OHLCV")
+    parser.add_argument('csv', help="CSV со столбцами timestamp,open,high,low,close,volume (или пара с --store)")
+    parser.add_argument('--profit', type=float, default=0.3, help="Процент прибыли уровня")
+    parser.add_argument('--fall', type=float, default=1.0, help="Процент падения для докупки")
+    parser.add_argument('--delay', type=float, default=30, help="Задержка между покупками, сек")
+    parser.add_argument('--order-size', type=float, default=40, help="Размер ордера, USDT")
+    parser.add_argument('--capital', type=float, default=1000, help="Начальный баланс, USDT")
+    parser.add_argument('--fee', type=float, default=0.0, help="Комиссия с оборота (0.001 = 0.1%%)")
+    parser.add_argument('--continuous', action='store_true', help="Непрерывный режим: новый цикл после завершения")
+    parser.add_argument('--store', action='store_true', help="Брать минутные свечи пары из локального хранилища")
+    parser.add_argument('--download', action='store_true', help="Сначала загрузить историю с биржи в CSV")
+    parser.add_argument('--symbol', default='KAS/USDT', help="Торговая пара для загрузки")
+    parser.add_argument('--timeframe', default='1m', help="Таймфрейм для загрузки")
+    parser.add_argument('--days', type=int, default=365, help="Глубина загрузки, дней")
+    args = parser.parse_args()
+
+    if args.download:
+        download_ohlcv(args.csv, args.symbol, args.timeframe, args.days)
+
+    started = time.perf_counter()
+    if args.store:
+        from app.market_store import market_store
+        candles = market_store.candles(args.csv)
+    else:
+        candles = load_ohlcv_csv(args.csv)
+    print(f"Свечей загружено: {len(candles)} за {time.perf_counter() - started:.2f} с")
+
+    params = BacktestParams(
+        profit_percentage=args.profit,
+        fall_percentage=args.fall,
+        delay_seconds=args.delay,
+        order_size=args.order_size,
+        capital=args.capital,
+        continuous_mode=args.continuous,
+        fee_rate=args.fee,
+    )
+    print(run_backtest(candles, params).summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# run_sweep.py
+# Перебор параметров стратегии (/set_params) бэктестом на всех ядрах.
+# Значения: одно число, список через запятую или диапазон start:stop:step.
+# Пример: python run_sweep.py kas_usdt_1m.csv --profit 0.2:2:0.1 --fall 0.5:3:0.25 --delay 0,30,300 --order-size 20,40
+
+import argparse
+from app.backtesting import load_ohlcv_csv
+from app.param_sweep import parse_range, sweep
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор параметров стратегии автоторговли по истории свечей")
+    parser.add_argument('csv', help="CSV со столбцами timestamp,open,high,low,close,volume")
+    parser.add_argument('--profit', default='0.2:1:0.1', help="Проценты прибыли уровня")
+    parser.add_argument('--fall', default='0.5:2:0.5', help="Проценты падения для докупки")
+    parser.add_argument('--delay', default='30', help="Задержки между покупками, сек")
+    parser.add_argument('--order-size', default='40', help="Размеры ордера, USDT")
+    parser.add_argument('--capital', type=float, default=1000, help="Начальный баланс, USDT")
+    parser.add_argument('--fee', type=float, default=0.0, help="Комиссия с оборота (0.001 = 0.1%%)")
+    parser.add_argument('--continuous', action='store_true', help="Непрерывный режим: новый цикл после завершения")
+    parser.add_argument('--workers', type=int, default=None, help="Число процессов (по умолчанию - все ядра)")
+    parser.add_argument('--output', default='sweep_results.csv', help="Файл результатов")
+    parser.add_argument('--top', type=int, default=10, help="Сколько лучших наборов показать")
+    args = parser.parse_args()
+
+    candles = load_ohlcv_csv(args.csv)
+    grids = [parse_range(args.profit), parse_range(args.fall), parse_range(args.delay), parse_range(args.order_size)]
+    total = len(grids[0]) * len(grids[1]) * len(grids[2]) * len(grids[3])
+    print(f"Свечей: {len(candles)}, наборов параметров: {total}")
+
+    def progress(done, total, elapsed):
+        if done == total or done % 100 == 0:
+            print(f"Готово {done}/{total} за {elapsed:.1f} с")
+
+    best = sweep(candles, args.output, *grids, capital=args.capital, continuous_mode=args.continuous,
+                 fee_rate=args.fee, workers=args.workers, top=args.top, progress=progress)
+
+    print(f"Результаты записаны в {args.output}. Лучшие наборы по итоговой прибыли:")
+    for row in best:
+        print(
+            f"прибыль {row['profit_percentage']}%, падение {row['fall_percentage']}%, "
+            f"задержка {row['delay_seconds']} с, ордер {row['order_size']} USDT -> "
+            f"{row['total_profit']:+.4f} USDT, сделок {row['sells']}, "
+            f"просадка {row['max_drawdown_percent']:.2f}%"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# tests/test_grid_engine.py
+
+import json
+import pytest
+from app.grid_engine import GridEngine
+
+
+def make_engine(profit=0.5, fall=1.0, delay=30):
+    return GridEngine(profit, fall, delay)
+
+
+def test_first_level_is_bought_at_any_price():
+    engine = make_engine()
+    assert engine.should_buy(0.1, now=0)
+    assert engine.next_buy_price() is None
+
+
+def test_next_level_triggers_after_fall_percentage():
+    engine = make_engine(fall=1.0, delay=0)
+    engine.open_level(100.0, 1.0, now=0)
+    assert engine.next_buy_price() == pytest.approx(99.0)
+    assert not engine.should_buy(99.01, now=1)
+    assert engine.should_buy(99.0, now=1)
+    assert engine.should_buy(98.0, now=1)
+
+
+def test_trigger_follows_lowest_open_level():
+    engine = make_engine(fall=1.0, delay=0)
+    engine.open_level(100.0, 1.0, now=0)
+    lowest = engine.open_level(99.0, 1.0, now=1)
+    engine.open_level(101.0, 1.0, now=2)
+    assert engine.lowest_level is lowest
+    assert engine.next_buy_price() == pytest.approx(98.01)
+
+    engine.close_level(lowest)
+    assert engine.next_buy_price() == pytest.approx(99.0)
+
+
+def test_delay_seconds_gates_the_next_buy():
+    engine = make_engine(fall=1.0, delay=30)
+    engine.open_level(100.0, 1.0, now=100)
+    assert not engine.should_buy(90.0, now=129.9)
+    assert engine.should_buy(90.0, now=130)
+
+
+def test_defer_postpones_the_next_buy():
+    engine = make_engine(delay=30)
+    engine.defer(now=10)
+    assert not engine.should_buy(0.1, now=39)
+    assert engine.should_buy(0.1, now=40)
+
+
+def test_take_profit_selection_includes_equal_prices():
+    engine = make_engine(profit=1.0, delay=0)
+    first = engine.open_level(100.0, 1.0, now=0, sell_price=101.0)
+    second = engine.open_level(99.0, 1.0, now=1, sell_price=101.0)
+    third = engine.open_level(98.0, 1.0, now=2, sell_price=99.0)
+
+    assert engine.levels_to_take_profit(98.99) == []
+    assert engine.levels_to_take_profit(99.0) == [third]
+    selected = engine.levels_to_take_profit(101.0)
+    assert len(selected) == 3
+    assert set(map(id, selected)) == {id(first), id(second), id(third)}
+    assert engine.lowest_sell_price == 99.0
+
+
+def test_close_level_removes_the_right_level_among_equal_prices():
+    engine = make_engine(delay=0)
+    first = engine.open_level(100.0, 1.0, now=0, sell_price=101.0)
+    second = engine.open_level(100.0, 2.0, now=1, sell_price=101.0)
+
+    engine.close_level(second)
+    assert engine.levels == [first]
+    assert engine.levels_to_take_profit(101.0) == [first]
+    with pytest.raises(ValueError):
+        engine.close_level(second)
+
+
+def test_set_sell_price_reorders_take_profits():
+    engine = make_engine(delay=0)
+    first = engine.open_level(100.0, 1.0, now=0, sell_price=101.0)
+    second = engine.open_level(99.0, 1.0, now=1, sell_price=100.0)
+
+    engine.set_sell_price(first, 99.5)
+    assert engine.levels_to_take_profit(99.5) == [first]
+    assert engine.levels_to_take_profit(100.0) == [first, second]
+
+
+def test_levels_without_take_profit():
+    engine = make_engine(delay=0)
+    placed = engine.open_level(100.0, 1.0, now=0)
+    placed.sell_order_id = '1'
+    missing = engine.open_level(99.0, 1.0, now=1)
+    assert engine.levels_without_take_profit() == [missing]
+
+
+def test_state_round_trip():
+    engine = make_engine(profit=0.5, fall=1.0, delay=30)
+    first = engine.open_level(100.0, 1.5, now=0)
+    first.buy_order_id, first.sell_order_id = 'b1', 's1'
+    second = engine.open_level(99.0, 2.0, now=40, sell_price=99.5)
+    second.buy_order_id = 'b2'
+
+    state = json.loads(json.dumps(engine.to_state()))
+    restored = GridEngine.from_state(state, now=1000)
+
+    assert restored.to_state() == engine.to_state()
+    assert [level.number for level in restored.levels] == [2, 1]
+    assert restored.lowest_sell_price == 99.5
+    assert restored.levels_without_take_profit()[0].number == 2
+    assert restored.last_fill_price == 99.0
+    # Задержка отсчитывается от момента восстановления, номера уровней продолжаются
+    assert not restored.should_buy(50.0, now=1029)
+    assert restored.should_buy(50.0, now=1030)
+    assert restored.open_level(50.0, 1.0, now=1030).number == 3
+
+
+def test_empty_state_round_trip():
+    restored = GridEngine.from_state(make_engine().to_state(), now=5)
+    assert len(restored) == 0
+    assert restored.last_buy_time is None
+    assert restored.should_buy(1.0, now=5)
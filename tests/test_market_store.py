@@ -0,0 +1,128 @@
+# tests/test_market_store.py
+
+import asyncio
+import os
+import numpy as np
+from app.market_store import CANDLE_MS, CANDLES_1M, TICKS, MarketRecorder, MarketStore
+
+SYMBOL = 'KAS/USDT'
+BASE = 1_700_000_040_000  # Начало минуты
+
+
+class FakeHub:
+    """Минимальный market_data_hub: рассылает тикеры слушателям."""
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def subscribe(self, symbol):
+        return asyncio.Queue()
+
+    def unsubscribe(self, symbol, queue):
+        pass
+
+    def publish(self, symbol, timestamp, price):
+        for listener in self.listeners:
+            listener(symbol, {'last': price, 'bid': price, 'ask': price, 'timestamp': timestamp})
+
+
+def price_at(timestamp):
+    return 1.0 + (timestamp - BASE) / 1e7
+
+
+def record(store, timestamps, symbols=(SYMBOL,)):
+    """Одна жизнь процесса: запуск записи, поток тиков и остановка."""
+
+    async def run():
+        hub = FakeHub()
+        recorder = MarketRecorder(store, symbols, flush_interval=3600)
+        recorder.start(hub)
+        for timestamp in timestamps:
+            hub.publish(SYMBOL, timestamp, price_at(timestamp))
+        await recorder.stop()
+
+    asyncio.run(run())
+
+
+def test_compact_sorts_deduplicates_and_drops_old_rows(tmp_path):
+    table = MarketStore(str(tmp_path)).table(SYMBOL, TICKS)
+    table.append({'timestamp': [30, 10, 20], 'price': [3.0, 1.0, 2.0], 'bid': [0.0] * 3, 'ask': [0.0] * 3})
+    table.append({'timestamp': [20, 40], 'price': [2.5, 4.0], 'bid': [0.0] * 2, 'ask': [0.0] * 2})
+
+    assert table.compact(min_timestamp=15) == (5, 3)
+    rows = table.read()
+    assert rows['timestamp'].tolist() == [20, 30, 40]
+    # Из повторов времени остается последняя записанная строка
+    assert rows['price'].tolist() == [2.5, 3.0, 4.0]
+
+
+def test_compact_truncates_a_torn_append(tmp_path):
+    table = MarketStore(str(tmp_path)).table(SYMBOL, CANDLES_1M)
+    table.append({'timestamp': [0, CANDLE_MS], 'open': [1.0, 2.0], 'high': [1.5, 2.5], 'low': [0.5, 1.5],
+                  'close': [1.2, 2.2]})
+    # Запись оборвалась после первого столбца новой строки
+    with open(os.path.join(table.directory, 'timestamp.bin'), 'ab') as f:
+        f.write(np.int64(2 * CANDLE_MS).tobytes())
+
+    assert len(table) == 2
+    assert table.last_timestamp() == CANDLE_MS
+    assert table.compact() == (2, 2)
+    for name, dtype in table.columns:
+        assert os.path.getsize(os.path.join(table.directory, f'{name}.bin')) == 2 * np.dtype(dtype).itemsize
+    assert table.read()['close'].tolist() == [1.2, 2.2]
+
+
+def test_range_uses_half_open_interval(tmp_path):
+    store = MarketStore(str(tmp_path))
+    timestamps = [BASE + index * 1000 for index in range(10)]
+    store.table(SYMBOL, TICKS).append({'timestamp': timestamps, 'price': [1.0] * 10, 'bid': [1.0] * 10,
+                                       'ask': [1.0] * 10})
+    ticks = store.ticks(SYMBOL, BASE + 2000, BASE + 5000)
+    assert ticks['timestamp'].tolist() == timestamps[2:5]
+
+
+def test_recorder_builds_candles_from_ticks(tmp_path):
+    store = MarketStore(str(tmp_path))
+    record(store, [BASE + index * 10_000 for index in range(13)])  # Минуты 0 и 1 и первый тик минуты 2
+
+    assert len(store.ticks(SYMBOL)['timestamp']) == 13
+    candles = store.candles(SYMBOL)
+    assert candles.timestamp.tolist() == [BASE, BASE + CANDLE_MS]
+    assert candles.open[0] == price_at(BASE)
+    assert candles.close[0] == price_at(BASE + 50_000)
+
+
+def test_recorder_resumes_after_restart(tmp_path):
+    store = MarketStore(str(tmp_path))
+    # Первый запуск: минуты 0-2 и половина минуты 3, которая на диск не попадает
+    record(store, [BASE + index * 10_000 for index in range(21)])
+    assert store.candles(SYMBOL).timestamp.tolist() == [BASE, BASE + CANDLE_MS, BASE + 2 * CANDLE_MS]
+
+    # Второй запуск: биржа повторяет уже записанные тики, затем минута 3 продолжается
+    record(store, [BASE + index * 10_000 for index in range(15, 40)])
+
+    ticks = store.ticks(SYMBOL)['timestamp']
+    assert len(ticks) == 40
+    assert np.all(np.diff(ticks) > 0)
+    candles = store.candles(SYMBOL)
+    assert candles.timestamp.tolist() == [BASE + minute * CANDLE_MS for minute in range(6)]
+    # Минута 3 собрана целиком: открытие из тиков первого запуска
+    assert candles.open[3] == price_at(BASE + 3 * CANDLE_MS)
+    assert candles.high[3] == price_at(BASE + 3 * CANDLE_MS + 50_000)
+
+
+def test_recorder_seeds_symbols_first_seen_after_start(tmp_path):
+    store = MarketStore(str(tmp_path))
+    record(store, [BASE + index * 10_000 for index in range(7)], symbols=())
+    # Пара не из списка постоянной записи: порог берется с диска при первом тике
+    record(store, [BASE + index * 10_000 for index in range(3, 13)], symbols=())
+
+    ticks = store.ticks(SYMBOL)['timestamp']
+    assert ticks.tolist() == [BASE + index * 10_000 for index in range(13)]
+    assert store.candles(SYMBOL).timestamp.tolist() == [BASE, BASE + CANDLE_MS]
@@ -0,0 +1,107 @@
+# tests/test_rate_budget.py
+
+import asyncio
+from app.rate_budget import PRIORITY_ORDER, PRIORITY_READ, PRIORITY_TRACK, RateBudget
+
+# Токен пополняется раз в 10 мс: очереди разбираются быстро, но порядок виден
+RATE = 100
+
+
+def run_and_get(coroutine_function):
+    return asyncio.run(coroutine_function())
+
+
+def serve_order(budget: RateBudget, requests: list) -> list:
+    """
+    Ставит запросы (метка, ключ, приоритет) в очередь при пустом бюджете
+    и возвращает метки в порядке получения разрешения.
+    """
+
+    async def run():
+        budget._tokens = 0
+        served = []
+
+        async def request(label, key, priority):
+            await budget.acquire(key, priority)
+            served.append(label)
+
+        tasks = []
+        for label, key, priority in requests:
+            tasks.append(asyncio.create_task(request(label, key, priority)))
+            await asyncio.sleep(0)  # Запросы встают в очередь в порядке списка
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+        return served
+
+    return asyncio.run(run())
+
+
+def test_requests_pass_immediately_within_burst():
+    async def run():
+        budget = RateBudget(rate=1, burst=3)
+        for _ in range(3):
+            await asyncio.wait_for(budget.acquire('KAS/USDT'), timeout=0.1)
+        return budget.waited
+
+    assert run_and_get(run) == 0
+
+
+def test_track_waiter_is_served_before_read_waiter():
+    budget = RateBudget(rate=RATE, burst=1)
+    served = serve_order(budget, [
+        ('read-1', 'KAS/USDT', PRIORITY_READ),
+        ('read-2', 'KAS/USDT', PRIORITY_READ),
+        ('track', 'KAS/USDT', PRIORITY_TRACK),
+        ('order', 'BTC/USDT', PRIORITY_ORDER),
+    ])
+    assert served == ['order', 'track', 'read-1', 'read-2']
+    assert budget.waited == 4
+
+
+def test_busy_key_does_not_starve_other_keys():
+    budget = RateBudget(rate=RATE, burst=1)
+    requests = [(f'busy-{index}', 'KAS/USDT', PRIORITY_READ) for index in range(6)]
+    requests += [('quiet-1', 'BTC/USDT', PRIORITY_READ), ('other', 'ETH/USDT', PRIORITY_READ),
+                 ('quiet-2', 'BTC/USDT', PRIORITY_READ)]
+    served = serve_order(budget, requests)
+    # Ключи обслуживаются по кругу, а не в порядке прихода запросов
+    assert served[:6] == ['busy-0', 'quiet-1', 'other', 'busy-1', 'quiet-2', 'busy-2']
+    assert served[6:] == ['busy-3', 'busy-4', 'busy-5']
+
+
+def test_higher_priority_does_not_wait_behind_lower_priority_queue():
+    async def run():
+        budget = RateBudget(rate=RATE, burst=1)
+        budget._tokens = 0
+        read = asyncio.create_task(budget.acquire('KAS/USDT', PRIORITY_READ))
+        await asyncio.sleep(0)
+        budget._tokens = 1  # Токен появился раньше, чем его раздал диспетчер
+        await budget.acquire('KAS/USDT', PRIORITY_ORDER)
+        waited = budget.waited
+        await asyncio.wait_for(read, timeout=1)
+        return waited, budget.pending()
+
+    waited, pending = run_and_get(run)
+    # Ордер прошел сразу, в очереди ждало только чтение
+    assert waited == 1
+    assert pending == {PRIORITY_ORDER: 0, PRIORITY_TRACK: 0, PRIORITY_READ: 0}
+
+
+def test_cancelled_waiter_does_not_consume_a_token():
+    async def run():
+        budget = RateBudget(rate=RATE, burst=1)
+        budget._tokens = 0
+        cancelled = asyncio.create_task(budget.acquire('KAS/USDT', PRIORITY_READ))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(budget.acquire('BTC/USDT', PRIORITY_READ))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        started = asyncio.get_running_loop().time()
+        await asyncio.wait_for(waiting, timeout=1)
+        elapsed = asyncio.get_running_loop().time() - started
+        await asyncio.sleep(0)
+        return elapsed, budget._dispatcher.done()
+
+    elapsed, dispatcher_done = run_and_get(run)
+    # Первый пополненный токен достается оставшемуся запросу, а не отмененному
+    assert elapsed < 1.8 / RATE
+    assert dispatcher_done